@@ -7,10 +7,16 @@ from flask import Blueprint, jsonify, request, current_app
 import asyncio
 import logging
 import json
+import hashlib
+import bisect
+from matter_schema import DEVICE_INFO, DEVICE_STATUS, registry
+from config import MATTER_COMMAND_MAX_TIMEOUT
 
 # 配置日志
 logger = logging.getLogger(__name__)
 
+_MISSING = object()
+
 api = Blueprint('api', __name__)
 
 @api.before_request
@@ -57,20 +63,60 @@ def get_status():
         }
     })
 
+@api.route('/metrics', methods=['GET'])
+def get_metrics():
+    """获取各Matter Server客户端的消息处理指标和前端WebSocket推送指标"""
+    matter_client = current_app.matter_client
+    
+    return jsonify({
+        "status": "success",
+        "data": {
+            "matter_servers": matter_client.get_metrics(),
+            "websocket": current_app.ws_service.get_metrics() if current_app.ws_service else None,
+            "websocket_bus": current_app.ws_bus.get_metrics() if current_app.ws_bus else None
+        }
+    })
+
+@api.route('/health', methods=['GET'])
+def get_health():
+    """获取各Matter Server连接的健康状态和往返时延历史"""
+    matter_client = current_app.matter_client
+    
+    return jsonify({
+        "status": "success",
+        "data": {
+            "matter_servers": matter_client.get_health()
+        }
+    })
+
 @api.route('/nodes', methods=['GET'])
 def get_all_nodes():
     """获取所有节点信息"""
     matter_client = current_app.matter_client
     nodes = matter_client.get_all_nodes()
     
+    # 可选：按操作状态筛选，例如 ?operational_state=65 查询所有充电中的节点
+    operational_state = request.args.get('operational_state', type=int)
+    if operational_state is not None:
+        node_ids = nodes.find(registry.path('operational_state'), operational_state)
+        selected = []
+        for node_id in node_ids:
+            node = nodes.get(node_id)
+            # 查找之后节点可能已被移除
+            if node is not None:
+                selected.append((node_id, node))
+    else:
+        selected = nodes.items()
+    
     # 提取节点基本信息
     nodes_info = []
-    for node_id, node_data in nodes.items():
+    for node_id, node_data in selected:
         nodes_info.append({
-            "node_id": node_data.get("node_id"),
-            "available": node_data.get("available", False),
-            "date_commissioned": node_data.get("date_commissioned", ""),
-            "last_interview": node_data.get("last_interview", "")
+            "node_id": node_id,
+            "server": nodes.owner(node_id),
+            "available": node_data.available,
+            "date_commissioned": node_data.date_commissioned,
+            "last_interview": node_data.last_interview
         })
     
     return jsonify({
@@ -80,10 +126,82 @@ def get_all_nodes():
         }
     })
 
+@api.route('/nodes/status', methods=['GET'])
+def get_nodes_status():
+    """批量获取节点的设备信息和设备状态
+    
+    查询参数:
+        available: true/false，按节点是否在线筛选
+        operational_state: 按操作状态筛选，例如65表示充电中
+        fields: 逗号分隔的字段名，只返回device_info和device_status中的这些字段
+        limit: 每页节点数，默认NODE_BATCH_LIMIT，最多NODE_BATCH_MAX_LIMIT
+        cursor: 上一页返回的next_cursor
+    """
+    matter_client = current_app.matter_client
+    nodes = matter_client.get_all_nodes()
+    
+    operational_state = request.args.get('operational_state', type=int)
+    if operational_state is not None:
+        node_ids = nodes.find(registry.path('operational_state'), operational_state)
+    else:
+        node_ids = nodes
+    
+    available = request.args.get('available')
+    if available is not None:
+        available = available.lower() in ('1', 'true', 'yes')
+    
+    fields = request.args.get('fields')
+    if fields:
+        fields = set(field.strip() for field in fields.split(',') if field.strip())
+    
+    limit = request.args.get('limit', current_app.config.get('NODE_BATCH_LIMIT', 100), type=int)
+    limit = max(1, min(limit, current_app.config.get('NODE_BATCH_MAX_LIMIT', 1000)))
+    
+    # 按节点ID排序分页，游标为上一页最后一个节点ID，节点增删不会导致重复或遗漏
+    cursor = request.args.get('cursor')
+    ordered = sorted(str(node_id) for node_id in node_ids)
+    if cursor:
+        ordered = ordered[bisect.bisect_right(ordered, cursor):]
+    
+    nodes_status = []
+    next_cursor = None
+    for node_id in ordered:
+        node_info = nodes.get(node_id)
+        if node_info is None:
+            continue
+        if available is not None and node_info.available != available:
+            continue
+        if len(nodes_status) == limit:
+            next_cursor = nodes_status[-1]["node_id"]
+            break
+        
+        # 使用节点状态接口缓存的解码结果，未变化的节点不重新解码
+        data = cached_node_view(node_id, node_info)[3]
+        device_info, status = data["device_info"], data["device_status"]
+        if fields:
+            device_info = {key: value for key, value in device_info.items() if key in fields}
+            status = {key: value for key, value in status.items() if key in fields}
+        nodes_status.append({
+            "node_id": node_id,
+            "server": nodes.owner(node_id),
+            "device_info": device_info,
+            "device_status": status
+        })
+    
+    return jsonify({
+        "status": "success",
+        "data": {
+            "nodes": nodes_status,
+            "next_cursor": next_cursor
+        }
+    })
+
 @api.route('/node/<node_id>', methods=['GET'])
 def get_node_status(node_id):
     """获取指定节点的设备状态
     
+    响应在节点属性变化前一直复用，并带有强ETag，轮询的客户端可以通过If-None-Match得到304。
+    
     Args:
         node_id: Matter节点ID
     """
@@ -98,152 +216,213 @@ def get_node_status(node_id):
             "message": f"节点 {node_id} 不存在"
         }), 404
     
-    # 从节点属性中提取信息
-    attributes = node_info.get("attributes", {})
-    
-    # 使用正确的属性路径提取信息
-    # VendorName: 0/40/1
-    # ProductName: 0/40/3
-    # HardwareVersionString: 0/40/8
-    # SoftwareVersionString: 0/40/10
-    # SerialNumber: 0/40/15
-    # SpecificationVersion: 0/40/21
-    # OperationalState: 1/97/4
-    # OperationalStateList: 1/97/3
-    manufacturer = extract_attribute(attributes, "0/40/1", "未知厂商")
-    product_name = extract_attribute(attributes, "0/40/3", "未知产品")
-    hardware_version = extract_attribute(attributes, "0/40/8", "未知")
-    software_version = extract_attribute(attributes, "0/40/10", "未知")
-    serial_number = extract_attribute(attributes, "0/40/15", "未知")
-    matter_version = extract_attribute(attributes, "0/40/21", "未知")
-    operational_state = extract_attribute(attributes, "1/97/4", "未知")
-    operational_state_list = extract_attribute(attributes, "1/97/3", [])
-    current_cleaning_mode = extract_attribute(attributes, "1/85/1", "未知")
-    supported_cleaning_modes = extract_attribute(attributes, "1/85/0", "未知")
-    current_run_mode = extract_attribute(attributes, "1/84/1", "未知")
-    supported_run_modes = extract_attribute(attributes, "1/84/0", "未知")
+    # 节点属性未变化时直接使用缓存的响应
+    view = cached_node_view(node_id, node_info)
+    
+    response = current_app.response_class(view[1], mimetype='application/json')
+    response.set_etag(view[2])
+    # 允许缓存，但每次使用前都需要向服务器验证
+    response.headers['Cache-Control'] = 'no-cache'
+    return response.make_conditional(request)
 
-    # 添加设备基本信息
-    device_info = {
-        "product_name": product_name,
-        "manufacturer": manufacturer,
-        "hardware_version": hardware_version,
-        "software_version": software_version,
-        "serial_number": serial_number,
-        "matter_version": matter_version,
-        "ip_address": "未知",
-        "node_id": node_id,
-        "available": node_info.get("available", False),
-        "date_commissioned": node_info.get("date_commissioned", ""),
-        "last_interview": node_info.get("last_interview", "")
-    }
+@api.route('/node/<node_id>/attribute/<path:attribute_path>', methods=['GET'])
+def get_node_attribute(node_id, attribute_path):
+    """获取节点的单个属性，节点存储中没有保存的属性按需从Matter Server读取
+    
+    读取请求提交到Matter客户端的事件循环中执行，本线程等待结果
+    
+    Args:
+        node_id: Matter节点ID
+        attribute_path: 属性路径，例如 "0/29/0"
+    """
+    matter_client = current_app.matter_client
+    cached = lookup_node_attribute(matter_client, node_id, attribute_path)
+    if cached is not None:
+        body, status = cached
+    elif current_app.loop is None:
+        # 读取工作进程没有Matter连接的事件循环
+        body, status = asyncio.run(read_node_attribute(matter_client, node_id, attribute_path))
+    else:
+        body, status = asyncio.run_coroutine_threadsafe(
+            read_node_attribute(matter_client, node_id, attribute_path), current_app.loop).result()
+    return jsonify(body), status
 
-    logger.info("节点 %s 的设备信息: %s", node_id, device_info)
+def lookup_node_attribute(matter_client, node_id, attribute_path):
+    """从节点存储中获取单个属性
+    
+    Args:
+        matter_client: Matter客户端
+        node_id: Matter节点ID
+        attribute_path: 属性路径
+        
+    Returns:
+        tuple: (响应内容, HTTP状态码)，节点存储中没有保存该属性时返回None
+    """
+    node_info = matter_client.get_node_info(node_id)
+    if not node_info:
+        return {
+            "status": "error",
+            "message": f"节点 {node_id} 不存在"
+        }, 404
+    
+    try:
+        value = node_info.get_attribute(attribute_path, _MISSING)
+    except ValueError:
+        return {
+            "status": "error",
+            "message": f"无效的属性路径: {attribute_path}"
+        }, 400
+    if value is _MISSING:
+        return None
+    return {
+        "status": "success",
+        "data": {"node_id": node_id, "path": attribute_path, "value": value, "source": "cache"}
+    }, 200
 
-    # 获取设备状态
-    # 如果节点可用，使用节点特定状态，否则使用默认状态
-    if node_info.get("available", False):
-        # 处理操作状态列表，添加状态名称
-        enhanced_operational_state_list = enhance_operational_state_list(operational_state_list)
+async def read_node_attribute(matter_client, node_id, attribute_path):
+    """获取单个属性，节点存储中没有保存时从Matter Server读取，WSGI路由和原生ASGI路由共用
+    
+    Args:
+        matter_client: Matter客户端
+        node_id: Matter节点ID
+        attribute_path: 属性路径
         
-        status = {
-            "current_run_mode": current_run_mode,
-            "supported_run_modes": supported_run_modes,
-            "current_cleaning_mode": current_cleaning_mode,
-            "supported_cleaning_modes": supported_cleaning_modes,
-            "operational_state": operational_state,
-            "operational_state_list": enhanced_operational_state_list,
-            "battery_level": 0
-        }
-    else:
-        status = {
-            "current_cleaning_mode": "未知",
-            "operational_state": "离线",
-            "operational_state_list": [],
-            "battery_level": 0
-        }
+    Returns:
+        tuple: (响应内容, HTTP状态码)
+    """
+    cached = lookup_node_attribute(matter_client, node_id, attribute_path)
+    if cached is not None:
+        return cached
+    
+    result = await matter_client.send_command(
+        'read_attribute', {"node_id": node_id, "attribute_path": attribute_path})
+    if not result["success"]:
+        return {
+            "status": "error",
+            "message": f"读取属性失败: {result['details'] or '请检查设备连接状态'}",
+            "data": result
+        }, 504 if result["error_code"] == "timeout" else 502
+    
+    # Matter Server返回 {属性路径: 值}
+    value = result["result"]
+    if isinstance(value, dict) and attribute_path in value:
+        value = value[attribute_path]
+    return {
+        "status": "success",
+        "data": {"node_id": node_id, "path": attribute_path, "value": value, "source": "matter_server"}
+    }, 200
 
-    logger.info("节点 %s 的设备状态: %s", node_id, status)
+def cached_node_view(node_id, node_info):
+    """获取节点状态接口的响应，节点属性未变化时直接使用缓存
     
-    return jsonify({
+    Args:
+        node_id: 请求中的节点ID
+        node_info: 节点（MatterNode）
+        
+    Returns:
+        tuple: (节点ID, 响应内容, ETag, 节点状态数据)
+    """
+    view = node_info.view
+    if view is None or view[0] != node_id:
+        view = render_node_view(node_id, node_info)
+    return view
+
+def render_node_view(node_id, node_info):
+    """生成节点状态接口的响应并缓存在节点上，节点属性变化时缓存被清空
+    
+    Args:
+        node_id: 请求中的节点ID
+        node_info: 节点（MatterNode）
+        
+    Returns:
+        tuple: (节点ID, 响应内容, ETag, 节点状态数据)
+    """
+    # 渲染期间节点可能在事件循环中被更新：写入者先递增版本再清空缓存，
+    # 这里先写入缓存再检查版本，版本已变化时撤销，过期的渲染结果不会留在缓存中
+    generation = node_info.generation
+    
+    data = build_node_view(node_id, node_info)
+    body = current_app.json.dumps({
         "status": "success",
-        "data": {
-            "device_info": device_info,
-            "device_status": status
-        }
+        "data": data
     })
+    view = (node_id, body, hashlib.sha1(body.encode("utf-8")).hexdigest(), data)
+    
+    node_info.view = view
+    if node_info.generation != generation and node_info.view is view:
+        node_info.view = None
+    return view
 
-def extract_attribute(attributes, path, default_value):
-    """从属性中提取指定路径的值
+def build_node_view(node_id, node_info):
+    """解码节点的设备信息和设备状态
     
     Args:
-        attributes: 属性字典
-        path: 属性路径，例如 "0/40/1"
-        default_value: 默认值，如果属性不存在则返回此值
+        node_id: 请求中的节点ID
+        node_info: 节点（MatterNode）
         
     Returns:
-        提取的属性值或默认值
+        dict: {"device_info": 设备信息, "device_status": 设备状态}
     """
-    try:
-        if path in attributes:
-            value = attributes[path]
-            logger.debug("从路径 %s 提取属性值: %s", path, value)
-            return value
-    except Exception as e:
-        logger.error("提取属性 %s 时出错: %s", path, str(e))
-    
-    return default_value
+    data = compose_node_view(node_id, node_info, registry.decode_node(node_info))
+    logger.debug("节点 %s 的设备信息: %s，设备状态: %s", node_id, data["device_info"], data["device_status"])
+    return data
+
+# 节点不可用时返回的设备状态
+OFFLINE_STATUS = {
+    "current_cleaning_mode": "未知",
+    "operational_state": "离线",
+    "operational_state_list": [],
+    "battery_level": 0
+}
 
-def enhance_operational_state_list(state_list):
-    """为操作状态列表中的每个状态ID添加对应的名称
+def compose_node_view(node_id, node_info, decoded):
+    """在解码结果中加入节点级字段，节点不可用时使用离线状态
     
     Args:
-        state_list: 操作状态ID列表，格式为 [{"0":id}, ...]
+        node_id: 请求中的节点ID
+        node_info: 节点（MatterNode）
+        decoded: 属性解码表的解码结果，分组 -> {字段名: 值}
         
     Returns:
-        增强后的操作状态列表，格式为 [{"id":id, "name":name}, ...]
+        dict: {"device_info": 设备信息, "device_status": 设备状态}
     """
-    if not state_list or not isinstance(state_list, list):
-        return []
-    
-    # 操作状态ID与名称的映射
-    state_map = {
-        0: "Stopped",
-        1: "Running",
-        2: "Paused",
-        3: "Error",
-        64: "SeekingCharger",  # 0x40 SeekingCharger
-        65: "Charging",        # 0x41 Charging
-        66: "Docked"           # 0x42 Docked
+    device_info = dict(decoded[DEVICE_INFO],
+                       ip_address="未知",
+                       node_id=node_id,
+                       available=node_info.available,
+                       date_commissioned=node_info.date_commissioned,
+                       last_interview=node_info.last_interview)
+    status = decoded[DEVICE_STATUS] if node_info.available else dict(OFFLINE_STATUS)
+    return {
+        "device_info": device_info,
+        "device_status": status
     }
-    
-    enhanced_list = []
-    for item in state_list:
-        if "0" in item:
-            state_id = item["0"]
-            state_name = state_map.get(state_id, f"State{state_id}")
-            enhanced_list.append({
-                "id": state_id,
-                "name": state_name
-            })
-    
-    return enhanced_list
 
 @api.route('/control', methods=['POST'])
 async def control_device():
     """控制设备"""
-    matter_client = current_app.matter_client
-    data = request.json
+    body, status = await execute_control(current_app.matter_client, request.json)
+    return jsonify(body), status
+
+async def execute_control(matter_client, data):
+    """执行控制命令，WSGI路由和原生ASGI路由共用
     
+    Args:
+        matter_client: Matter客户端
+        data: 请求体，可以包含timeout（秒，不超过MATTER_COMMAND_MAX_TIMEOUT）
+        
+    Returns:
+        tuple: (响应内容, HTTP状态码)
+    """
     if not data or 'action' not in data:
-        return jsonify({
+        return {
             "status": "error",
             "message": "缺少必要参数"
-        }), 400
+        }, 400
     
     action = data['action']
-    params = data.get('params', {})
-    node_id = data.get('node_id', '4')  # 默认使用节点4
+    params = dict(data.get('params') or {})
+    node_id = data.get('node_id') or params.pop('node_id', '4')  # 默认使用节点4
     
     # 定义支持的操作
     supported_actions = {
@@ -255,24 +434,41 @@ async def control_device():
     }
     
     if action not in supported_actions:
-        return jsonify({
+        return {
             "status": "error",
             "message": f"不支持的操作: {action}"
-        }), 400
+        }, 400
+    
+    try:
+        timeout = _parse_timeout(data.get('timeout'))
+    except ValueError:
+        return {
+            "status": "error",
+            "message": f"timeout必须是不超过{MATTER_COMMAND_MAX_TIMEOUT}的正数（秒）"
+        }, 400
     
-    # 异步发送命令
-    success = await matter_client.send_command(node_id, action, params)
+    # 异步发送命令并等待Matter Server的执行结果
+    params['node_id'] = node_id
+    result = await matter_client.send_command(action, params, timeout=timeout)
     
-    if success:
-        return jsonify({
+    if result["success"]:
+        return {
             "status": "success",
-            "message": f"{supported_actions[action]}命令已发送"
-        })
+            "message": f"{supported_actions[action]}命令已执行",
+            "data": result
+        }, 200
+    elif result["error_code"] == "timeout":
+        return {
+            "status": "error",
+            "message": "等待设备响应超时",
+            "data": result
+        }, 504
     else:
-        return jsonify({
+        return {
             "status": "error",
-            "message": "命令发送失败，请检查设备连接状态"
-        }), 500
+            "message": f"命令执行失败: {result['details'] or '请检查设备连接状态'}",
+            "data": result
+        }, 500
 
 @api.route('/config', methods=['GET'])
 def get_config():
@@ -280,34 +476,81 @@ def get_config():
     return jsonify({
         "status": "success",
         "data": {
-            "matter_server_url": current_app.config['MATTER_SERVER_WS_URL']
+            "matter_server_url": current_app.config['MATTER_SERVER_WS_URL'],
+            "matter_servers": {
+                name: client.ws_url for name, client in current_app.matter_client.clients.items()
+            }
         }
     })
 
 @api.route('/config', methods=['POST'])
 def update_config():
     """更新配置信息"""
-    data = request.json
+    body, status = apply_config(current_app, request.json)
+    return jsonify(body), status
+
+def apply_config(app, data):
+    """更新配置信息，WSGI路由和原生ASGI路由共用
     
+    Args:
+        app: Flask应用
+        data: 请求体
+        
+    Returns:
+        tuple: (响应内容, HTTP状态码)
+    """
     if not data:
-        return jsonify({
+        return {
             "status": "error",
             "message": "缺少必要参数"
-        }), 400
+        }, 400
     
     # 更新Matter Server WebSocket URL
     if 'matter_server_url' in data:
-        current_app.config['MATTER_SERVER_WS_URL'] = data['matter_server_url']
+        app.config['MATTER_SERVER_WS_URL'] = data['matter_server_url']
         
-        # 重新连接Matter Server
-        asyncio.create_task(current_app.reconnect_matter_server())
+        # 在主事件循环中连接新的Matter Server，同步完成后再切换，旧连接在此期间继续提供数据
+        coroutine = app.switch_matter_server(data['matter_server_url'])
+        if _running_loop() is app.loop:
+            asyncio.create_task(coroutine)
+        else:
+            asyncio.run_coroutine_threadsafe(coroutine, app.loop)
         
-        return jsonify({
+        return {
             "status": "success",
-            "message": "配置已更新，正在重新连接Matter Server"
-        })
+            "message": "配置已更新，正在切换到新的Matter Server"
+        }, 200
     
-    return jsonify({
+    return {
         "status": "error",
         "message": "没有可更新的配置项"
-    }), 400 
\ No newline at end of file
+    }, 400
+
+def _parse_timeout(value):
+    """解析请求中的命令超时时间
+    
+    Args:
+        value: 请求体中的timeout，None表示使用默认超时时间
+        
+    Returns:
+        float: 超时时间（秒），未指定时返回None
+        
+    Raises:
+        ValueError: 不是数字，或不在 (0, MATTER_COMMAND_MAX_TIMEOUT] 范围内
+    """
+    if value is None:
+        return None
+    if isinstance(value, bool) or not isinstance(value, (int, float, str)):
+        raise ValueError(value)
+    timeout = float(value)
+    # NaN与任何数比较都为False，也会被拒绝
+    if not 0 < timeout <= MATTER_COMMAND_MAX_TIMEOUT:
+        raise ValueError(value)
+    return timeout
+
+def _running_loop():
+    """获取当前线程中正在运行的事件循环，没有则返回None"""
+    try:
+        return asyncio.get_running_loop()
+    except RuntimeError:
+        return None
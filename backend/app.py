@@ -4,16 +4,21 @@ Flask后端主程序
 """
 
 import os
+import sys
 import logging
 import asyncio
 import signal
 from flask import Flask, render_template, send_from_directory, jsonify
 from flask_cors import CORS
 import config
-from matter_client import MatterClient
+from matter_pool import MatterClientPool
 from api.routes import api
 from ws_service import ws_service
-from config import MATTER_SERVER_WS_URL
+from config import MATTER_SERVER_WS_URL, WS_WORKERS, NODE_READ_WORKERS, HTTP_NATIVE_ASGI
+from ws_bus import BusPublisher, start_workers, stop_workers
+from node_snapshot import SnapshotPublisher
+from asgi import create_asgi_app
+from matter_log import setup_matter_logging
 
 # 配置日志
 logging.basicConfig(
@@ -25,23 +30,9 @@ logging.basicConfig(
     ]
 )
 
-# 设置Matter客户端日志级别为DEBUG，以显示详细的通信日志
-matter_logger = logging.getLogger('matter_client')
-matter_logger.setLevel(logging.DEBUG)
-
-# 添加文件处理器，将通信日志保存到文件
-if not os.path.exists('logs'):
-    os.makedirs('logs')
-file_handler = logging.FileHandler('logs/matter_communication.log')
-file_handler.setLevel(logging.DEBUG)
-file_handler.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
-matter_logger.addHandler(file_handler)
-
-# 添加控制台处理器，在控制台显示通信日志
-console_handler = logging.StreamHandler()
-console_handler.setLevel(logging.INFO)
-console_handler.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
-matter_logger.addHandler(console_handler)
+# Matter通信日志：DEBUG级别写入文件，INFO级别显示在控制台，
+# 格式化和写入都在后台线程中完成
+matter_log_listener = setup_matter_logging()
 
 logger = logging.getLogger(__name__)
 logger.info("日志系统已配置，Matter通信日志将保存到 logs/matter_communication.log 并显示在控制台")
@@ -75,9 +66,20 @@ app.register_blueprint(api, url_prefix='/api')
 # Matter客户端
 app.matter_client = None
 
+# 拥有Matter客户端连接的主事件循环
+app.loop = None
+
 # 将WebSocket服务添加到应用上下文中
 app.ws_service = ws_service
 
+# 多进程模式下的本地总线和WebSocket工作进程
+app.ws_bus = None
+app.ws_workers = []
+
+# 共享内存节点快照和HTTP读取工作进程
+app.node_snapshot = None
+app.read_workers = None
+
 @app.route('/', defaults={'path': ''})
 @app.route('/<path:path>')
 def serve_frontend(path):
@@ -88,51 +90,48 @@ def serve_frontend(path):
 
 async def init_matter_client():
     """初始化Matter客户端"""
-    app.matter_client = MatterClient()
-    connected = await app.matter_client.connect()
+    # 连接池对外提供与MatterClient相同的接口，每个Matter Server一个客户端
+    app.matter_client = MatterClientPool()
+    # 启动后，连接断开时会按指数退避在后台持续重连
+    connected = await app.matter_client.start()
     if connected:
         logger.info("Matter客户端初始化成功")
     else:
         logger.warning("Matter客户端初始化失败，将在后台重试连接")
-        # 启动后台任务尝试重新连接
-        asyncio.create_task(reconnect_matter_server())
 
 async def reconnect_matter_server():
     """重新连接Matter Server"""
-    # 如果已连接，先断开连接
-    if app.matter_client and app.matter_client.connected:
-        await app.matter_client.disconnect()
-    
-    # 尝试重新连接
-    retry_count = 0
-    max_retries = 5
-    retry_interval = 5  # 秒
-    
-    while retry_count < max_retries:
-        logger.info(f"尝试连接Matter Server ({retry_count + 1}/{max_retries})...")
-        connected = await app.matter_client.connect()
-        
-        if connected:
-            logger.info("成功连接到Matter Server")
-            return True
-        
-        retry_count += 1
-        logger.warning(f"连接失败，{retry_interval}秒后重试...")
-        await asyncio.sleep(retry_interval)
-    
-    logger.error(f"连接Matter Server失败，已达到最大重试次数 ({max_retries})")
-    return False
+    await app.matter_client.reconnect()
+
+async def switch_matter_server(ws_url):
+    """先连接并同步新的Matter Server，再无中断地切换过去"""
+    return await app.matter_client.switch_server(ws_url)
 
 # 将重连函数添加到应用上下文中，以便API可以调用
 app.reconnect_matter_server = reconnect_matter_server
+app.switch_matter_server = switch_matter_server
 
 async def init_app():
     """初始化应用"""
     # 初始化Matter客户端
     await init_matter_client()
     
-    # 启动WebSocket服务
-    await app.ws_service.start()
+    # 订阅Matter客户端的状态变化并启动WebSocket服务
+    app.ws_service.attach_matter_client(app.matter_client)
+    if WS_WORKERS > 0:
+        # 主进程只维护状态，前端连接由工作进程处理
+        app.ws_bus = BusPublisher(app.ws_service)
+        await app.ws_bus.start()
+        app.ws_workers = await start_workers(WS_WORKERS)
+    else:
+        await app.ws_service.start()
+    
+    if NODE_READ_WORKERS > 0:
+        # 发布节点快照，查询接口由读取工作进程提供
+        app.node_snapshot = SnapshotPublisher(app.matter_client)
+        app.node_snapshot.start()
+        read_worker = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'read_worker.py')
+        app.read_workers = await asyncio.create_subprocess_exec(sys.executable, read_worker)
     
     logger.info("应用初始化完成")
 
@@ -141,6 +140,8 @@ def run_app():
     # 创建事件循环
     loop = asyncio.new_event_loop()
     asyncio.set_event_loop(loop)
+    # 保存主事件循环，供在其他线程中运行的请求处理函数提交协程
+    app.loop = loop
     
     # 初始化应用
     loop.run_until_complete(init_app())
@@ -156,14 +157,35 @@ def run_app():
     config = Config()
     config.bind = ["0.0.0.0:5000"]  # HTTP接口端口为5000
     
-    loop.run_until_complete(serve(app, config))
+    if HTTP_NATIVE_ASGI:
+        # 控制和配置接口在当前事件循环中直接处理，其他请求交给Flask
+        loop.run_until_complete(serve(create_asgi_app(app), config, mode="asgi"))
+    else:
+        loop.run_until_complete(serve(app, config))
 
 async def shutdown(loop):
     """关闭服务器"""
     logger.info("正在关闭服务...")
     
-    # 关闭WebSocket服务器
+    # 关闭WebSocket服务器和工作进程
     await app.ws_service.stop()
+    if app.ws_bus:
+        await stop_workers(app.ws_workers)
+        await app.ws_bus.stop()
+    
+    # 停止HTTP读取工作进程并删除节点快照
+    if app.read_workers and app.read_workers.returncode is None:
+        app.read_workers.terminate()
+        await app.read_workers.wait()
+    if app.node_snapshot:
+        app.node_snapshot.stop()
+    
+    # 断开Matter Server连接
+    if app.matter_client:
+        await app.matter_client.stop()
+    
+    # 刷新并停止Matter通信日志线程
+    matter_log_listener.stop()
     
     # 停止事件循环
     loop.stop()
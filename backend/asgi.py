@@ -0,0 +1,242 @@
+"""
+原生ASGI请求入口
+需要与Matter客户端交互的接口直接在主事件循环中处理，不经过线程池和每个请求新建的事件循环；
+事件流（/api/events）由sse模块在事件循环中推送；其他请求交给Flask（WSGI）处理
+"""
+
+import re
+import json
+import asyncio
+import logging
+from functools import partial
+from urllib.parse import parse_qs
+from hypercorn.app_wrappers import WSGIWrapper
+from api.routes import execute_control, apply_config, read_node_attribute
+from sse import EventStreamHandler
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+
+class Request:
+    """原生路由收到的请求"""
+
+    def __init__(self, scope, body, view_args=None):
+        self.method = scope["method"]
+        self.path = scope["path"]
+        # 路径参数，例如 /api/node/<node_id> 中的node_id
+        self.view_args = view_args or {}
+        self.args = {key: values[0] for key, values in parse_qs(scope["query_string"].decode("latin-1")).items()}
+        self.headers = {name.decode("latin-1"): value.decode("latin-1") for name, value in scope["headers"]}
+        self.body = body
+
+    @property
+    def json(self):
+        """请求体解析后的JSON，无法解析时返回None"""
+        try:
+            return json.loads(self.body) if self.body else None
+        except ValueError:
+            return None
+
+
+class NativeApp:
+    """ASGI应用：已注册的路由在事件循环中直接处理，其余请求转交给Flask"""
+
+    def __init__(self, flask_app, max_body_size=16 * 1024 * 1024):
+        """初始化ASGI应用
+
+        Args:
+            flask_app: Flask应用，处理未注册的路由
+            max_body_size: 请求体的最大字节数
+        """
+        self.flask_app = flask_app
+        self.max_body_size = max_body_size
+        self.fallback = WSGIWrapper(flask_app, max_body_size)
+        # (请求方法, 路径) -> 处理函数
+        self.routes = {}
+        # 带路径参数的路由：(请求方法, 路径的正则表达式, 处理函数)
+        self.patterns = []
+        # 路径 -> 流式响应的ASGI处理函数（只处理GET）
+        self.streams = {}
+
+    def route(self, path, methods=("GET",)):
+        """注册原生路由
+
+        处理函数为 async def handler(request)，返回 (响应内容, HTTP状态码)。
+        路径中可以使用与Flask相同的参数 <name>（不含"/"）和 <path:name>（可含"/"），
+        参数值在request.view_args中。
+
+        Args:
+            path: 请求路径
+            methods: 请求方法
+        """
+        def decorator(handler):
+            for method in methods:
+                if "<" in path:
+                    self.patterns.append((method, _compile_path(path), handler))
+                else:
+                    self.routes[(method, path)] = handler
+            return handler
+        return decorator
+
+    def match(self, method, path):
+        """查找请求对应的原生路由
+
+        Args:
+            method: 请求方法
+            path: 请求路径
+
+        Returns:
+            tuple: (处理函数, 路径参数)，没有对应的路由时返回None
+        """
+        handler = self.routes.get((method, path))
+        if handler is not None:
+            return handler, {}
+        for route_method, pattern, handler in self.patterns:
+            if route_method == method:
+                matched = pattern.fullmatch(path)
+                if matched:
+                    return handler, matched.groupdict()
+        return None
+
+    def _methods(self, path):
+        """路径支持的原生路由请求方法"""
+        methods = {method for method, route_path in self.routes if route_path == path}
+        methods.update(method for method, pattern, _ in self.patterns if pattern.fullmatch(path))
+        return methods
+
+    def stream(self, path, handler):
+        """注册流式响应的GET路由
+
+        Args:
+            path: 请求路径
+            handler: ASGI处理函数 async def handler(scope, receive, send)，自行发送响应
+        """
+        self.streams[path] = handler
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            await self._lifespan(receive, send)
+            return
+        if scope["type"] == "http":
+            if scope["method"] == "GET" and scope["path"] in self.streams:
+                logger.info("接收到API请求: %s %s", scope["method"], scope["path"])
+                await self.streams[scope["path"]](scope, receive, send)
+                return
+            matched = self.match(scope["method"], scope["path"])
+            if matched:
+                await self._handle(scope, receive, send, *matched)
+                return
+            if scope["method"] == "OPTIONS" and self._methods(scope["path"]):
+                await self._preflight(scope, send)
+                return
+
+        # 与hypercorn调用WSGI应用的方式相同：在线程池中运行Flask，响应通过事件循环发送
+        loop = asyncio.get_running_loop()
+
+        def call_soon(func, *args):
+            return asyncio.run_coroutine_threadsafe(func(*args), loop).result()
+
+        await self.fallback(scope, receive, send, partial(loop.run_in_executor, None), call_soon)
+
+    async def _handle(self, scope, receive, send, handler, view_args):
+        """在事件循环中直接处理已注册的路由"""
+        body = bytearray()
+        while True:
+            message = await receive()
+            body.extend(message.get("body", b""))
+            if len(body) > self.max_body_size:
+                await self._respond(send, {"status": "error", "message": "请求体过大"}, 413)
+                return
+            if not message.get("more_body"):
+                break
+
+        request = Request(scope, bytes(body), view_args)
+        logger.info("接收到API请求: %s %s", request.method, request.path)
+        try:
+            content, status = await handler(request)
+        except Exception as e:
+            logger.error("处理请求 %s %s 时出错: %s", request.method, request.path, str(e), exc_info=True)
+            content, status = {"status": "error", "message": "服务器内部错误"}, 500
+        await self._respond(send, content, status)
+
+    async def _preflight(self, scope, send):
+        """响应CORS预检请求，与flask-cors的默认行为一致"""
+        headers = dict(scope["headers"])
+        response_headers = [
+            (b"access-control-allow-origin", b"*"),
+            (b"access-control-allow-methods", ", ".join(sorted(self._methods(scope["path"]))).encode()),
+        ]
+        if b"access-control-request-headers" in headers:
+            response_headers.append((b"access-control-allow-headers", headers[b"access-control-request-headers"]))
+        await send({"type": "http.response.start", "status": 200, "headers": response_headers})
+        await send({"type": "http.response.body", "body": b""})
+
+    async def _respond(self, send, content, status):
+        """发送JSON响应"""
+        body = json.dumps(content, ensure_ascii=False).encode("utf-8")
+        await send({
+            "type": "http.response.start",
+            "status": status,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"access-control-allow-origin", b"*"),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
+
+    async def _lifespan(self, receive, send):
+        """应用的启动和关闭由app.py管理，这里只确认lifespan事件"""
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+
+def _compile_path(path):
+    """把带参数的路由路径转换为正则表达式
+
+    Args:
+        path: 路由路径，例如 "/api/node/<node_id>/attribute/<path:attribute_path>"
+
+    Returns:
+        re.Pattern: 匹配请求路径的正则表达式，参数为命名分组
+    """
+    def replace(matched):
+        converter, name = matched.groups()
+        return f"(?P<{name}>.+)" if converter == "path" else f"(?P<{name}>[^/]+)"
+
+    return re.compile(re.sub(r"<(?:(\w+):)?(\w+)>", replace, re.escape(path)))
+
+
+def create_asgi_app(flask_app):
+    """创建原生ASGI入口，控制、配置和按需读取属性的接口直接在主事件循环中处理，并提供SSE事件流
+
+    Args:
+        flask_app: Flask应用，需要已设置matter_client和ws_service
+
+    Returns:
+        NativeApp: ASGI应用
+    """
+    native = NativeApp(flask_app, flask_app.config.get("MAX_CONTENT_LENGTH") or 16 * 1024 * 1024)
+
+    @native.route("/api/control", methods=("POST",))
+    async def control(request):
+        return await execute_control(flask_app.matter_client, request.json)
+
+    @native.route("/api/config", methods=("POST",))
+    async def update_config(request):
+        return apply_config(flask_app, request.json)
+
+    @native.route("/api/node/<node_id>/attribute/<path:attribute_path>")
+    async def node_attribute(request):
+        return await read_node_attribute(flask_app.matter_client, request.view_args["node_id"],
+                                         request.view_args["attribute_path"])
+
+    native.stream("/api/events", EventStreamHandler(flask_app.ws_service))
+
+    return native
@@ -0,0 +1,186 @@
+"""
+回调函数注册表
+每个订阅者拥有独立的有界队列和分发任务，慢订阅者不会阻塞其他订阅者和消息接收
+"""
+
+import asyncio
+import logging
+from collections import OrderedDict
+from config import CALLBACK_QUEUE_SIZE
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+
+class _Subscription:
+    """单个订阅者的待分发队列
+
+    队列按键合并：同一个键（例如同一个节点）尚未分发的旧值会被新值合并或替换，
+    每个键只占一个位置。提供了重新同步函数时，不同键的数量超过队列长度后不丢弃任何键，
+    而是清空队列并标记为需要重新同步，分发任务随后先向订阅者发送一条重新同步消息，由订阅者读取完整状态。
+    """
+
+    def __init__(self, callback):
+        self.callback = callback
+        self.pending = OrderedDict()
+        # 队列溢出后需要先发送重新同步消息
+        self.dirty = False
+        self.wakeup = asyncio.Event()
+        self.task = None
+        self.delivered = 0
+        self.coalesced = 0
+        self.dropped = 0
+        self.resyncs = 0
+        self.errors = 0
+
+    @property
+    def name(self):
+        return getattr(self.callback, "__qualname__", repr(self.callback))
+
+    def stats(self):
+        """获取订阅者的分发统计
+
+        Returns:
+            dict: 订阅者名称、队列深度、已分发、已合并、已丢弃、重新同步和出错的数量
+        """
+        return {
+            "name": self.name,
+            "queue_depth": len(self.pending),
+            "delivered": self.delivered,
+            "coalesced": self.coalesced,
+            "dropped": self.dropped,
+            "resyncs": self.resyncs,
+            "errors": self.errors,
+        }
+
+
+class CallbackRegistry:
+    """回调函数注册表，向所有订阅者并发分发消息"""
+
+    def __init__(self, name, maxsize=None, merge=None, resync=None):
+        """初始化回调函数注册表
+
+        Args:
+            name: 注册表名称，用于日志
+            maxsize: 每个订阅者最多排队的不同键的数量，可以是返回当前上限的函数（例如按节点数量），
+                     默认使用配置中的CALLBACK_QUEUE_SIZE
+            merge: 合并函数 merge(old, new)，用于合并同一个键尚未分发的值，
+                   默认直接用新值替换旧值
+            resync: 生成重新同步消息的函数，队列溢出后发送给订阅者；
+                    默认为None，此时队列满时丢弃最早的条目（适用于只有少数几个键的注册表）
+        """
+        self.name = name
+        self.maxsize = maxsize or CALLBACK_QUEUE_SIZE
+        self._merge = merge
+        self._resync = resync
+        self._subscriptions = {}
+
+    def __len__(self):
+        return len(self._subscriptions)
+
+    def __contains__(self, callback):
+        return callback in self._subscriptions
+
+    def register(self, callback):
+        """注册回调函数
+
+        Args:
+            callback: 异步回调函数，接收一个参数
+
+        Returns:
+            bool: 是否为新注册的回调函数
+        """
+        if callback in self._subscriptions:
+            return False
+        self._subscriptions[callback] = _Subscription(callback)
+        return True
+
+    def unregister(self, callback):
+        """取消注册回调函数，尚未分发的消息将被丢弃
+
+        Args:
+            callback: 要取消的回调函数
+
+        Returns:
+            bool: 回调函数是否已注册
+        """
+        subscription = self._subscriptions.pop(callback, None)
+        if subscription is None:
+            return False
+        if subscription.task:
+            subscription.task.cancel()
+        return True
+
+    def publish(self, key, payload):
+        """向所有订阅者发布消息，不等待回调函数执行
+
+        Args:
+            key: 合并键，同一个键尚未分发的消息会被合并
+            payload: 消息内容
+        """
+        maxsize = self.maxsize() if callable(self.maxsize) else self.maxsize
+        for subscription in self._subscriptions.values():
+            pending = subscription.pending
+            if key in pending:
+                old = pending[key]
+                pending[key] = self._merge(old, payload) if self._merge else payload
+                subscription.coalesced += 1
+            elif len(pending) >= maxsize and self._resync is not None:
+                # 不丢弃任何键：清空队列，改为发送重新同步消息，订阅者从完整状态恢复
+                if not subscription.dirty:
+                    logger.warning("%s 回调 %s 队列已满（%d 个键），改为重新同步",
+                                   self.name, subscription.name, len(pending))
+                subscription.coalesced += len(pending) + 1
+                pending.clear()
+                subscription.dirty = True
+            else:
+                if len(pending) >= maxsize:
+                    dropped_key, _ = pending.popitem(last=False)
+                    subscription.dropped += 1
+                    logger.warning("%s 回调 %s 队列已满，丢弃 %s 的更新",
+                                   self.name, subscription.name, dropped_key)
+                pending[key] = payload
+            subscription.wakeup.set()
+            if subscription.task is None or subscription.task.done():
+                subscription.task = asyncio.create_task(self._dispatch(subscription))
+
+    def stats(self):
+        """获取所有订阅者的分发统计
+
+        Returns:
+            list: 每个订阅者的统计信息
+        """
+        return [subscription.stats() for subscription in self._subscriptions.values()]
+
+    async def close(self):
+        """停止所有分发任务"""
+        tasks = [s.task for s in self._subscriptions.values() if s.task]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _dispatch(self, subscription):
+        """订阅者的分发任务：按顺序逐条调用回调函数
+
+        Args:
+            subscription: 订阅者
+        """
+        while True:
+            if subscription.dirty:
+                # 重新同步消息在溢出之后到达的更新之前分发
+                subscription.dirty = False
+                subscription.resyncs += 1
+                payload = self._resync()
+            elif subscription.pending:
+                _, payload = subscription.pending.popitem(last=False)
+            else:
+                subscription.wakeup.clear()
+                await subscription.wakeup.wait()
+                continue
+            try:
+                await subscription.callback(payload)
+                subscription.delivered += 1
+            except Exception as e:
+                subscription.errors += 1
+                logger.error("%s 回调 %s 执行出错: %s", self.name, subscription.name,
+                             str(e), exc_info=True)
@@ -4,13 +4,112 @@ RVC控制端配置文件
 
 # Matter Server WebSocket配置
 MATTER_SERVER_WS_URL = "ws://192.168.2.21:5580/ws"
+# 多个Matter Server时按名称配置（名称 -> WebSocket地址），节点ID格式为 <名称>:<节点ID>
+MATTER_SERVERS = {"default": MATTER_SERVER_WS_URL}
+# 备用Matter Server（名称 -> 备用WebSocket地址），保持热备连接，主服务器故障时自动切换
+MATTER_STANDBY_SERVERS = {}
+MATTER_COMMAND_TIMEOUT = 10  # 命令响应超时时间（秒）
+MATTER_COMMAND_MAX_TIMEOUT = 60  # 控制接口请求中timeout参数的最大值（秒）
+MATTER_LISTEN_TIMEOUT = 60  # start_listening 节点列表响应超时时间（秒）
+MATTER_RECONNECT_MIN_DELAY = 1  # 重连初始等待时间（秒）
+MATTER_RECONNECT_MAX_DELAY = 60  # 重连最大等待时间（秒）
+MATTER_RECONNECT_FACTOR = 2  # 重连等待时间的指数增长因子
+MATTER_RECONNECT_JITTER = 0.5  # 重连等待时间的随机抖动比例（0~1）
+MATTER_INBOUND_QUEUE_SIZE = 1000  # 待处理消息队列长度，队列满时暂停读取WebSocket
+MATTER_INBOUND_WORKERS = 1  # 消息处理任务数量（为1时保证事件按接收顺序处理）
+# 节点存储只保存匹配的属性路径（"endpoint/cluster/attribute"，每段可以是 "*"），
+# 其他属性通过 /api/node/<id>/attribute/<路径> 按需从Matter Server读取；设为None则保存所有属性
+NODE_RETAIN_ATTRIBUTES = [
+    "0/40/*",   # Basic Information
+    "1/84/*",   # RVC Run Mode
+    "1/85/*",   # RVC Clean Mode
+    "1/97/*",   # RVC Operational State
+    "1/47/12",  # Power Source BatPercentRemaining
+]
+
+# Matter通信日志配置
+MATTER_LOG_FILE = "logs/matter_communication.log"
+# 是否记录每条收发的原始报文（包括start_listening返回的完整节点列表），默认关闭，
+# 关闭时报文不会生成日志记录
+MATTER_LOG_TRAFFIC = False
+MATTER_LOG_MAX_CHARS = 2000  # 单条报文日志的最大字符数，超出部分截断（0表示不截断）
+MATTER_LOG_SAMPLE_RATE = 1  # 报文日志采样率，每N条报文记录1条
+MATTER_LOG_QUEUE_SIZE = 10000  # 日志队列长度，队列满时丢弃日志
 
 # Flask应用配置
 DEBUG = True
 SECRET_KEY = "dev-secret-key"  # 在生产环境中应更改为随机值
 
 # WebSocket配置
-WS_PING_INTERVAL = 30  # WebSocket心跳间隔（秒）
+WS_PING_INTERVAL = 30  # WebSocket心跳间隔（秒），也用作Matter Server健康检查间隔
+
+# Matter Server健康检查配置
+MATTER_HEALTH_TIMEOUT = 5  # 等待pong响应的超时时间（秒）
+MATTER_HEALTH_MAX_RTT_MS = 1000  # 往返时延超过该值视为不健康（毫秒）
+MATTER_HEALTH_MAX_FAILURES = 3  # 连续不健康的次数达到该值时进行故障切换或重连
+MATTER_HEALTH_HISTORY_SIZE = 100  # 保留的健康检查记录数量
+
+# 状态回调配置
+# 每个回调订阅者的待分发队列长度，同一节点的更新会合并；
+# 节点回调在此基础上为每个节点各保留一个位置，仍然溢出时订阅者重新同步所有节点
+CALLBACK_QUEUE_SIZE = 100
+
+# 控制和配置接口是否使用原生ASGI路由：直接在拥有Matter连接的主事件循环中处理，
+# 不经过线程池，也不为每个请求新建事件循环；其他接口仍由Flask处理
+HTTP_NATIVE_ASGI = True
+
+# Server-Sent Events推送（/api/events，需要HTTP_NATIVE_ASGI）
+SSE_KEEPALIVE_INTERVAL = 15  # 事件流空闲时发送注释行的间隔（秒），防止代理断开空闲连接
+SSE_RETRY_MS = 3000  # 建议浏览器断开后重连的等待时间（毫秒）
+
+# HTTP读取工作进程数量，0表示不启用；大于0时主进程把节点数据发布为共享内存快照，
+# 读取工作进程在NODE_READ_PORT上提供 /api/nodes、/api/node/<id> 等查询接口
+NODE_READ_WORKERS = 0
+NODE_READ_PORT = 5001
+NODE_SNAPSHOT_PATH = "/dev/shm/matter-rvc-nodes"  # 快照文件路径，建议放在内存文件系统中
+NODE_SNAPSHOT_SIZE = 16 * 1024 * 1024  # 快照文件大小（字节），分为两个数据槽
+NODE_SNAPSHOT_INTERVAL = 0.1  # 合并节点变化的时间窗口（秒）
+
+# 批量节点状态接口 /api/nodes/status 的分页大小
+NODE_BATCH_LIMIT = 100  # 未指定limit时每页的节点数
+NODE_BATCH_MAX_LIMIT = 1000  # 每页最多的节点数
+
+# 前端WebSocket推送配置
+WS_CLIENT_QUEUE_SIZE = 100  # 每个客户端的发送队列长度
+# 发送队列已满时的处理策略：
+#   drop_oldest - 丢弃最早的消息（客户端检测到补丁缺失后会请求重新同步）
+#   coalesce    - 清空队列，改为发送一份最新的完整快照
+#   disconnect  - 断开该客户端
+WS_SLOW_CLIENT_POLICY = "coalesce"
+# 支持的消息格式，按优先顺序与客户端协商子协议（matter-rvc.<格式>）；
+# msgpack和cbor需要安装对应的依赖，未请求子协议的客户端使用json
+WS_CODECS = ["msgpack", "cbor", "json"]
+# permessage-deflate压缩参数，设为None则关闭压缩
+WS_DEFLATE_OPTIONS = {
+    "server_max_window_bits": 12,  # 压缩窗口大小，越小每个连接占用的内存越少
+    "client_max_window_bits": 12,
+    "compress_settings": {"memLevel": 5, "level": 6},
+}
+
+# 补丁重放缓冲区：重连的客户端可以从断开前收到的最后一个seq继续，只补发错过的补丁；
+# 按条数和总字节数（JSON编码后）限制，超出时丢弃最早的补丁
+WS_REPLAY_BUFFER_SIZE = 1000
+WS_REPLAY_BUFFER_MAX_BYTES = 1024 * 1024
+
+# WebSocket工作进程数量，0表示在主进程中直接服务前端连接；
+# 大于0时主进程通过本地总线把补丁转发给工作进程，工作进程通过SO_REUSEPORT共享WS_PORT
+WS_WORKERS = 0
+WS_BUS_SOCKET = "/tmp/matter-rvc-ws-bus.sock"  # 总线的Unix socket路径
+WS_BUS_MAX_BUFFER = 4 * 1024 * 1024  # 每个工作进程的最大写缓冲区（字节），超出时断开并重新同步
+WS_BUS_RECONNECT_DELAY = 1  # 工作进程重连总线的间隔（秒）
+
+# 状态更新合并窗口（秒）：窗口内同一设备/节点的多次更新合并为一个补丁，设为0则立即发送
+WS_COALESCE_WINDOW = 0.1
+# 每秒最多发送的补丁批次数
+WS_MAX_FLUSH_RATE = 10
+# 每个客户端每秒最多发送的消息数，0表示不限制；超出时消息在发送队列中积压，
+# 队列满后按WS_SLOW_CLIENT_POLICY处理
+WS_CLIENT_MAX_RATE = 0
 
 # 设备状态更新间隔（秒）
 STATUS_UPDATE_INTERVAL = 1 
\ No newline at end of file
@@ -4,24 +4,47 @@ Matter Server WebSocket客户端
 """
 
 import json
+import time
+import random
 import asyncio
 import websockets
+import itertools
 import logging
-from config import MATTER_SERVER_WS_URL
+from config import (MATTER_SERVER_WS_URL, MATTER_COMMAND_TIMEOUT, MATTER_LISTEN_TIMEOUT,
+                    MATTER_INBOUND_QUEUE_SIZE, MATTER_INBOUND_WORKERS,
+                    MATTER_RECONNECT_MIN_DELAY, MATTER_RECONNECT_MAX_DELAY,
+                    MATTER_RECONNECT_FACTOR, MATTER_RECONNECT_JITTER,
+                    WS_PING_INTERVAL, MATTER_HEALTH_MAX_FAILURES, NODE_RETAIN_ATTRIBUTES,
+                    CALLBACK_QUEUE_SIZE)
+from node_store import NodeStore
+from matter_log import LazyJson, LazyText, log_traffic
+from callbacks import CallbackRegistry
+from matter_schema import path_of
+from matter_health import HealthHistory, StandbyConnection, probe_rtt
 
 # 配置日志
 logger = logging.getLogger(__name__)
 
+# 待处理消息的优先级，数值越小越优先
+PRIORITY_RESPONSE = 0  # 未匹配到等待请求的响应
+PRIORITY_EVENT = 1     # 增量事件
+PRIORITY_BULK = 2      # 设备状态更新及其他消息
+
+# 设备状态使用的OperationalState属性路径
+OPERATIONAL_STATE = path_of("operational_state")
+
 class MatterClient:
     """Matter Server WebSocket客户端"""
     
-    def __init__(self, ws_url=None):
+    def __init__(self, ws_url=None, standby_url=None):
         """初始化Matter客户端
         
         Args:
             ws_url: WebSocket服务器地址，默认使用配置文件中的地址
+            standby_url: 备用服务器地址，配置后保持热备连接并在主服务器故障时自动切换
         """
         self.ws_url = ws_url or MATTER_SERVER_WS_URL
+        self.standby_url = standby_url
         self.websocket = None
         self.connected = False
         self.device_status = {
@@ -29,33 +52,334 @@ class MatterClient:
             "operational_state": "未知",
             "battery_level": 0,
         }
-        self.status_callbacks = []
-        
         # 存储节点数据
-        self.nodes = {}
+        self.nodes = NodeStore(retain=NODE_RETAIN_ATTRIBUTES)
+        
+        # 状态回调和节点回调：每个订阅者独立并发分发，尚未分发的更新按节点合并，
+        # 节点回调的队列为每个节点保留一个位置，仍然溢出时改为通知订阅者重新同步所有节点
+        self.status_callbacks = CallbackRegistry("状态")
+        self.node_callbacks = CallbackRegistry(
+            "节点", maxsize=lambda: len(self.nodes) + CALLBACK_QUEUE_SIZE,
+            merge=merge_node_changes, resync=self._resync_change)
         self.message_id_counter = 0
         
+        # Matter Server增量事件处理函数
+        self._event_handlers = {
+            "attribute_updated": self._on_attribute_updated,
+            "node_added": self._on_node_added,
+            "node_updated": self._on_node_updated,
+            "node_removed": self._on_node_removed,
+        }
+        
+        # 等待响应的请求表：message_id -> (asyncio.Future, 发送请求的WebSocket连接)
+        self._pending = {}
+        # 等待同步的start_listening请求：message_id -> (激活Future, 服务器地址, 读取任务)
+        self._listens = {}
+        # 拥有WebSocket连接的事件循环
+        self.loop = None
+        
+        # 待处理消息队列：(优先级, 序号, 接收时间, 消息)，由读取任务写入、处理任务消费
+        self._inbound = asyncio.PriorityQueue(MATTER_INBOUND_QUEUE_SIZE)
+        self._inbound_seq = itertools.count()
+        self._reader_task = None
+        self._workers = []
+        
+        # 重连监督任务
+        self._supervisor_task = None
+        self.reconnect_attempts = 0
+        # 连接是否处于连续失败中，用于只记录第一次失败的异常堆栈
+        self._connect_failing = False
+        
+        # 健康检查和热备连接
+        self._health_task = None
+        self._standby = None
+        self._active_failures = 0
+        self.failovers = 0
+        self.health = HealthHistory()
+        self.metrics = {
+            "received": 0,
+            "processed": 0,
+            "max_queue_depth": 0,
+            "last_lag_ms": 0.0,
+            "avg_lag_ms": 0.0,
+            "max_lag_ms": 0.0,
+        }
+        
         logger.info("Matter客户端初始化完成，WebSocket地址: %s", self.ws_url)
     
     async def connect(self):
-        """连接到Matter Server"""
+        """连接到Matter Server并同步节点列表
+        
+        Returns:
+            bool: 是否连接成功并完成节点列表同步
+        """
         try:
             logger.info("正在连接到Matter Server: %s", self.ws_url)
-            self.websocket = await websockets.connect(self.ws_url)
-            self.connected = True
+            await self._establish(self.ws_url)
             logger.info("已成功连接到Matter Server: %s", self.ws_url)
+            self._connect_failing = False
+            return True
+        except Exception as e:
+            # 重连期间每次重试都会失败，只在连续失败的第一次记录完整的异常堆栈
+            if not self._connect_failing:
+                self._connect_failing = True
+                logger.error("连接Matter Server失败: %s", str(e), exc_info=True)
+            else:
+                logger.warning("连接Matter Server失败: %s", str(e))
+                logger.debug("连接Matter Server失败的异常堆栈", exc_info=True)
+            return False
+    
+    async def switch_server(self, ws_url):
+        """无中断地切换到新的Matter Server
+        
+        先建立到新服务器的连接并完成节点列表同步，再原子地切换为活动连接，
+        最后等待旧连接上尚未完成的请求结束后关闭旧连接。
+        切换失败时继续使用原来的连接。
+        
+        Args:
+            ws_url: 新的Matter Server WebSocket地址
             
-            # 启动接收消息的任务
-            asyncio.create_task(self._receive_messages())
+        Returns:
+            bool: 是否切换成功
+        """
+        logger.info("正在切换Matter Server: %s -> %s", self.ws_url, ws_url)
+        try:
+            previous = await self._establish(ws_url)
+        except Exception as e:
+            logger.error("切换到Matter Server %s 失败，继续使用 %s: %s", ws_url, self.ws_url, str(e))
+            return False
+        
+        logger.info("已切换到Matter Server: %s", ws_url)
+        if previous is not None:
+            asyncio.create_task(self._drain(previous))
+        return True
+    
+    async def _establish(self, ws_url):
+        """建立到指定Matter Server的连接并同步节点列表
+        
+        start_listening的响应和随后的事件按接收顺序进入消息队列，
+        处理任务处理到该响应时才将新连接切换为活动连接（见 _activate），
+        因此切换前后不会丢失或重复应用事件。
+        
+        Args:
+            ws_url: Matter Server WebSocket地址
             
-            # 发送监听命令
-            await self.start_listening()
+        Returns:
+            被替换下来的旧连接，没有旧连接时返回None
             
-            return True
-        except Exception as e:
-            logger.error("连接Matter Server失败: %s", str(e), exc_info=True)
-            self.connected = False
+        Raises:
+            Exception: 连接失败、同步失败或超时
+        """
+        self.loop = asyncio.get_running_loop()
+        websocket = await websockets.connect(ws_url)
+        reader = asyncio.create_task(self._receive_messages(websocket))
+        self._start_workers()
+        
+        message_id = self._next_message_id("listen")
+        activated = self.loop.create_future()
+        self._listens[message_id] = (activated, ws_url, reader)
+        try:
+            message_str = json.dumps({"message_id": message_id, "command": "start_listening"})
+            log_traffic("send", message_id, message_str)
+            await websocket.send(message_str)
+            return await asyncio.wait_for(activated, MATTER_LISTEN_TIMEOUT)
+        except BaseException:
+            self._listens.pop(message_id, None)
+            if websocket is not self.websocket:
+                reader.cancel()
+                await websocket.close()
+            raise
+    
+    async def _activate(self, websocket, data):
+        """处理start_listening响应：同步节点列表并将连接切换为活动连接
+        
+        Args:
+            websocket: 收到响应的WebSocket连接
+            data: start_listening响应
+        """
+        activated, ws_url, reader = self._listens.pop(data["message_id"])
+        if activated.done():
+            return
+        if "result" not in data:
+            activated.set_exception(ConnectionError(data.get("details") or "start_listening失败"))
+            return
+        
+        previous = self.websocket if self.connected else None
+        self.websocket = websocket
+        self._reader_task = reader
+        self.ws_url = ws_url
+        self.connected = True
+        
+        logger.info("收到节点列表响应，共 %d 个节点", len(data["result"]))
+        await self._process_nodes_list(data["result"])
+        activated.set_result(previous)
+    
+    async def _drain(self, websocket):
+        """等待旧连接上尚未完成的请求结束后关闭旧连接
+        
+        Args:
+            websocket: 要关闭的旧连接
+        """
+        futures = [future for future, ws in self._pending.values() if ws is websocket]
+        if futures:
+            logger.info("等待旧连接上 %d 个请求完成", len(futures))
+            await asyncio.wait(futures, timeout=MATTER_COMMAND_TIMEOUT)
+        await websocket.close()
+        logger.info("旧的Matter Server连接已关闭")
+    
+    async def start(self):
+        """连接到Matter Server并启动重连监督任务
+        
+        首次连接失败时不会抛出异常，监督任务会在后台持续重试。
+        
+        Returns:
+            bool: 首次连接是否成功
+        """
+        connected = await self.connect()
+        if self._supervisor_task is None or self._supervisor_task.done():
+            self._supervisor_task = asyncio.create_task(self._supervise())
+        if self._health_task is None or self._health_task.done():
+            self._health_task = asyncio.create_task(self._monitor_health())
+        return connected
+    
+    async def stop(self):
+        """停止重连监督任务和健康检查任务，断开所有连接"""
+        for task in (self._supervisor_task, self._health_task):
+            if task:
+                task.cancel()
+                await asyncio.gather(task, return_exceptions=True)
+        self._supervisor_task = self._health_task = None
+        if self._standby is not None:
+            await self._standby.close()
+            self._standby = None
+        await self.disconnect()
+    
+    async def reconnect(self):
+        """断开当前连接，由监督任务立即重新连接"""
+        self.reconnect_attempts = 0
+        await self.disconnect()
+    
+    def _reconnect_delay(self):
+        """计算下一次重连前的等待时间（带随机抖动的指数退避）
+        
+        Returns:
+            float: 等待时间（秒）
+        """
+        delay = min(MATTER_RECONNECT_MAX_DELAY,
+                    MATTER_RECONNECT_MIN_DELAY * MATTER_RECONNECT_FACTOR ** self.reconnect_attempts)
+        return delay * random.uniform(1 - MATTER_RECONNECT_JITTER, 1)
+    
+    async def _supervise(self):
+        """重连监督任务：连接断开后按指数退避无限次重试"""
+        while True:
+            if self.connected and self._reader_task:
+                # 等待连接断开
+                await asyncio.gather(self._reader_task, return_exceptions=True)
+                if self.connected:
+                    continue
+            
+            # 活动连接断开时优先切换到已就绪的热备连接
+            if await self._failover("活动连接已断开"):
+                continue
+            
+            if self.reconnect_attempts:
+                delay = self._reconnect_delay()
+                logger.warning("连接Matter Server失败，%.1f秒后重试 (第%d次)...",
+                               delay, self.reconnect_attempts + 1)
+                await asyncio.sleep(delay)
+            
+            if await self.connect():
+                logger.info("成功连接到Matter Server")
+                self.reconnect_attempts = 0
+            else:
+                self.reconnect_attempts += 1
+    
+    async def _monitor_health(self):
+        """健康检查任务：每隔WS_PING_INTERVAL秒探测活动连接和热备连接的往返时延
+        
+        活动连接连续 MATTER_HEALTH_MAX_FAILURES 次无响应或时延过高时，
+        切换到热备连接；没有可用的热备连接时关闭当前连接，由监督任务重连。
+        """
+        while True:
+            await asyncio.sleep(WS_PING_INTERVAL)
+            await self._check_standby()
+            
+            if not self.connected:
+                continue
+            rtt_ms = await probe_rtt(self.websocket)
+            if self.health.record("active", self.ws_url, rtt_ms):
+                self._active_failures = 0
+                continue
+            
+            self._active_failures += 1
+            logger.warning("Matter Server %s 健康检查失败 (%d/%d)，往返时延: %s",
+                           self.ws_url, self._active_failures, MATTER_HEALTH_MAX_FAILURES, rtt_ms)
+            if self._active_failures < MATTER_HEALTH_MAX_FAILURES:
+                continue
+            self._active_failures = 0
+            if not await self._failover("健康检查连续失败"):
+                logger.warning("没有可用的备用服务器，关闭连接后重连")
+                await self.websocket.close()
+    
+    async def _check_standby(self):
+        """建立或探测热备连接"""
+        if not self.standby_url:
+            return
+        if self._standby is None or not self._standby.synced:
+            if self._standby is not None:
+                await self._standby.close()
+            standby = StandbyConnection(self.standby_url, retain=NODE_RETAIN_ATTRIBUTES)
+            self._standby = standby if await standby.open() else None
+            return
+        rtt_ms = await probe_rtt(self._standby.websocket)
+        self._standby.healthy = self.health.record("standby", self._standby.ws_url, rtt_ms)
+    
+    async def _failover(self, reason):
+        """将已就绪的热备连接提升为活动连接，原服务器随后作为新的备用服务器
+        
+        Args:
+            reason: 故障切换原因
+            
+        Returns:
+            bool: 是否完成切换（没有已就绪的热备连接时返回False）
+        """
+        standby = self._standby
+        if standby is None or not standby.ready:
             return False
+        self._standby = None
+        logger.warning("Matter Server故障切换: %s -> %s，原因: %s", self.ws_url, standby.ws_url, reason)
+        
+        websocket, nodes = await standby.detach()
+        previous = self.websocket if self.connected else None
+        self.standby_url = self.ws_url
+        self.websocket = websocket
+        self.ws_url = standby.ws_url
+        self._reader_task = asyncio.create_task(self._receive_messages(websocket))
+        self._start_workers()
+        self.connected = True
+        self.failovers += 1
+        self._active_failures = 0
+        # 热备连接的节点数据是最新的，只需与缓存对比并通知变化
+        await self._process_nodes_list(nodes)
+        if previous is not None:
+            asyncio.create_task(self._drain(previous))
+        return True
+    
+    def get_health(self):
+        """获取连接健康状态和健康检查历史
+        
+        Returns:
+            dict: 活动服务器、备用服务器状态、故障切换次数和探测记录
+        """
+        return {
+            "server": self.ws_url,
+            "connected": self.connected,
+            "standby": self.standby_url,
+            "standby_ready": self._standby is not None and self._standby.ready,
+            "consecutive_failures": self._active_failures,
+            "failovers": self.failovers,
+            "history": self.health.to_list(),
+        }
     
     async def disconnect(self):
         """断开与Matter Server的连接"""
@@ -63,89 +387,167 @@ class MatterClient:
             logger.info("正在断开与Matter Server的连接")
             await self.websocket.close()
             self.connected = False
+            self._fail_pending("已断开与Matter Server的连接", self.websocket)
+            await self._stop_workers()
             logger.info("已断开与Matter Server的连接")
     
-    async def _receive_messages(self):
-        """接收来自Matter Server的消息"""
+    def _start_workers(self):
+        """启动消息处理任务"""
+        self._workers = [worker for worker in self._workers if not worker.done()]
+        while len(self._workers) < MATTER_INBOUND_WORKERS:
+            self._workers.append(asyncio.create_task(self._process_inbound()))
+    
+    async def _stop_workers(self):
+        """停止消息处理任务"""
+        workers, self._workers = self._workers, []
+        for worker in workers:
+            worker.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+    
+    async def _receive_messages(self, websocket):
+        """接收来自Matter Server的消息
+        
+        只负责读取和解析：等待中的请求响应直接在此完成，
+        其他消息按优先级放入有界队列交给处理任务，队列满时暂停读取。
+        
+        Args:
+            websocket: 要读取的WebSocket连接
+        """
         try:
             logger.info("开始接收Matter Server消息")
-            while self.connected:
-                message = await self.websocket.recv()
-                logger.debug("收到Matter Server消息: %s", message)
-                await self._process_message(message)
+            while True:
+                message = await websocket.recv()
+                received_at = time.monotonic()
+                self.metrics["received"] += 1
+                log_traffic("recv", None, message)
+                
+                try:
+                    data = json.loads(message)
+                except json.JSONDecodeError:
+                    logger.error("无效的JSON消息: %s", LazyText(message))
+                    continue
+                
+                # 命令响应优先：直接唤醒等待中的请求，不进入队列
+                message_id = data.get("message_id")
+                if message_id is not None and message_id in self._pending:
+                    future, _ = self._pending.pop(message_id)
+                    if not future.done():
+                        future.set_result(data)
+                    continue
+                
+                # start_listening响应与事件同一优先级，保证与后续事件的先后顺序
+                if message_id is not None and message_id in self._listens:
+                    priority = PRIORITY_EVENT
+                elif message_id is not None:
+                    priority = PRIORITY_RESPONSE
+                elif "event" in data:
+                    priority = PRIORITY_EVENT
+                else:
+                    priority = PRIORITY_BULK
+                await self._inbound.put((priority, next(self._inbound_seq), received_at, websocket, data))
+                depth = self._inbound.qsize()
+                if depth > self.metrics["max_queue_depth"]:
+                    self.metrics["max_queue_depth"] = depth
         except websockets.exceptions.ConnectionClosed:
-            logger.warning("与Matter Server的连接已关闭")
-            self.connected = False
+            if websocket is self.websocket:
+                logger.warning("与Matter Server的连接已关闭")
         except Exception as e:
             logger.error("接收消息时出错: %s", str(e), exc_info=True)
-            self.connected = False
+        finally:
+            # 只有活动连接断开才影响客户端状态，被替换下来的旧连接直接丢弃
+            if websocket is self.websocket:
+                self.connected = False
+            self._fail_pending("与Matter Server的连接已关闭", websocket)
+    
+    async def _process_inbound(self):
+        """消息处理任务：按优先级从队列中取出消息并处理，同时记录排队时延"""
+        while True:
+            _, _, received_at, websocket, data = await self._inbound.get()
+            lag_ms = (time.monotonic() - received_at) * 1000
+            metrics = self.metrics
+            metrics["last_lag_ms"] = lag_ms
+            metrics["avg_lag_ms"] = metrics["avg_lag_ms"] * 0.9 + lag_ms * 0.1
+            if lag_ms > metrics["max_lag_ms"]:
+                metrics["max_lag_ms"] = lag_ms
+            try:
+                await self._process_message(websocket, data)
+            finally:
+                metrics["processed"] += 1
+                self._inbound.task_done()
     
-    async def _process_message(self, message):
+    async def _process_message(self, websocket, data):
         """处理接收到的消息
         
         Args:
-            message: 接收到的WebSocket消息
+            websocket: 收到消息的WebSocket连接
+            data: 已解析的Matter Server消息
         """
         try:
-            data = json.loads(message)
+            message_id = data.get("message_id")
             
-            # 打印完整的接收消息
-            logger.info("处理Matter Server消息: %s", json.dumps(data, indent=2, ensure_ascii=False))
+            # 处理start_listening响应，同步节点列表并切换活动连接
+            if message_id is not None and message_id in self._listens:
+                await self._activate(websocket, data)
             
-            # 处理节点列表响应
-            if "message_id" in data and data.get("message_id") == "client" and "result" in data:
-                logger.info("收到节点列表响应，共 %d 个节点", len(data["result"]))
-                await self._process_nodes_list(data["result"])
-                logger.info("已处理节点列表数据")
+            # 忽略非活动连接（已被替换或尚未完成同步）上的消息
+            elif websocket is not self.websocket:
+                logger.debug("忽略非活动连接上的消息")
+            
+            # 处理增量事件
+            elif "event" in data:
+                handler = self._event_handlers.get(data["event"])
+                if handler:
+                    await handler(data.get("data"))
+                else:
+                    logger.debug("忽略Matter Server事件: %s", data["event"])
             
             # 处理设备状态更新
             elif "device_status" in data:
-                logger.info("收到设备状态更新: %s", json.dumps(data["device_status"], ensure_ascii=False))
+                logger.info("收到设备状态更新: %s", LazyJson(data["device_status"]))
                 self.device_status = data["device_status"]
-                # 调用所有状态回调函数
-                for callback in self.status_callbacks:
-                    await callback(self.device_status)
+                # 通知所有状态回调函数
+                self.status_callbacks.publish("device_status", self.device_status)
             
-            # 处理命令响应
-            elif "message_id" in data and data.get("message_id").startswith("cmd_"):
-                logger.info("收到命令响应: %s", json.dumps(data, indent=2, ensure_ascii=False))
+            # 已超时或已取消的请求的迟到响应
+            elif message_id is not None:
+                logger.warning("收到未知或已超时请求的响应: %s", message_id)
             
             # 其他类型的消息
             else:
-                logger.info("收到其他类型消息: %s", json.dumps(data, indent=2, ensure_ascii=False))
+                logger.debug("收到其他类型消息: %s", LazyJson(data))
                 
-        except json.JSONDecodeError:
-            logger.error("无效的JSON消息: %s", message)
         except Exception as e:
             logger.error("处理消息时出错: %s", str(e), exc_info=True)
     
     async def _process_nodes_list(self, nodes_data):
         """处理节点列表数据
         
+        将完整的节点列表与已缓存的节点存储进行对比，只通知发生变化的节点，
+        重连后不会把未变化的状态重新推送给下游。
+        
         Args:
             nodes_data: 节点列表数据
         """
-        # 清空现有节点数据
-        self.nodes = {}
+        previous_status = self.device_status
+        seen = set()
+        changed = 0
         
         # 处理每个节点
         for node in nodes_data:
             node_id = node.get("node_id")
             if node_id is not None:
-                self.nodes[str(node_id)] = node
-                logger.info("处理节点 %s: available=%s", node_id, node.get("available", False))
+                is_new = node_id not in self.nodes
+                changes, removed, fields = self.nodes.put(node)
+                seen.add(str(node_id))
+                logger.debug("处理节点 %s: available=%s", node_id, node.get("available", False))
+                if changes or removed or fields:
+                    changed += 1
+                    self._notify_node_change(str(node_id), "node_added" if is_new else "node_updated",
+                                             changes, removed, fields)
                 
                 # 如果节点可用，更新设备状态
                 if node.get("available", False):
-                    # 尝试从节点属性中获取操作状态
-                    operational_state = "未知"
-                    attributes = node.get("attributes", {})
-                    if "1/97/4" in attributes:
-                        try:
-                            operational_state = attributes["1/97/4"]
-                            logger.info("从节点 %s 获取到操作状态: %s", node_id, operational_state)
-                        except Exception as e:
-                            logger.error("获取操作状态时出错: %s", str(e))
+                    operational_state = self.nodes.get(node_id).get_attribute(OPERATIONAL_STATE, "未知")
                     
                     # 更新设备状态
                     self.device_status = {
@@ -153,61 +555,232 @@ class MatterClient:
                         "operational_state": operational_state,
                         "battery_level": 0,
                     }
-                    logger.info("节点 %s 可用，更新设备状态: %s", node_id, json.dumps(self.device_status, ensure_ascii=False))
+                    logger.debug("节点 %s 可用，更新设备状态: %s", node_id, LazyJson(self.device_status))
+        
+        # 移除快照中已不存在的节点
+        stale = [node_id for node_id in self.nodes if node_id not in seen]
+        for node_id in stale:
+            self.nodes.remove(node_id)
+            self._notify_node_change(node_id, "node_removed")
         
-        # 调用所有状态回调函数
-        for callback in self.status_callbacks:
-            await callback(self.device_status)
+        logger.info("节点列表同步完成: 共 %d 个节点，%d 个发生变化，%d 个已移除",
+                    len(seen), changed, len(stale))
+        
+        # 设备状态变化时通知所有状态回调函数
+        if self.device_status != previous_status:
+            self.status_callbacks.publish("device_status", self.device_status)
     
-    async def start_listening(self):
-        """发送开始监听命令到Matter Server"""
-        if not self.connected:
-            logger.error("未连接到Matter Server，无法发送监听命令")
-            return False
+    def _next_message_id(self, prefix="cmd"):
+        """生成新的消息ID
+        
+        Args:
+            prefix: 消息ID前缀
+            
+        Returns:
+            str: 唯一的消息ID
+        """
+        self.message_id_counter += 1
+        return f"{prefix}_{self.message_id_counter}"
+    
+    def _fail_pending(self, reason, websocket):
+        """使指定连接上所有等待中的请求失败
         
+        Args:
+            reason: 失败原因
+            websocket: 发送请求的WebSocket连接
+        """
+        pending = [message_id for message_id, (_, ws) in self._pending.items() if ws is websocket]
+        for message_id in pending:
+            future, _ = self._pending.pop(message_id)
+            if not future.done():
+                future.set_exception(ConnectionError(reason))
+        if pending:
+            logger.warning("%d 个等待中的请求已失败: %s", len(pending), reason)
+    
+    async def _request(self, message_id, message, timeout):
+        """发送请求并等待对应message_id的响应
+        
+        多个请求可以同时在同一个WebSocket连接上等待响应，
+        响应到达顺序不必与发送顺序一致。
+        
+        Args:
+            message_id: 消息ID
+            message: 要发送的消息
+            timeout: 等待响应的超时时间（秒）
+            
+        Returns:
+            dict: Matter Server的响应消息
+            
+        Raises:
+            asyncio.TimeoutError: 等待响应超时
+            ConnectionError: 连接断开
+        """
+        websocket = self.websocket
+        future = asyncio.get_running_loop().create_future()
+        self._pending[message_id] = (future, websocket)
         try:
-            message = {
-                "message_id": "client",
-                "command": "start_listening"
-            }
             message_str = json.dumps(message)
-            logger.info("发送监听命令到Matter Server: %s", message_str)
-            await self.websocket.send(message_str)
-            logger.info("监听命令已发送")
-            return True
-        except Exception as e:
-            logger.error("发送监听命令失败: %s", str(e), exc_info=True)
-            return False
+            log_traffic("send", message_id, message_str)
+            await websocket.send(message_str)
+            return await asyncio.wait_for(future, timeout)
+        finally:
+            # 超时、取消或发送失败时移除请求，迟到的响应将被忽略
+            self._pending.pop(message_id, None)
+    
+    async def _on_attribute_updated(self, data):
+        """处理attribute_updated事件，原地更新单个属性
+        
+        Args:
+            data: 事件数据，格式为 [node_id, "endpoint/cluster/attribute", value]
+        """
+        node_id, path, value = data
+        node = self.nodes.get(node_id)
+        if node is None:
+            logger.warning("收到未知节点 %s 的属性更新: %s", node_id, path)
+            return
+        
+        if not self.nodes.set_attribute(node_id, path, value):
+            return
+        logger.debug("节点 %s 属性更新: %s = %s", node_id, path, value)
+        
+        self._notify_node_change(str(node_id), "attribute_updated", changes={path: value})
+        if path == OPERATIONAL_STATE and node.available:
+            self._update_operational_state(value)
+    
+    async def _on_node_added(self, node):
+        """处理node_added事件
+        
+        Args:
+            node: 新节点的完整数据
+        """
+        await self._apply_node(node, "node_added")
+    
+    async def _on_node_updated(self, node):
+        """处理node_updated事件（包括可用性变化），只通知发生变化的部分
+        
+        Args:
+            node: 节点的完整数据
+        """
+        await self._apply_node(node, "node_updated")
+    
+    async def _on_node_removed(self, node_id):
+        """处理node_removed事件
+        
+        Args:
+            node_id: 被移除的节点ID
+        """
+        if self.nodes.remove(node_id) is None:
+            return
+        logger.info("节点 %s 已移除", node_id)
+        self._notify_node_change(str(node_id), "node_removed")
+    
+    async def _apply_node(self, node, event):
+        """用完整节点数据替换存储中的节点，并计算与旧数据的差异
+        
+        Args:
+            node: 节点的完整数据
+            event: 触发更新的事件名称
+        """
+        node_id = str(node.get("node_id"))
+        changes, removed, fields = self.nodes.put(node)
+        if not (changes or removed or fields):
+            return
+        
+        logger.info("节点 %s 已更新 (%s): %d 个属性变化, available=%s",
+                    node_id, event, len(changes) + len(removed), node.get("available", False))
+        self._notify_node_change(node_id, event, changes, removed, fields)
+        if OPERATIONAL_STATE in changes and node.get("available", False):
+            self._update_operational_state(changes[OPERATIONAL_STATE])
     
-    async def send_command(self, command, params=None):
-        """向Matter Server发送命令
+    def _update_operational_state(self, operational_state):
+        """更新设备操作状态并通知状态回调函数
+        
+        Args:
+            operational_state: 新的操作状态
+        """
+        self.device_status = dict(self.device_status, operational_state=operational_state)
+        self.status_callbacks.publish("device_status", self.device_status)
+    
+    def _notify_node_change(self, node_id, event, changes=None, removed=None, fields=None):
+        """通知节点回调函数某个节点发生的变化
+        
+        Args:
+            node_id: 节点ID
+            event: 事件名称
+            changes: 发生变化的属性，路径 -> 新值
+            removed: 被删除的属性路径列表
+            fields: 发生变化的节点字段（如available）
+        """
+        change = {
+            "node_id": node_id,
+            "event": event,
+            "changes": changes or {},
+            "removed": removed or [],
+            "fields": fields or {},
+        }
+        self.node_callbacks.publish(node_id, change)
+    
+    def _resync_change(self):
+        """生成重新同步消息：订阅者错过了部分节点变化，需要从get_all_nodes()重新读取所有节点
+        
+        Returns:
+            dict: node_id为None、event为"resync"的节点变化
+        """
+        return {"node_id": None, "event": "resync", "changes": {}, "removed": [], "fields": {}}
+    
+    async def send_command(self, command, params=None, timeout=None):
+        """向Matter Server发送命令并等待执行结果
+        
+        可以并发调用，多个命令在同一连接上流水线发送，按message_id匹配响应。
+        如果从其他事件循环调用，命令会被转交到连接所在的事件循环执行。
         
         Args:
             command: 命令名称
             params: 命令参数
+            timeout: 等待响应的超时时间（秒），默认使用配置中的MATTER_COMMAND_TIMEOUT
             
         Returns:
-            bool: 命令是否发送成功
+            dict: 命令执行结果，包含success、message_id、result、error_code、details、latency_ms
         """
+        if self.loop is not None and asyncio.get_running_loop() is not self.loop:
+            future = asyncio.run_coroutine_threadsafe(
+                self.send_command(command, params, timeout), self.loop)
+            return await asyncio.wrap_future(future)
+        
         if not self.connected:
             logger.error("未连接到Matter Server，无法发送命令")
-            return False
+            return _command_result(None, False, details="未连接到Matter Server")
+        
+        timeout = timeout or MATTER_COMMAND_TIMEOUT
+        message_id = self._next_message_id()
+        message = {
+            "message_id": message_id,
+            "command": command,
+            "params": params or {}
+        }
+        logger.info("发送命令到Matter Server: %s %s, 参数: %s", message_id, command, LazyJson(params or {}))
         
+        start = time.monotonic()
         try:
-            self.message_id_counter += 1
-            message = {
-                "message_id": f"cmd_{self.message_id_counter}",
-                "command": command,
-                "params": params or {}
-            }
-            message_str = json.dumps(message)
-            logger.info("发送命令到Matter Server: %s", message_str)
-            await self.websocket.send(message_str)
-            logger.info("命令已发送: %s, 参数: %s", command, json.dumps(params or {}, ensure_ascii=False))
-            return True
+            response = await self._request(message_id, message, timeout)
+        except asyncio.TimeoutError:
+            logger.error("命令 %s 等待响应超时 (%s秒)", message_id, timeout)
+            return _command_result(message_id, False, error_code="timeout",
+                                   details=f"等待响应超时 ({timeout}秒)")
         except Exception as e:
             logger.error("发送命令失败: %s", str(e), exc_info=True)
-            return False
+            return _command_result(message_id, False, details=str(e))
+        
+        latency_ms = round((time.monotonic() - start) * 1000, 2)
+        if "error_code" in response:
+            logger.warning("命令 %s 执行失败 (%.2fms): %s %s", message_id, latency_ms,
+                           response.get("error_code"), response.get("details"))
+            return _command_result(message_id, False, latency_ms,
+                                   error_code=response.get("error_code"),
+                                   details=response.get("details"))
+        
+        logger.info("命令 %s 执行成功 (%.2fms)", message_id, latency_ms)
+        return _command_result(message_id, True, latency_ms, result=response.get("result"))
     
     def register_status_callback(self, callback):
         """注册设备状态更新回调函数
@@ -215,8 +788,7 @@ class MatterClient:
         Args:
             callback: 回调函数，接收设备状态作为参数
         """
-        if callback not in self.status_callbacks:
-            self.status_callbacks.append(callback)
+        if self.status_callbacks.register(callback):
             logger.debug("已注册状态回调函数，当前回调函数数量: %d", len(self.status_callbacks))
     
     def unregister_status_callback(self, callback):
@@ -225,10 +797,45 @@ class MatterClient:
         Args:
             callback: 要取消的回调函数
         """
-        if callback in self.status_callbacks:
-            self.status_callbacks.remove(callback)
+        if self.status_callbacks.unregister(callback):
             logger.debug("已取消注册状态回调函数，当前回调函数数量: %d", len(self.status_callbacks))
     
+    def register_node_callback(self, callback):
+        """注册节点变化回调函数
+        
+        Args:
+            callback: 回调函数，接收节点变化字典作为参数，
+                      包含node_id、event、changes、removed、fields；
+                      event为"resync"（node_id为None）时应重新读取所有节点
+        """
+        if self.node_callbacks.register(callback):
+            logger.debug("已注册节点回调函数，当前回调函数数量: %d", len(self.node_callbacks))
+    
+    def unregister_node_callback(self, callback):
+        """取消注册节点变化回调函数
+        
+        Args:
+            callback: 要取消的回调函数
+        """
+        if self.node_callbacks.unregister(callback):
+            logger.debug("已取消注册节点回调函数，当前回调函数数量: %d", len(self.node_callbacks))
+    
+    def get_metrics(self):
+        """获取消息接收与处理的统计指标
+        
+        Returns:
+            dict: 包括队列深度、排队时延（毫秒）、等待中的请求数量、节点存储的内存占用和各回调订阅者的分发统计
+        """
+        metrics = dict(self.metrics)
+        metrics["queue_depth"] = self._inbound.qsize()
+        metrics["pending_requests"] = len(self._pending)
+        metrics["node_store"] = self.nodes.memory_stats()
+        metrics["subscribers"] = {
+            "status": self.status_callbacks.stats(),
+            "node": self.node_callbacks.stats(),
+        }
+        return metrics
+    
     def get_device_status(self):
         """获取当前设备状态
         
@@ -244,9 +851,9 @@ class MatterClient:
             node_id: 节点ID
             
         Returns:
-            dict: 节点信息，如果节点不存在则返回None
+            MatterNode: 节点信息，如果节点不存在则返回None
         """
-        node_info = self.nodes.get(str(node_id))
+        node_info = self.nodes.get(node_id)
         if node_info:
             logger.debug("获取节点 %s 信息成功", node_id)
         else:
@@ -257,7 +864,66 @@ class MatterClient:
         """获取所有节点信息
         
         Returns:
-            dict: 所有节点信息
+            NodeStore: 所有节点信息
         """
         logger.debug("获取所有节点信息，共 %d 个节点", len(self.nodes))
-        return self.nodes 
\ No newline at end of file
+        return self.nodes
+
+
+def merge_node_changes(old, new):
+    """合并同一节点尚未分发的两次变化
+    
+    订阅者尚未收到较早的变化，因此合并结果保留节点新增的语义：
+    较早的变化为node_added时合并后仍为node_added；节点被移除后又重新出现时作为node_added分发。
+    
+    Args:
+        old: 较早的节点变化
+        new: 较新的节点变化
+        
+    Returns:
+        dict: 合并后的节点变化
+    """
+    if new["event"] == "node_removed":
+        return new
+    if old["event"] == "node_removed":
+        # 移除后重新加入：订阅者应看到节点新增，而不是移除之前节点上的增量
+        return dict(new, event="node_added")
+    changes = dict(old["changes"])
+    changes.update(new["changes"])
+    for path in new["removed"]:
+        changes.pop(path, None)
+    removed = [path for path in old["removed"] if path not in new["changes"]]
+    removed.extend(path for path in new["removed"] if path not in removed)
+    fields = dict(old["fields"])
+    fields.update(new["fields"])
+    return {
+        "node_id": new["node_id"],
+        "event": "node_added" if old["event"] == "node_added" else new["event"],
+        "changes": changes,
+        "removed": removed,
+        "fields": fields,
+    }
+
+
+def _command_result(message_id, success, latency_ms=None, result=None, error_code=None, details=None):
+    """构造命令执行结果
+    
+    Args:
+        message_id: 命令的消息ID
+        success: 命令是否执行成功
+        latency_ms: 命令往返时延（毫秒）
+        result: Matter Server返回的结果
+        error_code: 错误码
+        details: 错误详情
+        
+    Returns:
+        dict: 命令执行结果
+    """
+    return {
+        "success": success,
+        "message_id": message_id,
+        "result": result,
+        "error_code": error_code,
+        "details": details,
+        "latency_ms": latency_ms,
+    }
@@ -0,0 +1,186 @@
+"""
+Matter Server连接健康检查
+主动探测往返时延，并维护到备用Matter Server的热备连接
+"""
+
+import json
+import time
+import asyncio
+import logging
+from collections import deque
+import websockets
+from config import (MATTER_HEALTH_TIMEOUT, MATTER_HEALTH_MAX_RTT_MS, MATTER_HEALTH_HISTORY_SIZE,
+                    MATTER_LISTEN_TIMEOUT)
+from node_store import NodeStore
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+
+async def probe_rtt(websocket):
+    """通过WebSocket ping/pong测量往返时延
+
+    Args:
+        websocket: WebSocket连接
+
+    Returns:
+        float: 往返时延（毫秒），超时或连接异常时返回None
+    """
+    try:
+        start = time.monotonic()
+        pong_waiter = await websocket.ping()
+        await asyncio.wait_for(pong_waiter, MATTER_HEALTH_TIMEOUT)
+        return (time.monotonic() - start) * 1000
+    except Exception:
+        return None
+
+
+class HealthHistory:
+    """健康检查历史记录"""
+
+    def __init__(self, maxlen=None):
+        self.records = deque(maxlen=maxlen or MATTER_HEALTH_HISTORY_SIZE)
+
+    def record(self, role, ws_url, rtt_ms):
+        """记录一次探测结果
+
+        Args:
+            role: 连接角色，"active" 或 "standby"
+            ws_url: 服务器地址
+            rtt_ms: 往返时延（毫秒），探测失败时为None
+
+        Returns:
+            bool: 本次探测是否健康（有响应且时延不超过MATTER_HEALTH_MAX_RTT_MS）
+        """
+        healthy = rtt_ms is not None and rtt_ms <= MATTER_HEALTH_MAX_RTT_MS
+        self.records.append({
+            "time": time.time(),
+            "role": role,
+            "server": ws_url,
+            "rtt_ms": None if rtt_ms is None else round(rtt_ms, 2),
+            "healthy": healthy,
+        })
+        return healthy
+
+    def to_list(self):
+        return list(self.records)
+
+
+def apply_event(nodes, event, data):
+    """将Matter Server事件应用到节点存储
+
+    Args:
+        nodes: 节点存储（NodeStore）
+        event: 事件名称
+        data: 事件数据
+    """
+    if event == "attribute_updated":
+        node_id, path, value = data
+        nodes.set_attribute(node_id, path, value)
+    elif event in ("node_added", "node_updated"):
+        nodes.put(data)
+    elif event == "node_removed":
+        nodes.remove(data)
+
+
+class StandbyConnection:
+    """到备用Matter Server的热备连接
+
+    保持监听并持续应用事件，使节点数据始终是最新的，
+    故障切换时可以直接提升为活动连接而无需重新下载节点列表。
+    """
+
+    def __init__(self, ws_url, retain=None):
+        """初始化热备连接
+
+        Args:
+            ws_url: 备用服务器地址
+            retain: 属性保留规则，与活动连接的节点存储相同
+        """
+        self.ws_url = ws_url
+        self.retain = retain
+        self.websocket = None
+        self.nodes = NodeStore(retain=retain)
+        self.synced = False
+        self.healthy = False
+        self._reader_task = None
+
+    @property
+    def ready(self):
+        """是否可以提升为活动连接"""
+        return self.synced and self.healthy and self._reader_task is not None \
+            and not self._reader_task.done()
+
+    async def open(self):
+        """连接备用服务器并同步节点列表
+
+        Returns:
+            bool: 是否连接并同步成功
+        """
+        try:
+            self.websocket = await websockets.connect(self.ws_url)
+            synced = asyncio.get_running_loop().create_future()
+            self._reader_task = asyncio.create_task(self._receive_messages(synced))
+            await self.websocket.send(json.dumps({"message_id": "standby", "command": "start_listening"}))
+            await asyncio.wait_for(synced, MATTER_LISTEN_TIMEOUT)
+            self.synced = self.healthy = True
+            logger.info("备用Matter Server已就绪: %s，共 %d 个节点", self.ws_url, len(self.nodes))
+            return True
+        except Exception as e:
+            logger.warning("连接备用Matter Server %s 失败: %s", self.ws_url, str(e))
+            await self.close()
+            return False
+
+    async def detach(self):
+        """停止读取消息，交出WebSocket连接和节点数据用于提升为活动连接
+
+        Returns:
+            tuple: (WebSocket连接, Matter Server格式的节点列表，只包含保留的属性)
+        """
+        self._reader_task.cancel()
+        await asyncio.gather(self._reader_task, return_exceptions=True)
+        return self.websocket, [node.to_dict() for _, node in self.nodes.items()]
+
+    async def close(self):
+        """关闭热备连接"""
+        self.synced = self.healthy = False
+        if self._reader_task:
+            self._reader_task.cancel()
+            await asyncio.gather(self._reader_task, return_exceptions=True)
+        if self.websocket:
+            await self.websocket.close()
+
+    async def _receive_messages(self, synced):
+        """读取备用服务器的消息并应用到节点数据
+
+        Args:
+            synced: 收到节点列表后设置结果的Future
+        """
+        try:
+            async for message in self.websocket:
+                try:
+                    self._apply_message(json.loads(message), synced)
+                except Exception as e:
+                    # 单条无效消息不影响后续消息
+                    logger.warning("备用Matter Server的消息无法处理，已忽略: %s", str(e))
+        except Exception as e:
+            logger.warning("备用Matter Server连接出错: %s", str(e))
+        finally:
+            self.synced = self.healthy = False
+
+    def _apply_message(self, data, synced):
+        """应用备用服务器的一条消息
+
+        Args:
+            data: 解析后的消息
+            synced: 收到节点列表后设置结果的Future
+        """
+        if data.get("message_id") == "standby" and "result" in data:
+            nodes = NodeStore(retain=self.retain)
+            for node in data["result"]:
+                nodes.put(node)
+            self.nodes = nodes
+            if not synced.done():
+                synced.set_result(True)
+        elif "event" in data:
+            apply_event(self.nodes, data["event"], data.get("data"))
@@ -0,0 +1,177 @@
+"""
+Matter通信日志
+延迟格式化、可采样、可截断的报文日志，通过队列在后台线程写入日志文件
+"""
+
+import os
+import copy
+import json
+import queue
+import logging
+import itertools
+from logging.handlers import QueueHandler, QueueListener
+from config import (MATTER_LOG_FILE, MATTER_LOG_MAX_CHARS, MATTER_LOG_SAMPLE_RATE,
+                    MATTER_LOG_QUEUE_SIZE, MATTER_LOG_TRAFFIC)
+
+# 报文日志专用的日志记录器，每条记录包含方向、消息ID、大小和报文内容；
+# 级别独立于Matter客户端日志，只有启用MATTER_LOG_TRAFFIC时才为DEBUG
+traffic_logger = logging.getLogger("matter_client.traffic")
+traffic_logger.setLevel(logging.DEBUG if MATTER_LOG_TRAFFIC else logging.INFO)
+
+LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+
+def _truncate(text, max_chars):
+    """截断过长的文本
+
+    Args:
+        text: 原始文本
+        max_chars: 最大字符数，0表示不截断
+
+    Returns:
+        str: 截断后的文本
+    """
+    if max_chars and len(text) > max_chars:
+        return f"{text[:max_chars]}...(已截断，共 {len(text)} 字符)"
+    return text
+
+
+class LazyText:
+    """延迟截断的文本，只有在日志记录真正被输出时才会生成字符串"""
+
+    __slots__ = ("text", "max_chars")
+
+    def __init__(self, text, max_chars=None):
+        self.text = text
+        self.max_chars = MATTER_LOG_MAX_CHARS if max_chars is None else max_chars
+
+    def __str__(self):
+        return _truncate(self.text, self.max_chars)
+
+
+class LazyJson:
+    """延迟序列化的JSON，只有在日志记录真正被输出时才会调用json.dumps"""
+
+    __slots__ = ("obj", "max_chars")
+
+    def __init__(self, obj, max_chars=None):
+        self.obj = obj
+        self.max_chars = MATTER_LOG_MAX_CHARS if max_chars is None else max_chars
+
+    def freeze(self):
+        """复制对象，后台线程格式化时不受调用方之后修改的影响
+
+        在日志记录被接受、放入队列之前调用；无法复制的对象立即序列化。
+        """
+        try:
+            self.obj = copy.deepcopy(self.obj)
+        except Exception:
+            self.obj = json.loads(json.dumps(self.obj, default=str))
+
+    def __str__(self):
+        return _truncate(json.dumps(self.obj, ensure_ascii=False, default=str), self.max_chars)
+
+
+class SampleFilter(logging.Filter):
+    """按比例采样日志记录，每 rate 条保留1条"""
+
+    def __init__(self, rate):
+        super().__init__()
+        self.rate = max(1, int(rate))
+        self._counter = itertools.count()
+
+    def filter(self, record):
+        return next(self._counter) % self.rate == 0
+
+
+class MatterQueueHandler(QueueHandler):
+    """不在调用线程中格式化日志的队列处理器
+
+    标准QueueHandler会在入队前格式化消息，这里保留原始参数，
+    由QueueListener所在的后台线程完成格式化。参数中的LazyJson在入队前复制，
+    避免后台线程格式化时对象已被修改。队列已满时丢弃记录并计数。
+    """
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        if isinstance(record.args, tuple):
+            for arg in record.args:
+                if isinstance(arg, LazyJson):
+                    arg.freeze()
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def log_traffic(direction, message_id, payload, size=None):
+    """记录一条Matter报文
+
+    未启用MATTER_LOG_TRAFFIC时直接返回，不生成日志记录；
+    未被采样时不做任何格式化或序列化。
+
+    Args:
+        direction: 方向，"recv" 或 "send"
+        message_id: 消息ID或事件名称
+        payload: 报文内容，原始字符串或可序列化对象
+        size: 报文大小（字符数），默认从字符串报文计算
+    """
+    if not traffic_logger.isEnabledFor(logging.DEBUG):
+        return
+    if isinstance(payload, str):
+        size = len(payload) if size is None else size
+        payload = LazyText(payload)
+    else:
+        payload = LazyJson(payload)
+    traffic_logger.debug("%s id=%s size=%s payload=%s", direction, message_id, size, payload)
+
+
+def setup_matter_logging(logger_name="matter_client"):
+    """配置Matter通信日志
+
+    Matter客户端的日志通过有界队列交给后台线程，由后台线程完成格式化并写入
+    MATTER_LOG_FILE（DEBUG级别）和控制台（INFO级别）；报文日志只有在启用
+    MATTER_LOG_TRAFFIC时才会记录。
+
+    Args:
+        logger_name: Matter客户端日志记录器名称
+
+    Returns:
+        QueueListener: 已启动的日志监听器，关闭应用时应调用stop()
+    """
+    log_dir = os.path.dirname(MATTER_LOG_FILE)
+    if log_dir and not os.path.exists(log_dir):
+        os.makedirs(log_dir)
+
+    formatter = logging.Formatter(LOG_FORMAT)
+
+    # 添加文件处理器，将通信日志保存到文件
+    file_handler = logging.FileHandler(MATTER_LOG_FILE)
+    file_handler.setLevel(logging.DEBUG)
+    file_handler.setFormatter(formatter)
+
+    # 添加控制台处理器，在控制台显示通信日志
+    console_handler = logging.StreamHandler()
+    console_handler.setLevel(logging.INFO)
+    console_handler.setFormatter(formatter)
+
+    log_queue = queue.Queue(MATTER_LOG_QUEUE_SIZE)
+    listener = QueueListener(log_queue, file_handler, console_handler, respect_handler_level=True)
+    listener.start()
+
+    matter_logger = logging.getLogger(logger_name)
+    matter_logger.setLevel(logging.DEBUG)
+    matter_logger.addHandler(MatterQueueHandler(log_queue))
+    # 不再传播到根日志记录器，避免在事件循环中重复格式化
+    matter_logger.propagate = False
+
+    if MATTER_LOG_SAMPLE_RATE > 1:
+        traffic_logger.addFilter(SampleFilter(MATTER_LOG_SAMPLE_RATE))
+
+    return listener
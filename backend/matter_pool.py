@@ -0,0 +1,313 @@
+"""
+Matter客户端连接池
+同时连接多个Matter Server，将各服务器的节点合并到统一的命名空间中
+"""
+
+import asyncio
+import logging
+from config import MATTER_SERVERS, MATTER_STANDBY_SERVERS
+from matter_client import MatterClient
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+# 合并命名空间中节点ID的格式：<服务器名称>:<节点ID>
+NODE_ID_SEPARATOR = ":"
+
+
+class MergedNodeStore:
+    """多个Matter Server节点存储的合并只读视图，节点ID带服务器名称限定"""
+
+    def __init__(self, pool):
+        self._pool = pool
+
+    def __len__(self):
+        return sum(len(client.nodes) for client in self._pool.clients.values())
+
+    def __contains__(self, node_ref):
+        return self.get(node_ref) is not None
+
+    def __iter__(self):
+        return (node_id for node_id, _ in self.items())
+
+    def items(self):
+        """遍历所有服务器的节点
+
+        Yields:
+            (node_id, MatterNode): 限定后的节点ID和节点
+        """
+        for name, client in self._pool.clients.items():
+            for node_id, node in client.nodes.items():
+                yield self._pool.qualify(name, node_id), node
+
+    def get(self, node_ref):
+        """获取节点
+
+        Args:
+            node_ref: 限定的节点ID（<服务器>:<节点ID>）或未限定的节点ID
+
+        Returns:
+            MatterNode: 节点，不存在则返回None
+        """
+        resolved = self._pool.resolve(node_ref)
+        if resolved is None:
+            return None
+        name, node_id = resolved
+        return self._pool.clients[name].nodes.get(node_id)
+
+    def owner(self, node_ref):
+        """获取节点所属的服务器名称
+
+        Args:
+            node_ref: 节点ID
+
+        Returns:
+            str: 服务器名称，节点不存在则返回None
+        """
+        resolved = self._pool.resolve(node_ref)
+        return resolved[0] if resolved else None
+
+    def values(self, path):
+        """获取所有服务器上所有节点某个属性的值
+
+        Args:
+            path: 属性路径
+
+        Returns:
+            dict: 限定的节点ID -> 属性值
+        """
+        result = {}
+        for name, client in self._pool.clients.items():
+            for node_id, value in client.nodes.values(path).items():
+                result[self._pool.qualify(name, node_id)] = value
+        return result
+
+    def find(self, path, value):
+        """查找所有服务器上某个属性等于指定值的节点
+
+        Args:
+            path: 属性路径
+            value: 属性值
+
+        Returns:
+            set: 限定的节点ID集合
+        """
+        return {self._pool.qualify(name, node_id)
+                for name, client in self._pool.clients.items()
+                for node_id in client.nodes.find(path, value)}
+
+
+class MatterClientPool:
+    """Matter客户端连接池
+
+    对外提供与MatterClient相同的接口。只配置一个服务器时节点ID不加限定，
+    与单客户端完全兼容；配置多个服务器时节点ID格式为 <服务器名称>:<节点ID>，
+    命令会路由到节点所属的服务器。
+    """
+
+    def __init__(self, servers=None):
+        """初始化连接池
+
+        Args:
+            servers: 服务器名称 -> WebSocket地址，默认使用配置中的MATTER_SERVERS
+        """
+        servers = servers or MATTER_SERVERS
+        self.clients = {
+            name: MatterClient(ws_url, standby_url=MATTER_STANDBY_SERVERS.get(name))
+            for name, ws_url in servers.items()
+        }
+        self.default_server = next(iter(self.clients))
+        self.nodes = MergedNodeStore(self)
+        # 回调函数 -> [(服务器名称, 包装后的回调函数)]
+        self._node_callback_wrappers = {}
+        logger.info("Matter客户端连接池初始化完成，共 %d 个服务器: %s",
+                    len(self.clients), ", ".join(self.clients))
+
+    @property
+    def connected(self):
+        """是否至少连接到一个Matter Server"""
+        return any(client.connected for client in self.clients.values())
+
+    @property
+    def ws_url(self):
+        """默认服务器的WebSocket地址"""
+        return self.clients[self.default_server].ws_url
+
+    def qualify(self, server, node_id):
+        """生成合并命名空间中的节点ID
+
+        Args:
+            server: 服务器名称
+            node_id: 服务器内的节点ID
+
+        Returns:
+            str: 限定的节点ID，只有一个服务器时不加限定
+        """
+        if len(self.clients) == 1:
+            return str(node_id)
+        return f"{server}{NODE_ID_SEPARATOR}{node_id}"
+
+    def resolve(self, node_ref):
+        """解析节点ID
+
+        Args:
+            node_ref: 限定的节点ID或未限定的节点ID（按服务器顺序查找第一个匹配的节点）
+
+        Returns:
+            tuple: (服务器名称, 服务器内的节点ID)，节点不存在则返回None
+        """
+        node_ref = str(node_ref)
+        server, separator, node_id = node_ref.rpartition(NODE_ID_SEPARATOR)
+        if separator:
+            if server in self.clients and node_id in self.clients[server].nodes:
+                return server, node_id
+            return None
+        for name, client in self.clients.items():
+            if node_ref in client.nodes:
+                return name, node_ref
+        return None
+
+    async def start(self):
+        """连接所有Matter Server并启动各自的重连监督任务
+
+        Returns:
+            bool: 是否至少有一个服务器连接成功
+        """
+        results = await asyncio.gather(*(client.start() for client in self.clients.values()))
+        return any(results)
+
+    async def stop(self):
+        """断开所有Matter Server"""
+        await asyncio.gather(*(client.stop() for client in self.clients.values()))
+
+    async def reconnect(self, server=None):
+        """重新连接Matter Server
+
+        Args:
+            server: 服务器名称，默认重新连接所有服务器
+        """
+        clients = [self.clients[server]] if server else self.clients.values()
+        await asyncio.gather(*(client.reconnect() for client in clients))
+
+    async def switch_server(self, ws_url, server=None):
+        """无中断地切换某个服务器的地址
+
+        Args:
+            ws_url: 新的WebSocket地址
+            server: 服务器名称，默认为第一个服务器
+
+        Returns:
+            bool: 是否切换成功
+        """
+        return await self.clients[server or self.default_server].switch_server(ws_url)
+
+    async def send_command(self, command, params=None, timeout=None):
+        """向节点所属的Matter Server发送命令
+
+        Args:
+            command: 命令名称
+            params: 命令参数，其中的node_id用于选择服务器，并被替换为服务器内的节点ID
+            timeout: 等待响应的超时时间（秒）
+
+        Returns:
+            dict: 命令执行结果，额外包含server字段
+        """
+        params = dict(params or {})
+        server = self.default_server
+        if "node_id" in params:
+            resolved = self.resolve(params["node_id"])
+            if resolved is None:
+                return {
+                    "success": False,
+                    "message_id": None,
+                    "result": None,
+                    "error_code": None,
+                    "details": f"节点 {params['node_id']} 不存在",
+                    "latency_ms": None,
+                    "server": None,
+                }
+            server, params["node_id"] = resolved
+        result = await self.clients[server].send_command(command, params, timeout)
+        result["server"] = server
+        return result
+
+    def register_status_callback(self, callback):
+        """在所有服务器上注册设备状态更新回调函数"""
+        for client in self.clients.values():
+            client.register_status_callback(callback)
+
+    def unregister_status_callback(self, callback):
+        """在所有服务器上取消注册设备状态更新回调函数"""
+        for client in self.clients.values():
+            client.unregister_status_callback(callback)
+
+    def register_node_callback(self, callback):
+        """在所有服务器上注册节点变化回调函数
+
+        回调函数收到的节点变化中，node_id为限定的节点ID，并额外包含server字段。
+        """
+        if callback in self._node_callback_wrappers:
+            return
+        wrappers = []
+        for name, client in self.clients.items():
+            wrapper = self._wrap_node_callback(name, callback)
+            client.register_node_callback(wrapper)
+            wrappers.append((name, wrapper))
+        self._node_callback_wrappers[callback] = wrappers
+
+    def unregister_node_callback(self, callback):
+        """在所有服务器上取消注册节点变化回调函数"""
+        for name, wrapper in self._node_callback_wrappers.pop(callback, []):
+            self.clients[name].unregister_node_callback(wrapper)
+
+    def _wrap_node_callback(self, server, callback):
+        """将服务器内的节点ID转换为限定的节点ID，重新同步消息（node_id为None）原样传递"""
+        async def wrapper(change):
+            node_id = change["node_id"]
+            if node_id is not None:
+                node_id = self.qualify(server, node_id)
+            await callback(dict(change, node_id=node_id, server=server))
+        wrapper.__qualname__ = getattr(callback, "__qualname__", repr(callback))
+        return wrapper
+
+    def get_metrics(self):
+        """获取各服务器的消息处理指标
+
+        Returns:
+            dict: 服务器名称 -> 指标
+        """
+        return {name: client.get_metrics() for name, client in self.clients.items()}
+
+    def get_health(self):
+        """获取各服务器的连接健康状态
+
+        Returns:
+            dict: 服务器名称 -> 健康状态
+        """
+        return {name: client.get_health() for name, client in self.clients.items()}
+
+    def get_device_status(self):
+        """获取默认服务器的设备状态"""
+        return self.clients[self.default_server].get_device_status()
+
+    def get_node_info(self, node_id):
+        """获取指定节点的信息
+
+        Args:
+            node_id: 限定或未限定的节点ID
+
+        Returns:
+            MatterNode: 节点信息，如果节点不存在则返回None
+        """
+        node_info = self.nodes.get(node_id)
+        if node_info is None:
+            logger.warning("节点 %s 不存在", node_id)
+        return node_info
+
+    def get_all_nodes(self):
+        """获取所有服务器的节点
+
+        Returns:
+            MergedNodeStore: 合并后的节点视图
+        """
+        return self.nodes
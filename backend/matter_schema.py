@@ -0,0 +1,246 @@
+"""
+Matter属性解码表
+以声明方式描述使用的集群和属性（端点、属性ID、前端字段名、默认值、解码函数），
+首次使用时编译为查找表，一次遍历解码单个节点的所有字段。
+增加集群或属性只需要在CLUSTERS中添加一项。
+"""
+
+import logging
+from node_store import format_path
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+_MISSING = object()
+
+# 字段分组，对应 /api/node/<id> 响应中的两部分
+DEVICE_INFO = "device_info"
+DEVICE_STATUS = "device_status"
+
+# RVC Operational State的操作状态ID -> 名称
+OPERATIONAL_STATES = {
+    0: "Stopped",
+    1: "Running",
+    2: "Paused",
+    3: "Error",
+    64: "SeekingCharger",  # 0x40 SeekingCharger
+    65: "Charging",        # 0x41 Charging
+    66: "Docked",          # 0x42 Docked
+}
+
+
+def enhance_operational_state_list(state_list):
+    """为操作状态列表中的每个状态ID添加对应的名称
+
+    Args:
+        state_list: 操作状态ID列表，格式为 [{"0":id}, ...]
+
+    Returns:
+        增强后的操作状态列表，格式为 [{"id":id, "name":name}, ...]
+    """
+    if not state_list or not isinstance(state_list, list):
+        return []
+    return [{"id": item["0"], "name": OPERATIONAL_STATES.get(item["0"], f"State{item['0']}")}
+            for item in state_list if "0" in item]
+
+
+def battery_percent(value):
+    """将BatPercentRemaining（单位0.5%）转换为百分比
+
+    Args:
+        value: 属性值，可能为None
+
+    Returns:
+        int: 电量百分比
+    """
+    if not isinstance(value, (int, float)):
+        return 0
+    return int(value) // 2
+
+
+class Attribute:
+    """属性定义"""
+
+    __slots__ = ("attribute_id", "name", "field", "group", "default", "decoder", "cluster", "path", "key")
+
+    def __init__(self, attribute_id, name, field, group, default="未知", decoder=None):
+        """定义属性
+
+        Args:
+            attribute_id: 属性ID
+            name: Matter规范中的属性名称
+            field: 前端使用的字段名
+            group: 字段分组（DEVICE_INFO或DEVICE_STATUS）
+            default: 属性不存在时的值（解码前）
+            decoder: 解码函数，None表示原样使用
+        """
+        self.attribute_id = attribute_id
+        self.name = name
+        self.field = field
+        self.group = group
+        self.default = default
+        self.decoder = decoder
+        # 以下由Cluster填写
+        self.cluster = None
+        self.path = None
+        self.key = None
+
+    def decode(self, value):
+        """解码属性值"""
+        return self.decoder(value) if self.decoder else value
+
+
+class Cluster:
+    """集群定义"""
+
+    def __init__(self, cluster_id, name, endpoint, attributes):
+        """定义集群
+
+        Args:
+            cluster_id: 集群ID
+            name: Matter规范中的集群名称
+            endpoint: 集群所在的端点
+            attributes: Attribute列表
+        """
+        self.cluster_id = cluster_id
+        self.name = name
+        self.endpoint = endpoint
+        self.attributes = tuple(attributes)
+        for attribute in self.attributes:
+            attribute.cluster = cluster_id
+            attribute.path = (endpoint, cluster_id, attribute.attribute_id)
+            attribute.key = format_path(attribute.path)
+
+
+# 使用的集群和属性
+CLUSTERS = (
+    Cluster(40, "Basic Information", endpoint=0, attributes=(
+        Attribute(1, "VendorName", "manufacturer", DEVICE_INFO, default="未知厂商"),
+        Attribute(3, "ProductName", "product_name", DEVICE_INFO, default="未知产品"),
+        Attribute(8, "HardwareVersionString", "hardware_version", DEVICE_INFO),
+        Attribute(10, "SoftwareVersionString", "software_version", DEVICE_INFO),
+        Attribute(15, "SerialNumber", "serial_number", DEVICE_INFO),
+        Attribute(21, "SpecificationVersion", "matter_version", DEVICE_INFO),
+    )),
+    Cluster(84, "RVC Run Mode", endpoint=1, attributes=(
+        Attribute(0, "SupportedModes", "supported_run_modes", DEVICE_STATUS),
+        Attribute(1, "CurrentMode", "current_run_mode", DEVICE_STATUS),
+    )),
+    Cluster(85, "RVC Clean Mode", endpoint=1, attributes=(
+        Attribute(0, "SupportedModes", "supported_cleaning_modes", DEVICE_STATUS),
+        Attribute(1, "CurrentMode", "current_cleaning_mode", DEVICE_STATUS),
+    )),
+    Cluster(97, "RVC Operational State", endpoint=1, attributes=(
+        Attribute(3, "OperationalStateList", "operational_state_list", DEVICE_STATUS,
+                  default=[], decoder=enhance_operational_state_list),
+        Attribute(4, "OperationalState", "operational_state", DEVICE_STATUS),
+    )),
+    Cluster(47, "Power Source", endpoint=1, attributes=(
+        Attribute(12, "BatPercentRemaining", "battery_level", DEVICE_STATUS,
+                  default=None, decoder=battery_percent),
+    )),
+)
+
+
+class SchemaRegistry:
+    """属性解码表，注册的集群在首次使用时编译为查找表"""
+
+    def __init__(self, clusters=()):
+        """初始化解码表
+
+        Args:
+            clusters: 初始注册的Cluster列表
+        """
+        self.clusters = {}
+        self._compiled = False
+        for cluster in clusters:
+            self.register(cluster)
+
+    def register(self, cluster):
+        """注册集群，已编译的查找表会在下次使用时重新编译
+
+        Args:
+            cluster: Cluster
+        """
+        self.clusters[(cluster.endpoint, cluster.cluster_id)] = cluster
+        self._compiled = False
+
+    def _compile(self):
+        """生成查找表"""
+        attributes = [attribute for cluster in self.clusters.values() for attribute in cluster.attributes]
+        # 字段名 -> Attribute
+        self._by_field = {attribute.field: attribute for attribute in attributes}
+        # 分组 -> Attribute列表
+        self._groups = {}
+        for attribute in attributes:
+            self._groups.setdefault(attribute.group, []).append(attribute)
+        self._compiled = True
+        logger.debug("属性解码表已编译: %d 个集群，%d 个属性", len(self.clusters), len(attributes))
+
+    def _ensure_compiled(self):
+        if not self._compiled:
+            self._compile()
+
+    def fields(self, group=None):
+        """获取字段名列表
+
+        Args:
+            group: 字段分组，None表示所有分组
+
+        Returns:
+            list: 字段名
+        """
+        self._ensure_compiled()
+        if group is None:
+            return list(self._by_field)
+        return [attribute.field for attribute in self._groups.get(group, ())]
+
+    def attribute(self, field):
+        """获取字段对应的属性定义，不存在时返回None"""
+        self._ensure_compiled()
+        return self._by_field.get(field)
+
+    def path(self, field):
+        """获取字段对应的属性路径（整数元组）"""
+        self._ensure_compiled()
+        return self._by_field[field].path
+
+    def decode_value(self, field, value):
+        """解码单个字段的属性值"""
+        self._ensure_compiled()
+        attribute = self._by_field.get(field)
+        return attribute.decode(value) if attribute else value
+
+    def decode_node(self, node, groups=(DEVICE_INFO, DEVICE_STATUS), defaults=True):
+        """一次遍历解码节点的所有字段
+
+        Args:
+            node: 节点（MatterNode）
+            groups: 要解码的字段分组
+            defaults: 属性不存在时是否使用默认值，否则省略该字段
+
+        Returns:
+            dict: 分组 -> {字段名: 解码后的值}
+        """
+        self._ensure_compiled()
+        result = {}
+        for group in groups:
+            decoded = result[group] = {}
+            for attribute in self._groups.get(group, ()):
+                value = node.get_attribute(attribute.path, _MISSING)
+                if value is _MISSING:
+                    if not defaults:
+                        continue
+                    value = attribute.default
+                decoded[attribute.field] = attribute.decode(value)
+        return result
+
+
+# 全局解码表
+registry = SchemaRegistry(CLUSTERS)
+
+
+def path_of(field):
+    """获取字段对应的字符串属性路径，例如 "1/97/4" """
+    return registry.attribute(field).key
+
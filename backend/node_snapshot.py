@@ -0,0 +1,300 @@
+"""
+共享内存节点快照
+拥有Matter连接的主进程把节点数据发布为带版本号的只读快照（内存映射文件），
+多个HTTP读取工作进程无锁读取，用于在多个CPU核上提供节点查询接口
+
+文件布局：64字节头部（序列号、两个数据槽的长度），之后是两个大小相同的数据槽。
+序列号为奇数表示写入者正在写入，偶数表示已发布的版本（版本号 = 序列号 // 2）。
+序列号作为对齐的8字节整数整体读写（struct.pack_into会先把目标字节清零再逐字节写入，
+读取者可能看到0或不完整的值）。
+写入者先把序列号加1（奇数），写入版本号对应的槽，再把序列号加1（偶数）；
+读取者在复制数据前后各读一次序列号，两次相同且为偶数时数据完整（seqlock），否则重试。
+
+共享内存中只有JSON数据，每个工作进程在版本变化时复制并解析一次，
+之后同一版本的所有请求直接使用已解析的节点存储。
+"""
+
+import os
+import json
+import mmap
+import time
+import struct
+import asyncio
+import logging
+from types import SimpleNamespace
+from flask import g
+from config import NODE_SNAPSHOT_PATH, NODE_SNAPSHOT_SIZE, NODE_SNAPSHOT_INTERVAL
+from node_store import NodeStore
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+HEADER_SIZE = 64
+# 序列号、槽0长度、槽1长度，本机字节序（共享内存只在同一台机器的进程之间使用）
+HEADER_FORMAT = "=QQQ"
+READ_RETRIES = 10
+# 写入者正在写入时，读取者重试前等待的时间（秒）
+READ_RETRY_DELAY = 0.001
+
+
+def _slot_offset(slot, size):
+    """数据槽在文件中的偏移"""
+    return HEADER_SIZE + slot * ((size - HEADER_SIZE) // 2)
+
+
+def _sequence_view(buffer):
+    """头部序列号的视图，通过它整体读写对齐的8字节整数"""
+    return memoryview(buffer)[:8].cast("Q")
+
+
+class SnapshotWriter:
+    """快照写入者，只能有一个"""
+
+    def __init__(self, path=None, size=None):
+        """创建快照文件
+
+        Args:
+            path: 快照文件路径，默认使用配置中的NODE_SNAPSHOT_PATH
+            size: 文件大小（字节），默认使用配置中的NODE_SNAPSHOT_SIZE
+        """
+        self.path = path or NODE_SNAPSHOT_PATH
+        self.size = size or NODE_SNAPSHOT_SIZE
+        self.slot_size = (self.size - HEADER_SIZE) // 2
+        with open(self.path, "wb") as f:
+            f.truncate(self.size)
+        self._file = open(self.path, "r+b")
+        self._mmap = mmap.mmap(self._file.fileno(), self.size)
+        self._sequence = _sequence_view(self._mmap)
+        self.version = 0
+
+    def write(self, data):
+        """写入新版本的快照
+
+        Args:
+            data: 快照内容（字节）
+
+        Returns:
+            int: 新的版本号，内容超过数据槽大小时返回None
+        """
+        if len(data) > self.slot_size:
+            logger.error(f"节点快照大小 {len(data)} 超过数据槽大小 {self.slot_size}，请增大NODE_SNAPSHOT_SIZE")
+            return None
+        version = self.version + 1
+        slot = version % 2
+        offset = _slot_offset(slot, self.size)
+        # 奇数序列号：写入中，读取者会重试
+        self._sequence[0] = 2 * version - 1
+        self._mmap[offset:offset + len(data)] = data
+        struct.pack_into("=Q", self._mmap, 8 + 8 * slot, len(data))
+        # 数据写完后再发布偶数序列号
+        self._sequence[0] = 2 * version
+        self.version = version
+        return version
+
+    def close(self):
+        """关闭并删除快照文件"""
+        self._sequence.release()
+        self._mmap.close()
+        self._file.close()
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+
+class SnapshotNodeStore(NodeStore):
+    """快照中的节点存储，节点ID已按连接池规则限定，额外记录每个节点所属的服务器"""
+
+    def __init__(self, nodes):
+        super().__init__()
+        self._owners = {}
+        for node in nodes:
+            self.put(node)
+            self._owners[str(node["node_id"])] = node.get("server")
+
+    def owner(self, node_id):
+        """获取节点所属的服务器名称"""
+        return self._owners.get(str(node_id))
+
+
+class NodeSnapshot:
+    """一个版本的节点快照（只读）"""
+
+    def __init__(self, version, data):
+        self.version = version
+        self.device_status = data.get("device_status", {})
+        self.servers = data.get("servers", {})
+        self.connected = data.get("connected", False)
+        self.nodes = SnapshotNodeStore(data.get("nodes", []))
+
+
+EMPTY_SNAPSHOT = NodeSnapshot(0, {})
+
+
+class SnapshotReader:
+    """快照读取者，可以在任意多个进程中使用"""
+
+    def __init__(self, path=None, size=None):
+        """初始化快照读取者，快照文件在第一次读取时才打开
+
+        Args:
+            path: 快照文件路径，默认使用配置中的NODE_SNAPSHOT_PATH
+            size: 文件大小（字节），默认使用配置中的NODE_SNAPSHOT_SIZE
+        """
+        self.path = path or NODE_SNAPSHOT_PATH
+        self.size = size or NODE_SNAPSHOT_SIZE
+        self._mmap = None
+        self._sequence = None
+        self._snapshot = EMPTY_SNAPSHOT
+
+    def read(self):
+        """读取最新的快照
+
+        版本号未变化时直接返回已解析的快照，不复制也不解析数据；
+        版本变化时复制新版本的数据槽并解析一次。
+
+        Returns:
+            NodeSnapshot: 最新的快照，快照文件尚不存在时返回空快照
+        """
+        if self._mmap is None:
+            if not os.path.exists(self.path):
+                return self._snapshot
+            with open(self.path, "rb") as f:
+                self._mmap = mmap.mmap(f.fileno(), self.size, access=mmap.ACCESS_READ)
+            self._sequence = _sequence_view(self._mmap)
+
+        for _ in range(READ_RETRIES):
+            sequence = self._sequence[0]
+            if sequence % 2:
+                # 写入者正在写入
+                time.sleep(READ_RETRY_DELAY)
+                continue
+            version = sequence // 2
+            if version == self._snapshot.version:
+                return self._snapshot
+            slot = version % 2
+            length, = struct.unpack_from("=Q", self._mmap, 8 + 8 * slot)
+            offset = _slot_offset(slot, self.size)
+            data = self._mmap[offset:offset + length]
+            # 复制期间序列号未变化，说明写入者没有开始新的写入，数据完整
+            if self._sequence[0] == sequence:
+                self._snapshot = NodeSnapshot(version, json.loads(data))
+                return self._snapshot
+        logger.warning("节点快照更新过快，使用上一个版本")
+        return self._snapshot
+
+
+class SnapshotPublisher:
+    """在主进程中订阅Matter客户端的变化，合并后发布节点快照"""
+
+    def __init__(self, matter_client, writer=None, interval=None):
+        """初始化快照发布者
+
+        Args:
+            matter_client: MatterClient或MatterClientPool
+            writer: 快照写入者，默认创建新的SnapshotWriter
+            interval: 合并变化的时间窗口（秒），默认使用配置中的NODE_SNAPSHOT_INTERVAL
+        """
+        self.matter_client = matter_client
+        self.writer = writer or SnapshotWriter()
+        self.interval = NODE_SNAPSHOT_INTERVAL if interval is None else interval
+        self._handle = None
+
+    def start(self):
+        """发布初始快照并订阅变化"""
+        self.matter_client.register_node_callback(self._on_change)
+        self.matter_client.register_status_callback(self._on_change)
+        self.publish()
+        logger.info(f"节点快照已发布到 {self.writer.path}")
+
+    def stop(self):
+        """取消订阅并删除快照文件"""
+        self.matter_client.unregister_node_callback(self._on_change)
+        self.matter_client.unregister_status_callback(self._on_change)
+        if self._handle:
+            self._handle.cancel()
+        self.writer.close()
+
+    def publish(self):
+        """立即发布当前状态的快照
+
+        Returns:
+            int: 快照版本号
+        """
+        self._handle = None
+        nodes = self.matter_client.get_all_nodes()
+        data = {
+            "device_status": self.matter_client.get_device_status(),
+            "connected": self.matter_client.connected,
+            "servers": {name: client.ws_url for name, client in getattr(self.matter_client, "clients", {}).items()},
+            "nodes": [dict(node.to_dict(), node_id=node_id, server=_owner(nodes, node_id))
+                      for node_id, node in nodes.items()],
+        }
+        return self.writer.write(json.dumps(data, default=str).encode("utf-8"))
+
+    async def _on_change(self, change):
+        """节点或设备状态变化时，在合并窗口结束后发布快照"""
+        if self._handle is None:
+            self._handle = asyncio.get_running_loop().call_later(self.interval, self.publish)
+
+
+def _owner(nodes, node_id):
+    """获取节点所属的服务器，单个MatterClient的节点存储没有服务器信息"""
+    owner = getattr(nodes, "owner", None)
+    return owner(node_id) if owner else None
+
+
+class SharedNodeClient:
+    """基于共享内存快照的只读Matter客户端，提供与MatterClientPool相同的查询接口
+
+    同一个请求内的所有查询使用同一个版本的快照。
+    """
+
+    def __init__(self, reader=None):
+        self.reader = reader or SnapshotReader()
+
+    def snapshot(self):
+        """获取本次请求使用的快照"""
+        if "node_snapshot" not in g:
+            g.node_snapshot = self.reader.read()
+        return g.node_snapshot
+
+    @property
+    def connected(self):
+        return self.snapshot().connected
+
+    @property
+    def clients(self):
+        """服务器名称 -> 带ws_url属性的对象"""
+        return {name: SimpleNamespace(ws_url=ws_url) for name, ws_url in self.snapshot().servers.items()}
+
+    @property
+    def ws_url(self):
+        return next(iter(self.snapshot().servers.values()), None)
+
+    def get_device_status(self):
+        return self.snapshot().device_status
+
+    def get_node_info(self, node_id):
+        node_info = self.snapshot().nodes.get(node_id)
+        if node_info is None:
+            logger.warning(f"节点 {node_id} 不存在")
+        return node_info
+
+    def get_all_nodes(self):
+        return self.snapshot().nodes
+
+    def get_metrics(self):
+        return {"snapshot_version": self.snapshot().version}
+
+    def get_health(self):
+        return {}
+
+    async def send_command(self, command, params=None, timeout=None):
+        """只读工作进程不能发送命令"""
+        return {
+            "success": False,
+            "message_id": None,
+            "result": None,
+            "error_code": None,
+            "details": "只读工作进程不能发送命令，请求主进程的接口",
+            "latency_ms": None,
+        }
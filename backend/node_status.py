@@ -0,0 +1,57 @@
+"""
+节点状态规范化
+将Matter属性变化转换为前端使用的节点状态字段
+"""
+
+import logging
+from matter_schema import DEVICE_STATUS, registry
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+# 节点状态字段 -> Matter属性路径，由属性解码表生成
+STATUS_ATTRIBUTES = {field: registry.attribute(field).key for field in registry.fields(DEVICE_STATUS)}
+
+# Matter属性路径 -> 节点状态字段
+ATTRIBUTE_FIELDS = {path: field for field, path in STATUS_ATTRIBUTES.items()}
+
+# 节点状态字段所属的集群ID
+FIELD_CLUSTERS = {field: registry.attribute(field).cluster for field in STATUS_ATTRIBUTES}
+
+# 直接作为节点状态字段的节点级字段
+NODE_FIELDS = ("available",)
+
+
+def build_node_status(node):
+    """生成节点的完整状态
+
+    Args:
+        node: 节点（MatterNode）
+
+    Returns:
+        dict: 节点状态字段 -> 值，只包含节点已有的属性
+    """
+    status = {field: getattr(node, field) for field in NODE_FIELDS}
+    status.update(registry.decode_node(node, (DEVICE_STATUS,), defaults=False)[DEVICE_STATUS])
+    return status
+
+
+def normalize_change(change):
+    """将节点变化转换为节点状态字段的变化
+
+    Args:
+        change: MatterClient节点回调收到的变化
+            {"node_id", "event", "changes": {路径: 值}, "removed": [路径], "fields": {字段: 值}}
+
+    Returns:
+        tuple: (changes, removed)
+            changes: 发生变化的节点状态字段 -> 值
+            removed: 被删除的节点状态字段列表
+    """
+    changes = {field: value for field, value in change.get("fields", {}).items() if field in NODE_FIELDS}
+    for path, value in change.get("changes", {}).items():
+        field = ATTRIBUTE_FIELDS.get(path)
+        if field is not None:
+            changes[field] = registry.decode_value(field, value)
+    removed = [ATTRIBUTE_FIELDS[path] for path in change.get("removed", []) if path in ATTRIBUTE_FIELDS]
+    return changes, removed
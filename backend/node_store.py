@@ -0,0 +1,473 @@
+"""
+Matter节点存储
+属性路径只解析一次，按 (endpoint, cluster, attribute) 整数元组存储和索引
+"""
+
+import sys
+import logging
+from functools import lru_cache
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+# 热点属性：API频繁读取的属性，按固定槽位存储在每个节点的数组中，
+# 并维护跨节点索引
+HOT_ATTRIBUTES = (
+    (0, 40, 1),    # VendorName
+    (0, 40, 3),    # ProductName
+    (0, 40, 8),    # HardwareVersionString
+    (0, 40, 10),   # SoftwareVersionString
+    (0, 40, 15),   # SerialNumber
+    (0, 40, 21),   # SpecificationVersion
+    (1, 84, 0),    # RVC Run Mode SupportedModes
+    (1, 84, 1),    # RVC Run Mode CurrentMode
+    (1, 85, 0),    # RVC Clean Mode SupportedModes
+    (1, 85, 1),    # RVC Clean Mode CurrentMode
+    (1, 97, 3),    # OperationalStateList
+    (1, 97, 4),    # OperationalState
+)
+HOT_SLOTS = {path: slot for slot, path in enumerate(HOT_ATTRIBUTES)}
+
+# 节点级字段（非属性）
+NODE_FIELDS = ("available", "date_commissioned", "last_interview", "is_bridge")
+
+_MISSING = object()
+
+# 缓存的路径字符串数量上限：路径也来自API请求的URL，缓存按最近使用淘汰，不会无限增长
+PATH_CACHE_SIZE = 4096
+
+
+def parse_path(path):
+    """将属性路径解析为整数元组
+
+    Args:
+        path: 属性路径，例如 "1/97/4" 或 (1, 97, 4)
+
+    Returns:
+        tuple: (endpoint, cluster, attribute)
+    """
+    if isinstance(path, tuple):
+        return path
+    return _parse_path_string(path)
+
+
+@lru_cache(maxsize=PATH_CACHE_SIZE)
+def _parse_path_string(path):
+    """路径字符串 -> 整数元组，缓存期间所有节点共享同一个元组对象"""
+    return tuple(int(part) for part in path.split("/"))
+
+
+def format_path(path):
+    """将整数元组格式化为属性路径字符串
+
+    Args:
+        path: (endpoint, cluster, attribute)
+
+    Returns:
+        str: 属性路径，例如 "1/97/4"
+    """
+    return "/".join(str(part) for part in path)
+
+
+class RetentionFilter:
+    """属性保留规则：只保存匹配的属性路径
+
+    规则格式为 "endpoint/cluster/attribute"，每一段都可以是 "*"，例如 "0/40/*"。
+    """
+
+    def __init__(self, patterns):
+        """编译保留规则
+
+        Args:
+            patterns: 规则列表
+        """
+        self.patterns = list(patterns)
+        self._exact = set()
+        self._wildcards = []
+        for pattern in self.patterns:
+            parts = tuple(None if part == "*" else int(part) for part in pattern.split("/"))
+            if len(parts) != 3:
+                raise ValueError(f"无效的属性保留规则: {pattern}")
+            if None in parts:
+                self._wildcards.append(parts)
+            else:
+                self._exact.add(parts)
+        # 路径 -> 是否保留，路径种类有限，判断结果按路径缓存
+        self._decisions = {}
+
+    def __call__(self, path):
+        """判断是否保留属性
+
+        Args:
+            path: 整数元组路径
+
+        Returns:
+            bool: 是否保留
+        """
+        decision = self._decisions.get(path)
+        if decision is None:
+            decision = path in self._exact or any(
+                all(part is None or part == value for part, value in zip(pattern, path))
+                for pattern in self._wildcards)
+            self._decisions[path] = decision
+        return decision
+
+
+def deep_sizeof(value):
+    """估算对象及其包含的容器和元素占用的内存（字节）
+
+    Args:
+        value: 属性值或容器
+
+    Returns:
+        int: 字节数
+    """
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        size += sum(deep_sizeof(key) + deep_sizeof(item) for key, item in value.items())
+    elif isinstance(value, (list, tuple, set)):
+        size += sum(deep_sizeof(item) for item in value)
+    return size
+
+
+class MatterNode:
+    """单个Matter节点的紧凑表示"""
+
+    __slots__ = ("node_id", "available", "date_commissioned", "last_interview",
+                 "is_bridge", "hot", "attributes", "view", "generation")
+
+    def __init__(self, node_id):
+        """初始化节点
+
+        Args:
+            node_id: 节点ID
+        """
+        self.node_id = node_id
+        self.available = False
+        self.date_commissioned = ""
+        self.last_interview = ""
+        self.is_bridge = False
+        # 热点属性按HOT_SLOTS槽位存储
+        self.hot = [_MISSING] * len(HOT_ATTRIBUTES)
+        # 其他属性：整数元组 -> 值
+        self.attributes = {}
+        # 渲染好的API响应缓存，节点字段或属性变化时清空
+        self.view = None
+        # 节点字段或属性每次变化后递增，渲染期间发生变化时不缓存渲染结果
+        self.generation = 0
+
+    def invalidate(self):
+        """节点字段或属性已变化：先递增版本，再清空响应缓存"""
+        self.generation += 1
+        self.view = None
+
+    def get_attribute(self, path, default=None):
+        """获取属性值
+
+        Args:
+            path: 属性路径，字符串或整数元组
+            default: 属性不存在时返回的默认值
+
+        Returns:
+            属性值或默认值
+        """
+        path = parse_path(path)
+        slot = HOT_SLOTS.get(path)
+        if slot is not None:
+            value = self.hot[slot]
+            return default if value is _MISSING else value
+        return self.attributes.get(path, default)
+
+    def iter_attributes(self):
+        """遍历节点的所有属性
+
+        Yields:
+            (path, value): 整数元组路径和属性值
+        """
+        for path, value in zip(HOT_ATTRIBUTES, self.hot):
+            if value is not _MISSING:
+                yield path, value
+        yield from self.attributes.items()
+
+    def get_fields(self):
+        """获取节点级字段
+
+        Returns:
+            dict: 字段名 -> 值
+        """
+        return {field: getattr(self, field) for field in NODE_FIELDS}
+
+    def memory_size(self):
+        """估算节点占用的内存（字节），路径元组由所有节点共享，不计入
+
+        Returns:
+            int: 字节数
+        """
+        size = sys.getsizeof(self) + sys.getsizeof(self.hot) + sys.getsizeof(self.attributes)
+        size += sum(deep_sizeof(value) for value in self.hot if value is not _MISSING)
+        size += sum(deep_sizeof(value) for value in list(self.attributes.values()))
+        return size
+
+    def to_dict(self):
+        """转换为Matter Server原始格式的节点字典
+
+        Returns:
+            dict: 包含node_id、节点字段和以字符串路径为键的attributes
+        """
+        node = {"node_id": self.node_id}
+        node.update(self.get_fields())
+        node["attributes"] = {format_path(path): value for path, value in self.iter_attributes()}
+        return node
+
+
+class NodeStore:
+    """Matter节点存储
+
+    为热点属性维护跨节点索引，例如所有节点的 1/97/4 值，
+    以及按值查找节点的反向索引（例如哪些节点处于Charging状态）。
+    """
+
+    def __init__(self, retain=None):
+        """初始化节点存储
+
+        Args:
+            retain: 属性保留规则列表（见RetentionFilter），None表示保存所有属性
+        """
+        self._nodes = {}
+        self._retain = RetentionFilter(retain) if retain is not None else None
+        # 节点ID -> 最近一次写入完整节点数据时未保存的属性数量
+        self._dropped = {}
+        # 热点属性索引：路径 -> {node_id: value}
+        self._index = {path: {} for path in HOT_ATTRIBUTES}
+        # 热点属性反向索引：路径 -> {value: set(node_id)}，仅索引可哈希的值
+        self._value_index = {path: {} for path in HOT_ATTRIBUTES}
+
+    def __len__(self):
+        return len(self._nodes)
+
+    def __contains__(self, node_id):
+        return str(node_id) in self._nodes
+
+    def __iter__(self):
+        # 请求线程遍历时事件循环可能同时增删节点，遍历节点ID列表的快照
+        return iter(list(self._nodes))
+
+    def get(self, node_id):
+        """获取节点
+
+        Args:
+            node_id: 节点ID
+
+        Returns:
+            MatterNode: 节点，不存在则返回None
+        """
+        return self._nodes.get(str(node_id))
+
+    def items(self):
+        """遍历所有节点
+
+        返回调用时的节点列表快照，请求线程遍历期间事件循环增删节点不会导致遍历出错。
+
+        Returns:
+            list: (node_id, MatterNode) 列表
+        """
+        return list(self._nodes.items())
+
+    def values(self, path):
+        """获取所有节点某个属性的值
+
+        Args:
+            path: 属性路径
+
+        Returns:
+            dict: node_id -> 属性值
+        """
+        path = parse_path(path)
+        if path in self._index:
+            return dict(self._index[path])
+        result = {}
+        for node_id, node in self.items():
+            value = node.attributes.get(path, _MISSING)
+            if value is not _MISSING:
+                result[node_id] = value
+        return result
+
+    def find(self, path, value):
+        """查找某个属性等于指定值的所有节点
+
+        Args:
+            path: 属性路径
+            value: 属性值
+
+        Returns:
+            set: 节点ID集合
+        """
+        path = parse_path(path)
+        by_value = self._value_index.get(path)
+        if by_value is not None:
+            try:
+                return set(by_value.get(value, ()))
+            except TypeError:
+                pass
+        return {node_id for node_id, node in self.items()
+                if node.get_attribute(path, _MISSING) == value}
+
+    def remove(self, node_id):
+        """移除节点
+
+        Args:
+            node_id: 节点ID
+
+        Returns:
+            MatterNode: 被移除的节点，不存在则返回None
+        """
+        node = self._nodes.pop(str(node_id), None)
+        self._dropped.pop(str(node_id), None)
+        if node is not None:
+            for path, slot in HOT_SLOTS.items():
+                self._unindex(path, str(node_id), node.hot[slot])
+        return node
+
+    def set_attribute(self, node_id, path, value):
+        """设置单个属性
+
+        Args:
+            node_id: 节点ID
+            path: 属性路径
+            value: 新的属性值
+
+        Returns:
+            bool: 属性值是否发生变化（节点不存在或属性不在保留规则中时返回False）
+        """
+        node_id = str(node_id)
+        node = self._nodes.get(node_id)
+        if node is None:
+            return False
+        path = parse_path(path)
+        if self._retain is not None and not self._retain(path):
+            return False
+        slot = HOT_SLOTS.get(path)
+        if slot is None:
+            old = node.attributes.get(path, _MISSING)
+            if old is not _MISSING and old == value:
+                return False
+            node.attributes[path] = value
+            node.invalidate()
+            return True
+
+        old = node.hot[slot]
+        if old is not _MISSING and old == value:
+            return False
+        self._unindex(path, node_id, old)
+        node.hot[slot] = value
+        self._reindex(path, node_id, value)
+        node.invalidate()
+        return True
+
+    def put(self, node_data):
+        """写入完整的节点数据，并返回与旧数据的差异
+
+        Args:
+            node_data: Matter Server格式的节点字典
+
+        Returns:
+            tuple: (changes, removed, fields)
+                changes: 新增或变化的属性，字符串路径 -> 值
+                removed: 被删除的属性路径列表
+                fields: 发生变化的节点字段
+        """
+        node_id = str(node_data.get("node_id"))
+        node = self._nodes.get(node_id)
+        is_new = node is None
+        if is_new:
+            node = MatterNode(node_data.get("node_id"))
+            self._nodes[node_id] = node
+
+        fields = {}
+        for field in NODE_FIELDS:
+            value = node_data.get(field, getattr(node, field))
+            if is_new or getattr(node, field) != value:
+                setattr(node, field, value)
+                fields[field] = value
+                node.invalidate()
+
+        changes = {}
+        seen = set()
+        dropped = 0
+        for key, value in node_data.get("attributes", {}).items():
+            path = parse_path(key)
+            if self._retain is not None and not self._retain(path):
+                dropped += 1
+                continue
+            seen.add(path)
+            if self.set_attribute(node_id, path, value):
+                changes[key] = value
+        self._dropped[node_id] = dropped
+
+        removed = []
+        for path, value in list(node.iter_attributes()):
+            if path not in seen:
+                self._remove_attribute(node_id, node, path)
+                removed.append(format_path(path))
+
+        return changes, removed, fields
+
+    def memory_stats(self):
+        """统计节点存储占用的内存
+
+        Returns:
+            dict: 节点数、保存和未保存的属性数、估算的总字节数和每个节点的平均字节数
+        """
+        attributes = 0
+        size = 0
+        # 在请求线程中调用，遍历节点列表的快照
+        nodes = list(self._nodes.values())
+        for node in nodes:
+            attributes += len(node.attributes) + sum(1 for value in node.hot if value is not _MISSING)
+            size += node.memory_size()
+        return {
+            "retain": self._retain.patterns if self._retain is not None else "*",
+            "nodes": len(nodes),
+            "attributes": attributes,
+            "dropped_attributes": sum(list(self._dropped.values())),
+            "bytes": size,
+            "bytes_per_node": size // len(nodes) if nodes else 0,
+        }
+
+    def _remove_attribute(self, node_id, node, path):
+        """删除节点的某个属性
+
+        Args:
+            node_id: 节点ID
+            node: 节点
+            path: 整数元组路径
+        """
+        slot = HOT_SLOTS.get(path)
+        if slot is None:
+            node.attributes.pop(path, None)
+        else:
+            self._unindex(path, node_id, node.hot[slot])
+            node.hot[slot] = _MISSING
+        node.invalidate()
+
+    def _reindex(self, path, node_id, value):
+        """将热点属性值加入索引"""
+        self._index[path][node_id] = value
+        try:
+            self._value_index[path].setdefault(value, set()).add(node_id)
+        except TypeError:
+            pass
+
+    def _unindex(self, path, node_id, value):
+        """将热点属性值从索引中移除"""
+        if value is _MISSING:
+            return
+        self._index[path].pop(node_id, None)
+        try:
+            node_ids = self._value_index[path].get(value)
+        except TypeError:
+            return
+        if node_ids is not None:
+            node_ids.discard(node_id)
+            if not node_ids:
+                del self._value_index[path][value]
@@ -0,0 +1,65 @@
+"""
+HTTP读取工作进程
+从共享内存节点快照提供 /api/nodes、/api/node/<id>、/api/status 等查询接口，
+由hypercorn以多个工作进程运行；控制和配置接口仍由拥有Matter连接的主进程提供
+"""
+
+import os
+import logging
+from flask import Flask, jsonify, request
+from flask_cors import CORS
+import config
+from config import NODE_READ_WORKERS, NODE_READ_PORT
+from api.routes import api
+from node_snapshot import SharedNodeClient
+
+# 配置日志
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(process)d - %(name)s - %(levelname)s - %(message)s'
+)
+
+logger = logging.getLogger(__name__)
+
+app = Flask(__name__)
+CORS(app)
+app.config.from_object(config)
+app.register_blueprint(api, url_prefix='/api')
+
+# 只读的Matter客户端，数据来自主进程发布的节点快照
+app.matter_client = SharedNodeClient()
+app.ws_service = None
+app.ws_bus = None
+app.loop = None
+
+
+@app.before_request
+def reject_writes():
+    """只提供查询接口，控制和配置等写入请求需要发送到主进程"""
+    if request.method not in ('GET', 'HEAD', 'OPTIONS'):
+        response = jsonify({
+            "status": "error",
+            "message": "只读工作进程不支持该请求，请使用主进程的接口"
+        })
+        response.status_code = 405
+        response.headers['Allow'] = 'GET, HEAD, OPTIONS'
+        return response
+
+
+def main():
+    """以NODE_READ_WORKERS个工作进程运行"""
+    from hypercorn.config import Config
+    from hypercorn.run import run
+
+    hypercorn_config = Config()
+    hypercorn_config.bind = [f"0.0.0.0:{NODE_READ_PORT}"]
+    hypercorn_config.workers = max(1, NODE_READ_WORKERS)
+    hypercorn_config.application_path = "read_worker:app"
+    # 工作进程通过导入read_worker模块加载应用，需要能找到backend目录下的模块
+    os.chdir(os.path.dirname(os.path.abspath(__file__)))
+    logger.info(f"HTTP读取工作进程启动，端口 {NODE_READ_PORT}，工作进程数 {hypercorn_config.workers}")
+    run(hypercorn_config)
+
+
+if __name__ == '__main__':
+    main()
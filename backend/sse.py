@@ -0,0 +1,152 @@
+"""
+Server-Sent Events推送
+在主HTTP服务的 /api/events 上以text/event-stream推送与WebSocket相同的快照和补丁，
+适用于会断开WebSocket连接的代理环境
+
+- 每个事件的event为消息类型（snapshot/patch），data为JSON消息，id为 <epoch>:<seq>
+- 浏览器的EventSource重连时自动带上Last-Event-ID，服务器从重放缓冲区补发错过的补丁，
+  无法续传时发送快照；也可以在URL中使用 ?resume=&epoch=
+- 通过URL参数 ?node_ids=1,2&clusters=97 只订阅指定的节点和集群，参数无效时返回400
+- 事件流与WebSocket客户端共用发送队列和慢客户端处理策略（WS_SLOW_CLIENT_POLICY）
+"""
+
+import json
+import asyncio
+import logging
+from urllib.parse import parse_qs
+from config import SSE_KEEPALIVE_INTERVAL, SSE_RETRY_MS
+from ws_service import query_subscription
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+KEEPALIVE = ": keepalive\n\n"
+
+
+class SseCodec:
+    """把消息编码为SSE事件，每次广播只为所有事件流编码一次"""
+
+    name = "sse"
+    subprotocol = None
+
+    def __init__(self, service):
+        """初始化编码器
+
+        Args:
+            service: WebSocketService，事件id中使用其epoch
+        """
+        self.service = service
+
+    def encode(self, message):
+        lines = []
+        if "seq" in message:
+            lines.append(f"id: {self.service.epoch}:{message['seq']}")
+        lines.append(f"event: {message.get('type', 'message')}")
+        lines.append(f"data: {json.dumps(message)}")
+        return "\n".join(lines) + "\n\n"
+
+    def decode(self, data):
+        return json.loads(data)
+
+
+class EventStream:
+    """单个SSE响应，提供ClientConnection使用的WebSocket连接接口"""
+
+    subprotocol = None
+
+    def __init__(self, send, remote_address):
+        """初始化事件流
+
+        Args:
+            send: ASGI send
+            remote_address: 客户端地址
+        """
+        self._send = send
+        self.remote_address = remote_address
+        self.closed = asyncio.Event()
+
+    async def send(self, event):
+        """发送一个事件，等待传输层写入，慢客户端的消息在发送队列中积压"""
+        await self._send({"type": "http.response.body", "body": event.encode("utf-8"), "more_body": True})
+
+    async def close(self, code=None, reason=None):
+        """结束事件流"""
+        self.closed.set()
+
+
+class EventStreamHandler:
+    """/api/events 的ASGI处理函数"""
+
+    def __init__(self, service):
+        """初始化处理函数
+
+        Args:
+            service: WebSocketService，事件流作为它的客户端接收补丁
+        """
+        self.service = service
+        self.codec = SseCodec(service)
+
+    async def __call__(self, scope, receive, send):
+        query = parse_qs(scope["query_string"].decode("latin-1"))
+        headers = dict(scope["headers"])
+        last_event_id = headers.get(b"last-event-id", b"").decode("latin-1")
+        if last_event_id and "resume" not in query:
+            epoch, _, seq = last_event_id.rpartition(":")
+            query["resume"] = [seq]
+            query["epoch"] = [epoch]
+
+        # 在开始事件流之前校验订阅参数，之后就无法再返回错误状态码
+        try:
+            query_subscription(query)
+        except ValueError as e:
+            body = json.dumps({"status": "error", "message": str(e)}, ensure_ascii=False).encode("utf-8")
+            await send({
+                "type": "http.response.start",
+                "status": 400,
+                "headers": [
+                    (b"content-type", b"application/json"),
+                    (b"content-length", str(len(body)).encode()),
+                    (b"access-control-allow-origin", b"*"),
+                ],
+            })
+            await send({"type": "http.response.body", "body": body})
+            return
+
+        await send({
+            "type": "http.response.start",
+            "status": 200,
+            "headers": [
+                (b"content-type", b"text/event-stream; charset=utf-8"),
+                (b"cache-control", b"no-cache"),
+                # 禁止nginx等反向代理缓冲事件
+                (b"x-accel-buffering", b"no"),
+                (b"access-control-allow-origin", b"*"),
+            ],
+        })
+        await send({"type": "http.response.body", "body": f"retry: {SSE_RETRY_MS}\n\n".encode(), "more_body": True})
+
+        client_address = scope.get("client")
+        stream = EventStream(send, f"{client_address[0]}:{client_address[1]}" if client_address else None)
+        client = self.service.add_client(stream, codec=self.codec)
+        disconnect = asyncio.create_task(self._wait_disconnect(receive, stream))
+        try:
+            self.service.prepare_client(client, query)
+            # 定期发送注释行，防止代理因连接空闲而断开
+            while not stream.closed.is_set():
+                try:
+                    await asyncio.wait_for(stream.closed.wait(), SSE_KEEPALIVE_INTERVAL)
+                except asyncio.TimeoutError:
+                    if not client.queue:
+                        client.enqueue(KEEPALIVE)
+        finally:
+            disconnect.cancel()
+            await self.service.remove_client(stream)
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+
+    async def _wait_disconnect(self, receive, stream):
+        """客户端断开连接时结束事件流"""
+        while True:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                await stream.close()
+                return
@@ -0,0 +1,146 @@
+"""
+回调函数注册表测试
+"""
+
+import os
+import sys
+import asyncio
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from callbacks import CallbackRegistry
+from matter_client import merge_node_changes
+
+
+def resync_change():
+    return {"node_id": None, "event": "resync"}
+
+
+class CallbackRegistryTest(unittest.IsolatedAsyncioTestCase):
+
+    async def test_overflow_resyncs_subscriber(self):
+        """队列溢出后订阅者通过重新同步得到所有节点的最终状态，而不是永久丢失部分节点"""
+        source = {}
+        mirror = {}
+        release = asyncio.Event()
+
+        async def subscriber(change):
+            await release.wait()
+            if change["event"] == "resync":
+                mirror.clear()
+                mirror.update(source)
+            else:
+                mirror[change["node_id"]] = change["state"]
+
+        registry = CallbackRegistry("测试", maxsize=10, resync=resync_change)
+        registry.register(subscriber)
+
+        # 重连时300个节点同时发生变化，订阅者处理不过来
+        for round_ in range(3):
+            for node_id in range(300):
+                source[node_id] = round_
+                registry.publish(node_id, {"node_id": node_id, "event": "update", "state": round_})
+            await asyncio.sleep(0)
+
+        release.set()
+        for _ in range(100):
+            await asyncio.sleep(0)
+            if not registry.stats()[0]["queue_depth"]:
+                break
+        await asyncio.sleep(0)
+
+        stats = registry.stats()[0]
+        self.assertEqual(mirror, source)
+        self.assertGreater(stats["resyncs"], 0)
+        self.assertEqual(stats["dropped"], 0)
+        await registry.close()
+
+    async def test_queue_bounded_by_distinct_keys(self):
+        """队列长度随键的数量变化时，每个键保留一个位置，不需要重新同步"""
+        keys = 300
+        delivered = {}
+        release = asyncio.Event()
+
+        async def subscriber(change):
+            await release.wait()
+            delivered[change["node_id"]] = change["state"]
+
+        registry = CallbackRegistry("测试", maxsize=lambda: keys, resync=resync_change,
+                                    merge=lambda old, new: new)
+        registry.register(subscriber)
+        for round_ in range(3):
+            for node_id in range(keys):
+                registry.publish(node_id, {"node_id": node_id, "event": "update", "state": round_})
+            await asyncio.sleep(0)
+
+        release.set()
+        while registry.stats()[0]["queue_depth"]:
+            await asyncio.sleep(0)
+        await asyncio.sleep(0)
+
+        stats = registry.stats()[0]
+        self.assertEqual(delivered, {node_id: 2 for node_id in range(keys)})
+        self.assertEqual(stats["resyncs"], 0)
+        self.assertEqual(stats["dropped"], 0)
+        await registry.close()
+
+
+def node_change(event, changes=None, removed=None, fields=None):
+    return {"node_id": "1", "event": event, "changes": changes or {},
+            "removed": removed or [], "fields": fields or {}}
+
+
+class MergeNodeChangesTest(unittest.IsolatedAsyncioTestCase):
+
+    def test_added_then_updated_stays_added(self):
+        merged = merge_node_changes(
+            node_change("node_added", {"1/97/4": 0, "0/40/1": "V"}, fields={"available": True}),
+            node_change("attribute_updated", {"1/97/4": 65}))
+        self.assertEqual(merged["event"], "node_added")
+        self.assertEqual(merged["changes"], {"1/97/4": 65, "0/40/1": "V"})
+        self.assertEqual(merged["fields"], {"available": True})
+
+    def test_removed_then_added_is_added(self):
+        merged = merge_node_changes(node_change("node_removed"),
+                                    node_change("node_updated", {"1/97/4": 1}))
+        self.assertEqual(merged["event"], "node_added")
+        self.assertEqual(merged["changes"], {"1/97/4": 1})
+
+    def test_removed_wins(self):
+        merged = merge_node_changes(node_change("node_added", {"1/97/4": 0}), node_change("node_removed"))
+        self.assertEqual(merged["event"], "node_removed")
+
+    def test_updates_merge_changes_and_removals(self):
+        merged = merge_node_changes(node_change("node_updated", {"1/97/4": 0, "1/84/1": 1}, removed=["1/85/1"]),
+                                    node_change("attribute_updated", {"1/85/1": 2}, removed=["1/84/1"]))
+        self.assertEqual(merged["event"], "attribute_updated")
+        self.assertEqual(merged["changes"], {"1/97/4": 0, "1/85/1": 2})
+        self.assertEqual(merged["removed"], ["1/84/1"])
+
+    async def test_subscriber_sees_node_added(self):
+        """新增节点后立即更新属性，订阅者收到的仍是node_added"""
+        received = []
+        release = asyncio.Event()
+
+        async def subscriber(change):
+            await release.wait()
+            received.append(change)
+
+        registry = CallbackRegistry("测试", merge=merge_node_changes)
+        registry.register(subscriber)
+        registry.publish("0", node_change("attribute_updated", {"1/97/4": 1}))
+        await asyncio.sleep(0)
+        registry.publish("1", node_change("node_added", {"1/97/4": 0}))
+        registry.publish("1", node_change("attribute_updated", {"1/97/4": 65}))
+        release.set()
+        while registry.stats()[0]["queue_depth"]:
+            await asyncio.sleep(0)
+        await asyncio.sleep(0)
+        self.assertEqual([change["event"] for change in received], ["attribute_updated", "node_added"])
+        self.assertEqual(received[1]["changes"], {"1/97/4": 65})
+        await registry.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
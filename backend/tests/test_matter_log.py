@@ -0,0 +1,57 @@
+"""
+Matter通信日志测试
+"""
+
+import os
+import sys
+import queue
+import logging
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import matter_log
+from matter_log import LazyJson, MatterQueueHandler, log_traffic, traffic_logger
+
+
+class MatterLogTest(unittest.TestCase):
+
+    def setUp(self):
+        self.queue = queue.Queue()
+        self.handler = MatterQueueHandler(self.queue)
+        self.logger = logging.getLogger("matter_client")
+        self.level = self.logger.level
+        self.logger.setLevel(logging.DEBUG)
+        self.logger.addHandler(self.handler)
+
+    def tearDown(self):
+        self.logger.removeHandler(self.handler)
+        self.logger.setLevel(self.level)
+        traffic_logger.setLevel(logging.DEBUG if matter_log.MATTER_LOG_TRAFFIC else logging.INFO)
+
+    def test_traffic_disabled_by_default(self):
+        """Matter客户端日志为DEBUG时，报文日志默认仍不生成记录"""
+        self.assertFalse(matter_log.MATTER_LOG_TRAFFIC)
+        log_traffic("recv", None, '{"result": []}')
+        self.assertTrue(self.queue.empty())
+
+    def test_traffic_enabled(self):
+        traffic_logger.setLevel(logging.DEBUG)
+        log_traffic("recv", "1", '{"result": []}')
+        record = self.queue.get_nowait()
+        self.assertIn("size=14", record.getMessage())
+
+    def test_lazy_json_frozen_when_accepted(self):
+        """入队之后修改原对象不影响日志内容"""
+        status = {"operational_state": 1, "nested": {"battery_level": 80}}
+        self.logger.info("状态: %s", LazyJson(status))
+        status["operational_state"] = 2
+        status["nested"]["battery_level"] = 10
+        status["added"] = True
+        record = self.queue.get_nowait()
+        self.assertEqual(record.getMessage(),
+                         '状态: {"operational_state": 1, "nested": {"battery_level": 80}}')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,96 @@
+"""
+Matter客户端连接池测试
+"""
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from matter_pool import MatterClientPool
+
+
+def make_node(node_id, operational_state=0):
+    return {"node_id": node_id, "available": True, "attributes": {"1/97/4": operational_state}}
+
+
+def fake_send_command(server, commands):
+    """记录发往某个服务器的命令，立即返回成功"""
+    async def send_command(command, params=None, timeout=None):
+        commands.append((server, command, params))
+        return {"success": True, "message_id": None, "result": None, "error_code": None,
+                "details": None, "latency_ms": None}
+    return send_command
+
+
+class MatterClientPoolTest(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.pool = MatterClientPool({"a": "ws://a/ws", "b": "ws://b/ws"})
+        self.pool.clients["a"].nodes.put(make_node(1))
+        self.pool.clients["a"].nodes.put(make_node(2, operational_state=65))
+        self.pool.clients["b"].nodes.put(make_node(1, operational_state=65))
+        self.commands = []
+        for name, client in self.pool.clients.items():
+            client.send_command = fake_send_command(name, self.commands)
+
+    def test_qualify_and_resolve(self):
+        self.assertEqual(self.pool.qualify("b", 1), "b:1")
+        self.assertEqual(self.pool.resolve("b:1"), ("b", "1"))
+        # 未限定的节点ID按服务器顺序查找
+        self.assertEqual(self.pool.resolve(1), ("a", "1"))
+        self.assertEqual(self.pool.resolve("2"), ("a", "2"))
+        self.assertIsNone(self.pool.resolve("b:2"))
+        self.assertIsNone(self.pool.resolve("c:1"))
+        self.assertIsNone(self.pool.resolve("3"))
+
+    def test_single_server_ids_unqualified(self):
+        pool = MatterClientPool({"default": "ws://a/ws"})
+        pool.clients["default"].nodes.put(make_node(4))
+        self.assertEqual(pool.qualify("default", 4), "4")
+        self.assertEqual(list(pool.nodes), ["4"])
+        self.assertEqual(pool.resolve("default:4"), ("default", "4"))
+
+    def test_merged_node_store(self):
+        nodes = self.pool.get_all_nodes()
+        self.assertEqual(len(nodes), 3)
+        self.assertEqual(sorted(nodes), ["a:1", "a:2", "b:1"])
+        self.assertIs(nodes.get("b:1"), self.pool.clients["b"].nodes.get(1))
+        self.assertEqual(nodes.owner("b:1"), "b")
+        self.assertEqual(nodes.find("1/97/4", 65), {"a:2", "b:1"})
+        self.assertEqual(nodes.values("1/97/4"), {"a:1": 0, "a:2": 65, "b:1": 65})
+        self.assertNotIn("b:2", nodes)
+
+    async def test_command_routed_to_owner(self):
+        """命令发送到节点所属的服务器，节点ID替换为服务器内的ID"""
+        result = await self.pool.send_command("start", {"node_id": "b:1"})
+        self.assertEqual(result["server"], "b")
+        result = await self.pool.send_command("stop", {"node_id": "2"})
+        self.assertEqual(result["server"], "a")
+        self.assertEqual(self.commands, [("b", "start", {"node_id": "1"}), ("a", "stop", {"node_id": "2"})])
+
+    async def test_unknown_node(self):
+        result = await self.pool.send_command("start", {"node_id": "b:2"})
+        self.assertFalse(result["success"])
+        self.assertIsNone(result["server"])
+        self.assertEqual(self.commands, [])
+
+    async def test_node_callback_qualified(self):
+        changes = []
+
+        async def callback(change):
+            changes.append(change)
+
+        self.pool.register_node_callback(callback)
+        wrapper = self.pool._node_callback_wrappers[callback][1][1]
+        await wrapper({"node_id": "1", "event": "attribute_updated"})
+        await wrapper({"node_id": None, "event": "resync"})
+        self.assertEqual(changes, [
+            {"node_id": "b:1", "event": "attribute_updated", "server": "b"},
+            {"node_id": None, "event": "resync", "server": "b"},
+        ])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,109 @@
+"""
+共享内存节点快照和HTTP读取工作进程测试
+"""
+
+import os
+import sys
+import json
+import time
+import tempfile
+import unittest
+import multiprocessing
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from node_snapshot import SnapshotWriter, SnapshotReader
+
+SIZE = 1 << 20
+
+
+def write_snapshots(path, stop):
+    """写入进程：不停写入新版本，快照内容记录自己的版本号，节点数据大小不断变化"""
+    writer = SnapshotWriter(path, SIZE)
+    version = 0
+    while not stop.is_set():
+        version += 1
+        writer.write(json.dumps({
+            "connected": True,
+            "device_status": {"version": version},
+            "nodes": [{"node_id": version, "attributes": {"0/40/1": "x" * (version % 5000)}}],
+        }).encode("utf-8"))
+
+
+class SeqlockTest(unittest.TestCase):
+
+    def setUp(self):
+        self.path = os.path.join(tempfile.mkdtemp(), "nodes")
+
+    def test_concurrent_writer_and_reader(self):
+        """写入进程不停更新时，读取到的每个快照都完整，版本号单调递增且与内容一致"""
+        ctx = multiprocessing.get_context("fork")
+        stop = ctx.Event()
+        process = ctx.Process(target=write_snapshots, args=(self.path, stop))
+        process.start()
+        try:
+            reader = SnapshotReader(self.path, SIZE)
+            deadline = time.time() + 5
+            while reader.read().version == 0 and time.time() < deadline:
+                time.sleep(0.01)
+            versions = []
+            deadline = time.time() + 1
+            while time.time() < deadline:
+                snapshot = reader.read()
+                # 内容中的版本号与读取时的偶数序列号对应的版本一致，说明没有读到写入中的数据槽
+                self.assertEqual(snapshot.device_status["version"], snapshot.version)
+                self.assertEqual(len(snapshot.nodes), 1)
+                versions.append(snapshot.version)
+        finally:
+            stop.set()
+            process.join()
+        self.assertEqual(versions, sorted(versions))
+        self.assertGreater(len(set(versions)), 1)
+
+    def test_odd_sequence_keeps_previous_version(self):
+        """写入中（序列号为奇数）时读取者使用上一个完整版本"""
+        writer = SnapshotWriter(self.path, SIZE)
+        try:
+            writer.write(json.dumps({"device_status": {"version": 1}}).encode("utf-8"))
+            reader = SnapshotReader(self.path, SIZE)
+            self.assertEqual(reader.read().version, 1)
+
+            writer._sequence[0] = 3
+            snapshot = reader.read()
+            self.assertEqual(snapshot.version, 1)
+            self.assertEqual(snapshot.device_status, {"version": 1})
+
+            writer._sequence[0] = 2
+            writer.version = 1
+            writer.write(json.dumps({"device_status": {"version": 2}}).encode("utf-8"))
+            self.assertEqual(reader.read().device_status, {"version": 2})
+        finally:
+            writer.close()
+
+    def test_missing_file(self):
+        reader = SnapshotReader(self.path, SIZE)
+        self.assertEqual(reader.read().version, 0)
+
+
+class ReadWorkerTest(unittest.TestCase):
+
+    def setUp(self):
+        import read_worker
+        self.http = read_worker.app.test_client()
+
+    def test_writes_rejected(self):
+        """只读工作进程拒绝控制和配置等写入请求"""
+        for method, path in (("POST", "/api/control"), ("POST", "/api/config"), ("PUT", "/api/nodes"),
+                             ("DELETE", "/api/node/1")):
+            response = self.http.open(path, method=method, json={"action": "start"})
+            self.assertEqual(response.status_code, 405, path)
+            self.assertEqual(response.headers["Allow"], "GET, HEAD, OPTIONS")
+            self.assertEqual(response.json["status"], "error")
+
+    def test_reads_allowed(self):
+        self.assertNotEqual(self.http.get("/api/nodes").status_code, 405)
+        self.assertNotEqual(self.http.options("/api/nodes").status_code, 405)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,143 @@
+"""
+节点存储测试
+"""
+
+import os
+import sys
+import threading
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from node_store import NodeStore, RetentionFilter, parse_path
+
+
+def make_node(node_id, operational_state=0):
+    return {"node_id": node_id, "available": True, "attributes": {"1/97/4": operational_state}}
+
+
+class NodeStoreIterationTest(unittest.TestCase):
+    """请求线程遍历节点时，事件循环可能同时增删节点"""
+
+    def setUp(self):
+        self.store = NodeStore()
+        for node_id in range(1, 11):
+            self.store.put(make_node(node_id))
+
+    def test_items_while_adding_and_removing(self):
+        seen = []
+        for node_id, node in self.store.items():
+            seen.append(node_id)
+            self.store.put(make_node(100 + int(node_id)))
+            self.store.remove(node_id)
+        self.assertEqual(len(seen), 10)
+        self.assertEqual(sorted(self.store, key=int), [str(node_id) for node_id in range(101, 111)])
+
+    def test_iter_values_and_find_while_mutating(self):
+        for node_id in self.store:
+            self.store.put(make_node(200 + int(node_id), operational_state=65))
+        self.assertEqual(len(self.store), 20)
+        self.assertEqual(len(self.store.find("1/97/4", 65)), 10)
+        # 非热点属性的查找遍历所有节点
+        for node_id in list(self.store)[:5]:
+            self.store.set_attribute(node_id, "1/47/12", 100)
+        for node_id in self.store.values("1/47/12"):
+            self.store.remove(node_id)
+        self.assertEqual(len(self.store), 15)
+
+    def test_concurrent_mutation_from_another_thread(self):
+        stop = threading.Event()
+
+        def mutate():
+            node_id = 1000
+            while not stop.is_set():
+                self.store.put(make_node(node_id))
+                self.store.remove(node_id - 5)
+                node_id += 1
+
+        thread = threading.Thread(target=mutate)
+        thread.start()
+        try:
+            for _ in range(2000):
+                for node_id, node in self.store.items():
+                    node.get_attribute("1/97/4")
+                sorted(str(node_id) for node_id in self.store)
+                self.store.values("1/47/12")
+                self.store.memory_stats()
+        finally:
+            stop.set()
+            thread.join()
+
+
+class RetentionTest(unittest.TestCase):
+    """属性保留规则"""
+
+    RETAIN = ["0/40/*", "1/97/4", "*/47/12"]
+
+    def setUp(self):
+        self.store = NodeStore(retain=self.RETAIN)
+        self.store.put({"node_id": 1, "available": True, "attributes": {
+            "0/40/1": "Vendor",     # 通配符规则
+            "0/40/999": 1,          # 通配符规则，非热点属性
+            "1/97/4": 0,            # 精确规则
+            "2/47/12": 80,          # 通配符端点
+            "0/29/0": [],           # 不保存
+            "1/97/5": None,         # 同一集群的其他属性不保存
+        }})
+
+    def test_retained_and_dropped_paths(self):
+        node = self.store.get(1)
+        self.assertEqual(node.get_attribute("0/40/1"), "Vendor")
+        self.assertEqual(node.get_attribute("0/40/999"), 1)
+        self.assertEqual(node.get_attribute("1/97/4"), 0)
+        self.assertEqual(node.get_attribute("2/47/12"), 80)
+        self.assertIsNone(node.get_attribute("0/29/0"))
+        self.assertIsNone(node.get_attribute("1/97/5"))
+
+    def test_set_attribute_skips_unretained(self):
+        self.assertFalse(self.store.set_attribute(1, "0/29/0", [1]))
+        self.assertIsNone(self.store.get(1).get_attribute("0/29/0"))
+        self.assertTrue(self.store.set_attribute(1, "1/97/4", 65))
+        self.assertEqual(self.store.find("1/97/4", 65), {"1"})
+        # 值未变化时不报告变化
+        self.assertFalse(self.store.set_attribute(1, "1/97/4", 65))
+
+    def test_decisions_cached_per_path(self):
+        retain = RetentionFilter(self.RETAIN)
+        self.assertTrue(retain((0, 40, 5)))
+        self.assertFalse(retain((0, 29, 0)))
+        self.assertEqual(retain._decisions, {(0, 40, 5): True, (0, 29, 0): False})
+        # 缓存的判断结果不再重新匹配规则
+        retain._decisions[(0, 29, 0)] = True
+        self.assertTrue(retain((0, 29, 0)))
+
+    def test_invalid_pattern(self):
+        with self.assertRaises(ValueError):
+            RetentionFilter(["0/40"])
+
+    def test_parsed_paths_shared(self):
+        """同一路径字符串解析为同一个元组对象"""
+        self.assertIs(parse_path("1/97/4"), parse_path("1/97/4"))
+        self.assertEqual(parse_path((1, 97, 4)), (1, 97, 4))
+
+    def test_memory_stats(self):
+        stats = self.store.memory_stats()
+        self.assertEqual(stats["retain"], self.RETAIN)
+        self.assertEqual(stats["nodes"], 1)
+        self.assertEqual(stats["attributes"], 4)
+        self.assertEqual(stats["dropped_attributes"], 2)
+        self.assertGreater(stats["bytes_per_node"], 0)
+        self.store.remove(1)
+        stats = self.store.memory_stats()
+        self.assertEqual((stats["nodes"], stats["dropped_attributes"], stats["bytes_per_node"]), (0, 0, 0))
+
+    def test_put_reports_removed_retained_attributes(self):
+        changes, removed, fields = self.store.put({"node_id": 1, "available": False, "attributes": {
+            "0/40/1": "Vendor", "1/97/4": 1, "0/29/0": [2]}})
+        self.assertEqual(changes, {"1/97/4": 1})
+        self.assertEqual(sorted(removed), ["0/40/999", "2/47/12"])
+        self.assertEqual(fields, {"available": False})
+
+
+if __name__ == '__main__':
+    unittest.main()
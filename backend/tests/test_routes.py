@@ -0,0 +1,176 @@
+"""
+HTTP接口测试
+"""
+
+import os
+import sys
+import unittest
+from unittest import mock
+from flask import Flask
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from api import routes
+from api.routes import api, execute_control, read_node_attribute
+from config import MATTER_COMMAND_MAX_TIMEOUT
+from node_store import NodeStore
+
+
+class FakeMatterClient:
+    """记录发送的命令，立即返回成功"""
+
+    def __init__(self):
+        self.commands = []
+
+    async def send_command(self, command, params=None, timeout=None):
+        self.commands.append((command, params, timeout))
+        return {"success": True, "error_code": None, "details": None}
+
+
+class FakeAttributeClient:
+    """只保存部分属性的节点存储，其他属性从模拟的Matter Server读取"""
+
+    def __init__(self, result):
+        self.nodes = NodeStore(retain=["1/97/*"])
+        self.nodes.put({"node_id": 1, "available": True, "attributes": {"1/97/4": 65, "0/29/0": [1]}})
+        self.result = result
+        self.commands = []
+
+    def get_node_info(self, node_id):
+        return self.nodes.get(node_id)
+
+    async def send_command(self, command, params=None, timeout=None):
+        self.commands.append((command, params))
+        return self.result
+
+
+class ReadNodeAttributeTest(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.matter_client = FakeAttributeClient(
+            {"success": True, "error_code": None, "details": None, "result": {"0/29/0": [1]}})
+
+    async def test_retained_attribute_from_cache(self):
+        body, status = await read_node_attribute(self.matter_client, "1", "1/97/4")
+        self.assertEqual(status, 200)
+        self.assertEqual(body["data"]["value"], 65)
+        self.assertEqual(body["data"]["source"], "cache")
+        self.assertEqual(self.matter_client.commands, [])
+
+    async def test_dropped_attribute_from_server(self):
+        body, status = await read_node_attribute(self.matter_client, "1", "0/29/0")
+        self.assertEqual(status, 200)
+        self.assertEqual(body["data"]["value"], [1])
+        self.assertEqual(body["data"]["source"], "matter_server")
+        self.assertEqual(self.matter_client.commands,
+                         [("read_attribute", {"node_id": "1", "attribute_path": "0/29/0"})])
+
+    async def test_server_timeout(self):
+        self.matter_client.result = {"success": False, "error_code": "timeout", "details": "等待响应超时"}
+        body, status = await read_node_attribute(self.matter_client, "1", "0/29/0")
+        self.assertEqual(status, 504)
+
+    async def test_unknown_node_and_invalid_path(self):
+        self.assertEqual((await read_node_attribute(self.matter_client, "2", "1/97/4"))[1], 404)
+        self.assertEqual((await read_node_attribute(self.matter_client, "1", "1/x/4"))[1], 400)
+        self.assertEqual(self.matter_client.commands, [])
+
+
+class NodeAttributeRouteTest(unittest.TestCase):
+    """GET /api/node/<id>/attribute/<路径>，没有事件循环时在请求线程中读取"""
+
+    def setUp(self):
+        app = Flask(__name__)
+        app.register_blueprint(api, url_prefix='/api')
+        app.matter_client = FakeAttributeClient(
+            {"success": True, "error_code": None, "details": None, "result": {"0/29/0": [1]}})
+        app.loop = None
+        self.app = app
+        self.http = app.test_client()
+
+    def test_cache_and_server(self):
+        response = self.http.get('/api/node/1/attribute/1/97/4')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json["data"]["source"], "cache")
+        response = self.http.get('/api/node/1/attribute/0/29/0')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json["data"]["source"], "matter_server")
+        self.assertEqual(len(self.app.matter_client.commands), 1)
+
+    def test_errors(self):
+        self.assertEqual(self.http.get('/api/node/2/attribute/1/97/4').status_code, 404)
+        self.assertEqual(self.http.get('/api/node/1/attribute/1/x/4').status_code, 400)
+
+
+class NodeViewCacheTest(unittest.TestCase):
+    """GET /api/node/<id> 的响应缓存和ETag"""
+
+    def setUp(self):
+        app = Flask(__name__)
+        app.register_blueprint(api, url_prefix='/api')
+        app.matter_client = FakeAttributeClient(None)
+        self.nodes = app.matter_client.nodes
+        self.http = app.test_client()
+
+    def test_not_modified_until_node_changes(self):
+        response = self.http.get('/api/node/1')
+        self.assertEqual(response.status_code, 200)
+        etag = response.headers['ETag']
+        self.assertIsNotNone(self.nodes.get(1).view)
+
+        response = self.http.get('/api/node/1', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+
+        self.nodes.set_attribute(1, "1/97/4", 66)
+        self.assertIsNone(self.nodes.get(1).view)
+        response = self.http.get('/api/node/1', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.headers['ETag'], etag)
+
+    def test_view_rendered_during_update_not_cached(self):
+        """渲染期间节点被更新时，过期的渲染结果不留在缓存中，下一次请求重新渲染"""
+        build_node_view = routes.build_node_view
+
+        def racing(node_id, node_info):
+            data = build_node_view(node_id, node_info)
+            self.nodes.set_attribute(1, "1/97/4", 66)
+            return data
+
+        with mock.patch.object(routes, 'build_node_view', racing):
+            stale = self.http.get('/api/node/1')
+        self.assertIsNone(self.nodes.get(1).view)
+        fresh = self.http.get('/api/node/1')
+        self.assertNotEqual(fresh.headers['ETag'], stale.headers['ETag'])
+        self.assertEqual(self.nodes.get(1).view[2], fresh.headers['ETag'].strip('"'))
+
+
+class ExecuteControlTest(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.matter_client = FakeMatterClient()
+
+    async def control(self, **data):
+        return await execute_control(self.matter_client, dict(action="start", node_id="1", **data))
+
+    async def test_timeout_passed_as_float(self):
+        for value in (5, "2.5", MATTER_COMMAND_MAX_TIMEOUT):
+            body, status = await self.control(timeout=value)
+            self.assertEqual(status, 200)
+            self.assertEqual(self.matter_client.commands[-1][2], float(value))
+
+    async def test_default_timeout(self):
+        body, status = await self.control()
+        self.assertEqual(status, 200)
+        self.assertIsNone(self.matter_client.commands[-1][2])
+
+    async def test_invalid_timeout_rejected(self):
+        """无效的timeout返回400，不发送命令"""
+        for value in ("abc", -1, 0, MATTER_COMMAND_MAX_TIMEOUT + 1, "nan", "inf", True, [5], {}):
+            body, status = await self.control(timeout=value)
+            self.assertEqual(status, 400, value)
+            self.assertEqual(body["status"], "error")
+        self.assertEqual(self.matter_client.commands, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
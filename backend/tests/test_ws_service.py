@@ -0,0 +1,273 @@
+"""
+WebSocket服务订阅测试
+"""
+
+import os
+import sys
+import json
+import asyncio
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import ws_service
+from ws_service import WebSocketService, ReplayBuffer, parse_subscription
+from sse import EventStreamHandler
+
+
+class FakeWebSocket:
+    """记录发送的消息的WebSocket连接"""
+
+    subprotocol = None
+    remote_address = ("127.0.0.1", 0)
+
+    def __init__(self):
+        self.sent = []
+        self.closed = None
+
+    async def send(self, message):
+        self.sent.append(json.loads(message))
+
+    async def close(self, code=1000, reason=""):
+        self.closed = (code, reason)
+
+
+async def drain():
+    """等待发送任务发送完队列中的消息"""
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+class SubscriptionTest(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        patcher = mock.patch.object(ws_service, "WS_COALESCE_WINDOW", 0)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.service = WebSocketService()
+        self.websocket = FakeWebSocket()
+        self.client = self.service.add_client(self.websocket)
+
+    async def asyncTearDown(self):
+        await self.service.remove_client(self.websocket)
+
+    def patched_nodes(self):
+        return [message["node_id"] for message in self.websocket.sent if message["type"] == "patch"]
+
+    async def test_wildcard_unsubscribe_keeps_new_nodes(self):
+        """订阅所有节点的客户端取消订阅一个节点后，之后新增的节点仍然会收到"""
+        self.service.update_node_status("1", {"name": "a"})
+        self.service.update_node_status("2", {"name": "b"})
+        self.service.unsubscribe(self.client, ["1"])
+        self.assertIsNone(self.client.node_ids)
+        self.assertEqual(self.client.excluded_node_ids, {"1"})
+        await drain()
+        self.websocket.sent.clear()
+
+        self.service.update_node_status("1", {"name": "a2"})
+        self.service.update_node_status("2", {"name": "b2"})
+        self.service.update_node_status("3", {"name": "c"})
+        await drain()
+        self.assertEqual(self.patched_nodes(), ["2", "3"])
+
+    async def test_subscribe_all_clears_exclusions(self):
+        """重新订阅所有节点后不再排除之前取消订阅的节点，排除索引被清理"""
+        self.service.unsubscribe(self.client, ["1", "2"])
+        self.assertEqual(set(self.service.exclusions), {"1", "2"})
+        self.service.subscribe(self.client, "*")
+        self.assertEqual(self.client.excluded_node_ids, frozenset())
+        self.assertEqual(self.service.exclusions, {})
+        self.assertTrue(self.client.wants("1"))
+
+    async def test_explicit_unsubscribe(self):
+        """只订阅了部分节点的客户端取消订阅后只剩余其他节点"""
+        self.service.subscribe(self.client, ["1", 2])
+        self.service.unsubscribe(self.client, ["1"])
+        self.assertEqual(self.client.node_ids, {"2"})
+        self.assertEqual(self.service.subscribers("1"), set())
+        self.assertEqual(self.service.subscribers("2"), {self.client})
+
+    async def test_invalid_subscription_keeps_state(self):
+        """参数无效时抛出ValueError，订阅保持不变"""
+        self.service.subscribe(self.client, ["1"], [97])
+        for node_ids, clusters in ((None, ["abc"]), (None, "97"), ("1", None), ([{"id": 1}], None),
+                                   (["2"], [97, "x"])):
+            with self.assertRaises(ValueError):
+                self.service.subscribe(self.client, node_ids, clusters)
+        with self.assertRaises(ValueError):
+            self.service.unsubscribe(self.client, "1")
+        self.assertEqual(self.client.node_ids, {"1"})
+        self.assertEqual(self.client.clusters, {97})
+
+    async def test_subscription_from_url(self):
+        """连接URL中的node_ids和clusters参数"""
+        self.service.prepare_client(self.client, {"node_ids": ["1,2"], "clusters": ["97"]})
+        self.assertEqual(self.client.node_ids, {"1", "2"})
+        self.assertEqual(self.client.clusters, {97})
+        with self.assertRaises(ValueError):
+            self.service.prepare_client(self.client, {"clusters": ["97,x"]})
+
+    def test_parse_subscription(self):
+        self.assertEqual(parse_subscription(["1", 2], ["97", 84]), ({"1", "2"}, {97, 84}))
+        self.assertEqual(parse_subscription("*", "*"), ("*", "*"))
+        self.assertEqual(parse_subscription(), (None, None))
+
+
+def make_patch(seq):
+    return {"type": "patch", "seq": seq, "prev": 0, "node_id": "1", "changes": {}, "removed": []}
+
+
+class ReplayBufferTest(unittest.TestCase):
+
+    def test_since(self):
+        replay = ReplayBuffer(maxlen=10, max_bytes=1000)
+        for seq in range(1, 6):
+            replay.append(make_patch(seq), 10)
+        self.assertEqual([patch["seq"] for patch in replay.since(2, 5)], [3, 4, 5])
+        self.assertEqual(replay.since(0, 5)[0]["seq"], 1)
+        self.assertEqual(replay.since(5, 5), [])
+        # 客户端的seq大于服务器当前seq（服务已重启）
+        self.assertIsNone(replay.since(6, 5))
+
+    def test_evicted_by_count_and_bytes(self):
+        replay = ReplayBuffer(maxlen=3, max_bytes=1000)
+        for seq in range(1, 6):
+            replay.append(make_patch(seq), 10)
+        self.assertEqual((len(replay), replay.oldest_seq, replay.bytes), (3, 3, 30))
+        self.assertIsNone(replay.since(1, 5))
+        self.assertEqual([patch["seq"] for patch in replay.since(2, 5)], [3, 4, 5])
+
+        replay = ReplayBuffer(maxlen=100, max_bytes=25)
+        for seq in range(1, 6):
+            replay.append(make_patch(seq), 10)
+        self.assertEqual((len(replay), replay.oldest_seq, replay.bytes), (2, 4, 20))
+        # 单个补丁超过字节数限制时仍然保留最新的一个
+        replay.append(make_patch(6), 100)
+        self.assertEqual((len(replay), replay.oldest_seq), (1, 6))
+
+
+class ResumeTest(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        patcher = mock.patch.object(ws_service, "WS_COALESCE_WINDOW", 0)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.service = WebSocketService()
+        self.service.update_node_status("1", {"name": "a"})
+        self.service.update_node_status("2", {"name": "b"})
+        self.service.update_node_status("1", {"name": "a2"})
+
+    async def connect(self, **query):
+        websocket = FakeWebSocket()
+        client = self.service.add_client(websocket)
+        self.service.prepare_client(client, {key: [value] for key, value in query.items()})
+        await drain()
+        await self.service.remove_client(websocket)
+        return websocket.sent
+
+    async def test_resume_sends_missed_patches(self):
+        sent = await self.connect(resume="1", epoch=self.service.epoch)
+        self.assertEqual([(message["type"], message["seq"]) for message in sent], [("patch", 2), ("patch", 3)])
+        self.assertEqual(self.service.resumes, 1)
+
+    async def test_resume_respects_subscription(self):
+        sent = await self.connect(resume="1", epoch=self.service.epoch, node_ids="1")
+        self.assertEqual([message["seq"] for message in sent], [3])
+
+    async def test_snapshot_when_resume_impossible(self):
+        """epoch不同（服务已重启）或无效的seq时发送快照"""
+        for query in ({"resume": "1", "epoch": "other"}, {"resume": "x", "epoch": self.service.epoch}, {}):
+            sent = await self.connect(**query)
+            self.assertEqual([message["type"] for message in sent], ["snapshot"])
+            self.assertEqual(sent[0]["seq"], 3)
+        self.assertEqual(self.service.resume_fallbacks, 1)
+
+        self.service.replay = ReplayBuffer(maxlen=1)
+        self.service.update_node_status("2", {"name": "b2"})
+        sent = await self.connect(resume="1", epoch=self.service.epoch)
+        self.assertEqual([message["type"] for message in sent], ["snapshot"])
+
+
+class CoalesceTest(unittest.IsolatedAsyncioTestCase):
+    """合并窗口内同一节点的多次更新合并为一个补丁"""
+
+    async def asyncSetUp(self):
+        for name, value in (("WS_COALESCE_WINDOW", 0.01), ("WS_MAX_FLUSH_RATE", 0)):
+            patcher = mock.patch.object(ws_service, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.service = WebSocketService()
+        self.websocket = FakeWebSocket()
+        self.service.add_client(self.websocket)
+
+    async def asyncTearDown(self):
+        await self.service.remove_client(self.websocket)
+
+    async def flush(self):
+        await asyncio.sleep(0.05)
+        await drain()
+        patches = self.websocket.sent
+        self.websocket.sent = []
+        return patches
+
+    async def test_updates_merged_in_first_change_order(self):
+        self.service.update_node_status("1", {"name": "a", "battery_level": 50})
+        self.service.update_node_status("2", {"name": "b"})
+        self.service.update_node_status("1", {"battery_level": 40})
+        patches = await self.flush()
+        self.assertEqual([(patch["node_id"], patch["seq"], patch["changes"]) for patch in patches], [
+            ("1", 1, {"name": "a", "battery_level": 40}),
+            ("2", 2, {"name": "b"}),
+        ])
+        self.assertEqual(self.service.flushes, 1)
+        self.assertEqual(self.service.coalesced_updates, 1)
+
+        # 下一个窗口的补丁的prev指向同一节点上一个补丁
+        self.service.update_node_status("1", {"name": "a2"}, removed=["battery_level"])
+        patches = await self.flush()
+        self.assertEqual(len(patches), 1)
+        self.assertEqual((patches[0]["seq"], patches[0]["prev"]), (3, 1))
+        self.assertEqual((patches[0]["changes"], patches[0]["removed"]), ({"name": "a2"}, ["battery_level"]))
+
+    async def test_removed_then_readded(self):
+        self.service.update_node_status("1", {"name": "a", "battery_level": 50})
+        await self.flush()
+        self.service.remove_node("1")
+        self.service.update_node_status("1", {"name": "a"})
+        patches = await self.flush()
+        self.assertEqual(len(patches), 1)
+        self.assertNotIn("deleted", patches[0])
+        self.assertEqual(patches[0]["changes"], {"name": "a"})
+        self.assertEqual(patches[0]["removed"], ["battery_level"])
+
+        self.service.update_node_status("1", {"battery_level": 10})
+        self.service.remove_node("1")
+        patches = await self.flush()
+        self.assertTrue(patches[0]["deleted"])
+        self.assertEqual(patches[0]["changes"], {})
+
+
+class EventStreamValidationTest(unittest.IsolatedAsyncioTestCase):
+
+    async def test_invalid_clusters_rejected_before_stream(self):
+        """事件流的订阅参数无效时返回400，而不是在发送响应头之后断开"""
+        service = WebSocketService()
+        handler = EventStreamHandler(service)
+        messages = []
+
+        async def send(message):
+            messages.append(message)
+
+        async def receive():
+            return {"type": "http.disconnect"}
+
+        scope = {"type": "http", "query_string": b"node_ids=1&clusters=abc", "headers": [], "client": None}
+        await handler(scope, receive, send)
+        self.assertEqual(messages[0]["status"], 400)
+        self.assertEqual(json.loads(messages[1]["body"])["status"], "error")
+        self.assertEqual(service.clients, {})
+
+
+if __name__ == '__main__':
+    unittest.main()
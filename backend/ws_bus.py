@@ -0,0 +1,193 @@
+"""
+WebSocket本地总线
+主进程中的WebSocketService通过Unix socket把补丁转发给多个WebSocket工作进程，
+工作进程监听同一端口（SO_REUSEPORT），由内核在进程间分配前端连接
+
+总线协议为按行分隔的JSON：订阅者连接后先收到一条完整状态 {"type": "state", ...}，
+之后每行是一个补丁，与发送给前端的JSON帧完全相同，工作进程可以直接转发而无需重新编码
+"""
+
+import os
+import sys
+import json
+import asyncio
+import logging
+from config import WS_BUS_SOCKET, WS_BUS_MAX_BUFFER, WS_BUS_RECONNECT_DELAY
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+
+class BusPublisher:
+    """总线发布者，运行在拥有MatterClient的主进程中"""
+
+    def __init__(self, ws_service, path=None):
+        """初始化总线发布者
+
+        Args:
+            ws_service: 主进程中的WebSocketService，其状态和补丁会转发给工作进程
+            path: Unix socket路径，默认使用配置中的WS_BUS_SOCKET
+        """
+        self.ws_service = ws_service
+        self.path = path or WS_BUS_SOCKET
+        self.server = None
+        self.subscribers = set()
+        self.published = 0
+        self.evicted = 0
+
+    async def start(self):
+        """启动总线并接管WebSocketService的补丁发布"""
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        self.server = await asyncio.start_unix_server(self._handle_subscriber, self.path)
+        self.ws_service.bus = self
+        logger.info(f"WebSocket总线已启动: {self.path}")
+
+    async def stop(self):
+        """关闭总线和所有订阅者连接"""
+        if self.ws_service.bus is self:
+            self.ws_service.bus = None
+        if self.server:
+            self.server.close()
+            await self.server.wait_closed()
+        for writer in list(self.subscribers):
+            writer.close()
+        self.subscribers.clear()
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        logger.info("WebSocket总线已关闭")
+
+    def publish(self, frame):
+        """向所有工作进程转发一个补丁
+
+        写缓冲区超过WS_BUS_MAX_BUFFER的工作进程会被断开，重连后重新同步完整状态。
+
+        Args:
+            frame: 补丁的JSON帧
+        """
+        data = frame.encode("utf-8") + b"\n"
+        self.published += 1
+        for writer in list(self.subscribers):
+            if writer.transport.get_write_buffer_size() > WS_BUS_MAX_BUFFER:
+                logger.warning("WebSocket工作进程处理过慢，断开总线连接")
+                self.subscribers.discard(writer)
+                self.evicted += 1
+                writer.close()
+                continue
+            writer.write(data)
+
+    def get_metrics(self):
+        """获取总线统计
+
+        Returns:
+            dict: 工作进程数量、已转发的补丁数量、被断开的次数和各连接的写缓冲区大小
+        """
+        return {
+            "path": self.path,
+            "subscribers": len(self.subscribers),
+            "published": self.published,
+            "evicted": self.evicted,
+            "buffered_bytes": [writer.transport.get_write_buffer_size() for writer in self.subscribers],
+        }
+
+    async def _handle_subscriber(self, reader, writer):
+        """处理工作进程连接：先发送完整状态，之后由publish()转发补丁"""
+        writer.write(json.dumps(self.ws_service.state_message()).encode("utf-8") + b"\n")
+        self.subscribers.add(writer)
+        logger.info(f"WebSocket工作进程已连接总线，当前数量: {len(self.subscribers)}")
+        try:
+            # 工作进程不发送数据，读到EOF表示连接已断开
+            await reader.read()
+        finally:
+            self.subscribers.discard(writer)
+            writer.close()
+            logger.info(f"WebSocket工作进程已断开总线，当前数量: {len(self.subscribers)}")
+
+
+class BusSubscriber:
+    """总线订阅者，运行在WebSocket工作进程中"""
+
+    def __init__(self, ws_service, path=None):
+        """初始化总线订阅者
+
+        Args:
+            ws_service: 工作进程中的WebSocketService
+            path: Unix socket路径，默认使用配置中的WS_BUS_SOCKET
+        """
+        self.ws_service = ws_service
+        self.path = path or WS_BUS_SOCKET
+        self.task = None
+        self.synced = asyncio.Event()
+
+    def start(self):
+        """启动订阅任务，断开后自动重连"""
+        self.task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """停止订阅任务"""
+        if self.task:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+
+    async def _run(self):
+        """连接总线并持续应用收到的状态和补丁"""
+        while True:
+            try:
+                reader, writer = await asyncio.open_unix_connection(self.path, limit=WS_BUS_MAX_BUFFER)
+                try:
+                    state = json.loads(await reader.readline())
+                    self.ws_service.load_state(state)
+                    self.synced.set()
+                    logger.info(f"已从总线同步状态，seq: {state['seq']}")
+                    while True:
+                        line = await reader.readline()
+                        if not line:
+                            break
+                        frame = line.decode("utf-8").rstrip("\n")
+                        self.ws_service.apply_patch(json.loads(frame), frame)
+                finally:
+                    writer.close()
+                logger.warning("总线连接已断开")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"连接WebSocket总线失败: {str(e)}")
+            self.synced.clear()
+            await asyncio.sleep(WS_BUS_RECONNECT_DELAY)
+
+
+async def start_workers(count, host='0.0.0.0', port=None, path=None, worker_args=()):
+    """启动WebSocket工作进程
+
+    Args:
+        count: 工作进程数量
+        host: 监听地址
+        port: 监听端口，默认从环境变量获取或使用5005
+        path: 总线的Unix socket路径
+        worker_args: 传给ws_worker.py的其他命令行参数，例如 ["--client-queue-size", "5000"]
+
+    Returns:
+        list: 工作进程（asyncio.subprocess.Process）
+    """
+    worker = os.path.join(os.path.dirname(os.path.abspath(__file__)), "ws_worker.py")
+    args = ["--host", host, "--bus", path or WS_BUS_SOCKET]
+    if port is not None:
+        args += ["--port", str(port)]
+    args += list(worker_args)
+    processes = []
+    for _ in range(count):
+        processes.append(await asyncio.create_subprocess_exec(sys.executable, worker, *args))
+    logger.info(f"已启动 {count} 个WebSocket工作进程")
+    return processes
+
+
+async def stop_workers(processes):
+    """停止WebSocket工作进程
+
+    Args:
+        processes: start_workers()返回的工作进程
+    """
+    for process in processes:
+        if process.returncode is None:
+            process.terminate()
+    await asyncio.gather(*(process.wait() for process in processes), return_exceptions=True)
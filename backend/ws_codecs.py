@@ -0,0 +1,106 @@
+"""
+WebSocket消息编解码器
+前端推送支持JSON以及可选的MessagePack/CBOR二进制格式，通过WebSocket子协议协商
+"""
+
+import json
+import logging
+
+try:
+    import msgpack
+except ImportError:  # 可选依赖
+    msgpack = None
+
+try:
+    import cbor2
+except ImportError:  # 可选依赖
+    cbor2 = None
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+
+class JsonCodec:
+    """JSON编解码器，以文本帧发送，未协商子协议的客户端使用此格式"""
+
+    name = "json"
+    subprotocol = "matter-rvc.json"
+
+    def encode(self, message):
+        return json.dumps(message)
+
+    def decode(self, data):
+        return json.loads(data)
+
+
+class MsgpackCodec:
+    """MessagePack编解码器，以二进制帧发送"""
+
+    name = "msgpack"
+    subprotocol = "matter-rvc.msgpack"
+
+    def encode(self, message):
+        return msgpack.packb(message, use_bin_type=True)
+
+    def decode(self, data):
+        return msgpack.unpackb(data, raw=False)
+
+
+class CborCodec:
+    """CBOR编解码器，以二进制帧发送"""
+
+    name = "cbor"
+    subprotocol = "matter-rvc.cbor"
+
+    def encode(self, message):
+        return cbor2.dumps(message)
+
+    def decode(self, data):
+        return cbor2.loads(data)
+
+
+DEFAULT_CODEC = JsonCodec()
+
+# 已安装依赖的编解码器：名称 -> 编解码器
+CODECS = {DEFAULT_CODEC.name: DEFAULT_CODEC}
+if msgpack is not None:
+    CODECS[MsgpackCodec.name] = MsgpackCodec()
+if cbor2 is not None:
+    CODECS[CborCodec.name] = CborCodec()
+
+
+def get_codecs(names):
+    """按优先顺序获取可用的编解码器
+
+    Args:
+        names: 编解码器名称列表，未安装依赖的编解码器会被跳过
+
+    Returns:
+        list: 编解码器列表，始终包含JSON
+    """
+    codecs = []
+    for name in names:
+        codec = CODECS.get(name)
+        if codec is None:
+            logger.warning(f"WebSocket编解码器 {name} 不可用（未安装依赖），已跳过")
+        elif codec not in codecs:
+            codecs.append(codec)
+    if DEFAULT_CODEC not in codecs:
+        codecs.append(DEFAULT_CODEC)
+    return codecs
+
+
+def select_codec(codecs, subprotocol):
+    """根据协商的子协议获取编解码器
+
+    Args:
+        codecs: 服务器支持的编解码器列表
+        subprotocol: 协商结果，None表示客户端未请求子协议
+
+    Returns:
+        编解码器，未协商时为JSON
+    """
+    for codec in codecs:
+        if codec.subprotocol == subprotocol:
+            return codec
+    return DEFAULT_CODEC
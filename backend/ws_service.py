@@ -1,34 +1,385 @@
 """
 WebSocket服务模块
 提供WebSocket服务功能，用于向前端推送设备状态
+
+状态来源于MatterClient的状态和节点回调：属性变化经node_status规范化为节点状态字段后推送，不做任何轮询。
+
+推送协议：
+- 客户端连接后先收到完整快照 {"type": "snapshot", "seq", "data", "device_seq", "node_seqs"}
+- 之后只收到字段级补丁 {"type": "patch", "seq", "prev", "node_id", "changes", "removed"}，
+  node_id为null表示设备状态，节点被移除时补丁带有 "deleted": true。seq全局单调递增，prev为同一设备/节点上一个补丁的seq，
+  客户端发现prev与本地记录不一致时说明丢失了补丁，发送 {"type": "resync"} 重新获取快照
+- 客户端默认接收所有节点的补丁，可以发送 {"type": "subscribe", "node_ids": [...], "clusters": [...]}
+  只订阅指定的节点（以及可选的集群），发送 {"type": "unsubscribe", "node_ids": [...]} 取消订阅，
+  node_ids或clusters为 "*" 表示全部。订阅变化后服务器会重新发送只包含已订阅内容的快照，
+  参数无效时订阅不变，服务器回复 {"type": "error", "request", "message"}。
+  设备状态补丁始终发送给所有客户端；按集群过滤后为空的补丁仍会发送，以保持prev链完整
+- 状态更新先在WS_COALESCE_WINDOW窗口内按设备/节点合并，再按首次变化的顺序统一分配seq并发送，
+  补丁批次的频率不超过WS_MAX_FLUSH_RATE
+- 重连时在URL中带上 ?resume=<收到的最大seq>&epoch=<快照中的epoch>（以及node_ids、clusters订阅参数），
+  服务器从重放缓冲区补发错过的补丁；缓冲区已不包含所需的补丁或服务已重启（epoch不同）时改为发送快照
+- 消息格式通过子协议协商（见ws_codecs），默认JSON文本帧，也支持MessagePack/CBOR二进制帧
 """
 
 import os
 import json
+import time
+import uuid
 import asyncio
 import logging
+from collections import deque, OrderedDict
+from urllib.parse import urlsplit, parse_qs
 import websockets
+from websockets.extensions.permessage_deflate import ServerPerMessageDeflateFactory
+from config import (WS_CLIENT_QUEUE_SIZE, WS_SLOW_CLIENT_POLICY, WS_CODECS, WS_DEFLATE_OPTIONS,
+                    WS_COALESCE_WINDOW, WS_MAX_FLUSH_RATE, WS_CLIENT_MAX_RATE,
+                    WS_REPLAY_BUFFER_SIZE, WS_REPLAY_BUFFER_MAX_BYTES)
+from ws_codecs import DEFAULT_CODEC, get_codecs, select_codec
+from node_status import FIELD_CLUSTERS, build_node_status, normalize_change
 
 # 配置日志
 logger = logging.getLogger(__name__)
 
+# 发送队列中的快照占位符，发送时才生成最新的快照
+SNAPSHOT = object()
+
+
+def field_cluster(field):
+    """获取节点状态字段所属的集群ID
+    
+    Args:
+        field: 字段名或属性路径
+        
+    Returns:
+        int: 集群ID，不属于任何集群的字段（例如available）返回None
+    """
+    cluster = FIELD_CLUSTERS.get(field)
+    if cluster is None and field.count("/") == 2:
+        try:
+            cluster = int(field.split("/")[1])
+        except ValueError:
+            pass
+    return cluster
+
+
+def filter_fields(fields, clusters):
+    """只保留属于指定集群的字段，不属于任何集群的字段始终保留
+    
+    Args:
+        fields: 字段名 -> 值，或字段名列表
+        clusters: 集群ID集合，None表示不过滤
+        
+    Returns:
+        与fields类型相同的过滤结果
+    """
+    if clusters is None:
+        return fields
+    wanted = (field for field in fields if field_cluster(field) in clusters or field_cluster(field) is None)
+    if isinstance(fields, dict):
+        return {field: fields[field] for field in wanted}
+    return list(wanted)
+
+
+def filter_patch(patch, clusters):
+    """按集群过滤补丁中的字段
+    
+    Args:
+        patch: 补丁消息
+        clusters: 集群ID集合，None表示不过滤
+        
+    Returns:
+        dict: 过滤后的补丁，不过滤时返回原补丁
+    """
+    if clusters is None or patch["node_id"] is None:
+        return patch
+    return dict(patch, changes=filter_fields(patch["changes"], clusters),
+                removed=filter_fields(patch["removed"], clusters))
+
+
+def parse_subscription(node_ids=None, clusters=None):
+    """校验并规范化订阅参数，在修改订阅之前调用，参数无效时订阅保持不变
+    
+    Args:
+        node_ids: 节点ID列表，"*" 表示所有节点，None表示不修改
+        clusters: 集群ID列表，"*" 表示所有集群，None表示不修改
+        
+    Returns:
+        tuple: (节点ID集合、"*" 或None, 集群ID集合、"*" 或None)
+        
+    Raises:
+        ValueError: node_ids或clusters不是列表，或包含无效的ID
+    """
+    if node_ids is not None and node_ids != "*":
+        if not isinstance(node_ids, (list, tuple, set, frozenset)) or not all(
+                isinstance(node_id, (str, int)) and not isinstance(node_id, bool) for node_id in node_ids):
+            raise ValueError(f"无效的node_ids: {node_ids!r}")
+        node_ids = frozenset(str(node_id) for node_id in node_ids)
+    if clusters is not None and clusters != "*":
+        if not isinstance(clusters, (list, tuple, set, frozenset)) or not all(
+                isinstance(cluster, int) and not isinstance(cluster, bool) and cluster >= 0
+                or isinstance(cluster, str) and cluster.isdigit() for cluster in clusters):
+            raise ValueError(f"无效的clusters: {clusters!r}")
+        clusters = frozenset(int(cluster) for cluster in clusters)
+    return node_ids, clusters
+
+
+def query_subscription(query):
+    """从连接URL的node_ids和clusters参数（逗号分隔）中解析订阅
+    
+    Args:
+        query: 解析后的URL查询参数
+        
+    Returns:
+        tuple: 与parse_subscription相同
+        
+    Raises:
+        ValueError: 订阅参数无效
+    """
+    node_ids = query.get("node_ids", [None])[0]
+    clusters = query.get("clusters", [None])[0]
+    if node_ids is not None and node_ids != "*":
+        node_ids = [node_id for node_id in node_ids.split(",") if node_id]
+    if clusters is not None and clusters != "*":
+        clusters = [cluster for cluster in clusters.split(",") if cluster]
+    return parse_subscription(node_ids, clusters)
+
+
+class ReplayBuffer:
+    """最近补丁的环形缓冲区，按seq补发给重连的客户端"""
+    
+    def __init__(self, maxlen=None, max_bytes=None):
+        """初始化重放缓冲区
+        
+        Args:
+            maxlen: 最多保留的补丁数量，默认使用配置中的WS_REPLAY_BUFFER_SIZE
+            max_bytes: 最多占用的字节数，默认使用配置中的WS_REPLAY_BUFFER_MAX_BYTES
+        """
+        self.maxlen = maxlen or WS_REPLAY_BUFFER_SIZE
+        self.max_bytes = max_bytes or WS_REPLAY_BUFFER_MAX_BYTES
+        # (seq, 补丁, 字节数)，seq连续递增
+        self.entries = deque()
+        self.bytes = 0
+    
+    def __len__(self):
+        return len(self.entries)
+    
+    @property
+    def oldest_seq(self):
+        """缓冲区中最早的补丁的seq，缓冲区为空时返回None"""
+        return self.entries[0][0] if self.entries else None
+    
+    def append(self, patch, size):
+        """添加补丁，超出条数或字节数限制时丢弃最早的补丁
+        
+        Args:
+            patch: 补丁消息
+            size: 补丁编码后的字节数
+        """
+        self.entries.append((patch["seq"], patch, size))
+        self.bytes += size
+        while len(self.entries) > self.maxlen or (self.bytes > self.max_bytes and len(self.entries) > 1):
+            _, _, dropped = self.entries.popleft()
+            self.bytes -= dropped
+    
+    def since(self, seq, current_seq):
+        """获取seq之后的所有补丁
+        
+        Args:
+            seq: 客户端收到的最大seq
+            current_seq: 服务器当前的seq
+            
+        Returns:
+            list: 补丁列表，缓冲区已不包含全部所需的补丁时返回None
+        """
+        if seq > current_seq:
+            return None
+        if seq == current_seq:
+            return []
+        if not self.entries or self.entries[0][0] > seq + 1:
+            return None
+        return [patch for patch_seq, patch, _ in self.entries if patch_seq > seq]
+
+
+class ClientConnection:
+    """WebSocket客户端连接，拥有独立的有界发送队列和发送任务
+    
+    广播只把消息放入各客户端的队列，不等待发送完成，
+    因此慢客户端不会影响向其他客户端推送的延迟。
+    """
+    
+    def __init__(self, websocket, service, maxsize=None, policy=None, codec=None):
+        """初始化客户端连接
+        
+        Args:
+            websocket: WebSocket连接，或提供相同send/close接口的其他连接（例如SSE事件流）
+            service: 所属的WebSocketService
+            maxsize: 发送队列长度，默认使用配置中的WS_CLIENT_QUEUE_SIZE
+            policy: 队列满时的处理策略，默认使用配置中的WS_SLOW_CLIENT_POLICY
+            codec: 消息格式，默认根据协商的子协议选择
+        """
+        self.websocket = websocket
+        self.service = service
+        # 根据协商的子协议选择消息格式
+        self.codec = codec or select_codec(service.codecs, websocket.subprotocol)
+        self.maxsize = maxsize or WS_CLIENT_QUEUE_SIZE
+        self.policy = policy or WS_SLOW_CLIENT_POLICY
+        # 发送队列：(入队时间, 已编码的消息帧或SNAPSHOT)
+        self.queue = deque()
+        self.wakeup = asyncio.Event()
+        self.writer_task = asyncio.create_task(self._write())
+        self.sent = 0
+        self.dropped = 0
+        self.last_lag_ms = 0.0
+        self.max_lag_ms = 0.0
+        # 订阅的节点ID集合，None表示所有节点
+        self.node_ids = None
+        # 订阅所有节点时取消订阅的节点ID，之后新增的节点仍然会收到
+        self.excluded_node_ids = frozenset()
+        # 订阅的集群ID集合，None表示所有集群
+        self.clusters = None
+    
+    def wants(self, node_id):
+        """是否订阅了指定节点
+        
+        Args:
+            node_id: 节点ID
+            
+        Returns:
+            bool: 是否订阅
+        """
+        if self.node_ids is None:
+            return node_id not in self.excluded_node_ids
+        return node_id in self.node_ids
+    
+    def enqueue(self, message):
+        """将消息放入发送队列，队列已满时按策略处理
+        
+        Args:
+            message: 已编码的消息帧（字符串或字节），或SNAPSHOT
+        """
+        if len(self.queue) >= self.maxsize:
+            if self.policy == "disconnect":
+                logger.warning(f"WebSocket客户端发送队列已满，断开连接: {self.websocket.remote_address}")
+                self.dropped += len(self.queue) + 1
+                self.queue.clear()
+                self.writer_task.cancel()
+                asyncio.create_task(self.websocket.close(1013, "slow consumer"))
+                return
+            if self.policy == "coalesce":
+                # 积压的补丁全部丢弃，改为发送一份最新的完整快照
+                self.dropped += len(self.queue)
+                self.queue.clear()
+                message = SNAPSHOT
+            else:
+                self.queue.popleft()
+                self.dropped += 1
+        self.queue.append((time.monotonic(), message))
+        self.wakeup.set()
+    
+    def stats(self):
+        """获取客户端的发送统计
+        
+        Returns:
+            dict: 队列深度、当前积压时长、发送延迟（毫秒）、已发送和已丢弃的消息数量
+        """
+        oldest_ms = (time.monotonic() - self.queue[0][0]) * 1000 if self.queue else 0.0
+        return {
+            "remote_address": str(self.websocket.remote_address),
+            "codec": self.codec.name,
+            "node_ids": "*" if self.node_ids is None else sorted(self.node_ids),
+            "excluded_node_ids": sorted(self.excluded_node_ids),
+            "clusters": "*" if self.clusters is None else sorted(self.clusters),
+            "queue_depth": len(self.queue),
+            "lag_ms": round(oldest_ms, 2),
+            "last_lag_ms": round(self.last_lag_ms, 2),
+            "max_lag_ms": round(self.max_lag_ms, 2),
+            "sent": self.sent,
+            "dropped": self.dropped,
+        }
+    
+    async def close(self):
+        """停止发送任务"""
+        self.writer_task.cancel()
+        await asyncio.gather(self.writer_task, return_exceptions=True)
+    
+    async def _write(self):
+        """发送任务：按顺序发送队列中的消息"""
+        try:
+            while True:
+                if not self.queue:
+                    self.wakeup.clear()
+                    await self.wakeup.wait()
+                    continue
+                enqueued_at, message = self.queue.popleft()
+                if message is SNAPSHOT:
+                    message = self.codec.encode(self.service.snapshot_message(self))
+                await self.websocket.send(message)
+                self.sent += 1
+                if WS_CLIENT_MAX_RATE:
+                    # 限制发送频率，期间到达的消息在队列中积压
+                    await asyncio.sleep(1 / WS_CLIENT_MAX_RATE)
+                self.last_lag_ms = (time.monotonic() - enqueued_at) * 1000
+                if self.last_lag_ms > self.max_lag_ms:
+                    self.max_lag_ms = self.last_lag_ms
+        except websockets.exceptions.ConnectionClosed:
+            pass
+        except Exception as e:
+            # 发送任务已无法继续：立即取消注册，不再向该客户端的队列放入消息，并断开连接
+            logger.error(f"向WebSocket客户端发送消息失败，断开连接: {str(e)}", exc_info=True)
+            self.queue.clear()
+            self.service.discard_client(self.websocket)
+            await self.websocket.close(1011, "internal error")
+
 class WebSocketService:
     """WebSocket服务类，用于管理WebSocket连接和消息广播"""
     
     def __init__(self):
         """初始化WebSocket服务"""
-        self.clients = set()
+        # WebSocket连接 -> ClientConnection
+        self.clients = {}
+        # 主题索引：节点ID -> 订阅了该节点的客户端集合
+        self.topics = {}
+        # 订阅所有节点的客户端
+        self.all_nodes_clients = set()
+        # 排除索引：节点ID -> 订阅所有节点但取消订阅了该节点的客户端集合
+        self.exclusions = {}
+        # 支持的消息格式，按协商优先顺序排列
+        self.codecs = get_codecs(WS_CODECS)
+        # 已编码的消息帧数量
+        self.encoded_frames = 0
+        # 服务实例标识，重启后seq从头开始，客户端据此判断能否续传
+        self.epoch = uuid.uuid4().hex[:12]
+        self.replay = ReplayBuffer()
+        self.resumes = 0
+        self.resume_fallbacks = 0
+        # 多进程模式下的本地总线发布者（见ws_bus），每个补丁都会转发给各WebSocket工作进程
+        self.bus = None
         self.server = None
         
-        # 设备状态（模拟数据）
+        # 设备状态，由MatterClient的状态回调更新
         self.device_status = {
-            "cleaning_mode": "未知",
-            "operation_status": "未知",
+            "current_cleaning_mode": "未知",
+            "operational_state": "未知",
             "battery_level": 0
         }
         
-        # 状态更新任务
-        self.update_task = None
+        # 各节点的状态：节点ID -> {字段: 值}
+        self.node_status = {}
+        
+        # 全局递增的补丁序列号，以及设备状态和各节点最近一个补丁的序列号
+        self.seq = 0
+        self.device_seq = 0
+        self.node_seqs = {}
+        
+        # 合并窗口内尚未发送的更新：节点ID（None表示设备状态）-> 待发送的变化，按首次变化的顺序排列
+        self.pending = OrderedDict()
+        self.flush_handle = None
+        self.last_flush = 0.0
+        self.coalesced_updates = 0
+        self.flushes = 0
+        
+        # 状态来源
+        self.matter_client = None
     
     async def handle_client(self, websocket):
         """处理WebSocket客户端连接
@@ -36,13 +387,17 @@ class WebSocketService:
         Args:
             websocket: WebSocket连接
         """
-        # 添加到客户端列表
-        self.clients.add(websocket)
-        logger.info(f"新的WebSocket客户端连接，当前连接数: {len(self.clients)}")
+        client = self.add_client(websocket)
         
         try:
-            # 发送当前设备状态
-            await self.send_status_to_client(websocket)
+            query = parse_qs(urlsplit(websocket.request.path).query) if websocket.request else {}
+            try:
+                self.prepare_client(client, query)
+            except ValueError as e:
+                logger.warning(f"客户端订阅参数无效，关闭连接: {e}")
+                await websocket.send(client.codec.encode({"type": "error", "message": str(e)}))
+                await websocket.close(1008, "invalid subscription")
+                return
             
             # 保持连接直到客户端断开
             async for message in websocket:
@@ -50,15 +405,32 @@ class WebSocketService:
                 
                 # 处理测试消息
                 try:
-                    data = json.loads(message)
-                    if data.get('type') == 'test':
+                    data = client.codec.decode(message) if isinstance(message, bytes) else json.loads(message)
+                    if data.get('type') == 'resync':
+                        # 客户端检测到补丁缺失，重新发送完整快照
+                        logger.info("客户端请求重新同步")
+                        self.send_status_to_client(client)
+                    elif data.get('type') in ('subscribe', 'unsubscribe'):
+                        try:
+                            if data['type'] == 'subscribe':
+                                self.subscribe(client, data.get('node_ids'), data.get('clusters'))
+                            else:
+                                self.unsubscribe(client, data.get('node_ids'))
+                        except ValueError as e:
+                            # 订阅参数无效时订阅保持不变，通知客户端
+                            logger.warning(f"客户端订阅参数无效: {e}")
+                            client.enqueue(client.codec.encode({"type": "error", "request": data['type'],
+                                                                "message": str(e)}))
+                        else:
+                            self.send_status_to_client(client)
+                    elif data.get('type') == 'test':
                         # 回复测试消息
                         response = {
                             "type": "test_response",
                             "data": "Hello, WebSocket Client!",
                             "received": data.get('data', '')
                         }
-                        await websocket.send(json.dumps(response))
+                        client.enqueue(client.codec.encode(response))
                         logger.info("已回复测试消息")
                 except json.JSONDecodeError:
                     logger.warning(f"收到无效的JSON消息: {message}")
@@ -69,118 +441,623 @@ class WebSocketService:
         except Exception as e:
             logger.error(f"WebSocket连接出错: {str(e)}")
         finally:
-            # 从客户端列表中移除
-            self.clients.remove(websocket)
-            logger.info(f"WebSocket客户端断开连接，当前连接数: {len(self.clients)}")
+            await self.remove_client(websocket)
     
-    async def broadcast_status(self, status):
-        """向所有客户端广播设备状态
+    def add_client(self, connection, codec=None):
+        """添加客户端连接，默认订阅所有节点
         
         Args:
-            status: 设备状态
+            connection: WebSocket连接或SSE事件流
+            codec: 消息格式，默认根据协商的子协议选择
+            
+        Returns:
+            ClientConnection: 客户端连接
+        """
+        client = ClientConnection(connection, self, codec=codec)
+        self.clients[connection] = client
+        self.all_nodes_clients.add(client)
+        logger.info(f"新的客户端连接（{client.codec.name}），当前连接数: {len(self.clients)}")
+        return client
+    
+    async def remove_client(self, connection):
+        """移除客户端连接并停止发送任务
+        
+        Args:
+            connection: WebSocket连接或SSE事件流
         """
-        if not self.clients:
+        client = self.discard_client(connection)
+        if client is None:
             return
+        await client.close()
+        logger.info(f"客户端断开连接，当前连接数: {len(self.clients)}")
+    
+    def discard_client(self, connection):
+        """取消注册客户端连接，不再向其发送消息，不等待发送任务停止
+        
+        Args:
+            connection: WebSocket连接或SSE事件流
             
-        message = {
-            "type": "status_update",
-            "data": status
-        }
+        Returns:
+            ClientConnection: 被取消注册的客户端，已经取消注册时返回None
+        """
+        client = self.clients.pop(connection, None)
+        if client is None:
+            return None
+        self.unsubscribe(client)
+        self.all_nodes_clients.discard(client)
+        return client
+    
+    def prepare_client(self, client, query):
+        """恢复订阅，能续传时只补发错过的补丁，否则发送当前状态快照
         
-        # 将消息转换为JSON字符串
-        message_str = json.dumps(message)
+        Args:
+            client: 客户端连接
+            query: 解析后的URL查询参数，可以包含node_ids、clusters、resume和epoch
+            
+        Raises:
+            ValueError: 订阅参数无效，此时不会修改订阅，也不会发送任何消息
+        """
+        node_ids, clusters = query_subscription(query)
+        if node_ids is not None or clusters is not None:
+            self.subscribe(client, node_ids, clusters)
+        if not self._resume(client, query):
+            self.send_status_to_client(client)
+    
+    def _resume(self, client, query):
+        """从重放缓冲区补发客户端断开期间错过的补丁
         
-        # 创建发送任务列表
-        tasks = []
-        clients_to_remove = set()
+        Args:
+            client: 客户端连接
+            query: 解析后的URL查询参数，包含resume和epoch
+            
+        Returns:
+            bool: 是否续传成功，失败时应发送快照
+        """
+        if "resume" not in query:
+            return False
+        try:
+            seq = int(query["resume"][0])
+        except ValueError:
+            return False
+        patches = None
+        if query.get("epoch", [None])[0] == self.epoch:
+            patches = self.replay.since(seq, self.seq)
+        if patches is None:
+            self.resume_fallbacks += 1
+            logger.info(f"客户端无法从seq {seq} 续传，发送完整快照")
+            return False
         
-        for client in self.clients:
-            try:
-                tasks.append(client.send(message_str))
-            except Exception as e:
-                logger.error(f"向WebSocket客户端发送消息失败: {str(e)}")
-                clients_to_remove.add(client)
+        for patch in patches:
+            if patch["node_id"] is None or client.wants(patch["node_id"]):
+                client.enqueue(client.codec.encode(filter_patch(patch, client.clusters)))
+        self.resumes += 1
+        logger.info(f"客户端从seq {seq} 续传，补发 {len(patches)} 个补丁")
+        return True
+    
+    def subscribe(self, client, node_ids=None, clusters=None):
+        """订阅节点和集群
         
-        # 移除失败的客户端
-        for client in clients_to_remove:
-            self.clients.remove(client)
+        Args:
+            client: 客户端连接
+            node_ids: 要订阅的节点ID列表，"*" 表示所有节点，None表示不修改节点订阅
+            clusters: 只接收这些集群的字段，"*" 表示所有集群，None表示不修改集群过滤
+            
+        Raises:
+            ValueError: 订阅参数无效，此时订阅保持不变
+        """
+        node_ids, clusters = parse_subscription(node_ids, clusters)
+        if node_ids == "*":
+            self._set_node_ids(client, None)
+        elif node_ids is not None:
+            current = set() if client.node_ids is None else client.node_ids
+            self._set_node_ids(client, current | node_ids)
         
-        # 等待所有发送任务完成
-        if tasks:
-            await asyncio.gather(*tasks, return_exceptions=True)
+        if clusters == "*":
+            client.clusters = None
+        elif clusters is not None:
+            client.clusters = clusters
+        logger.info(f"客户端订阅更新: 节点 {'*' if client.node_ids is None else sorted(client.node_ids)}"
+                    f"{f'（排除 {sorted(client.excluded_node_ids)}）' if client.excluded_node_ids else ''}，"
+                    f"集群 {'*' if client.clusters is None else sorted(client.clusters)}")
     
-    async def send_status_to_client(self, client):
-        """向单个客户端发送当前设备状态
+    def unsubscribe(self, client, node_ids=None):
+        """取消订阅节点
         
         Args:
-            client: WebSocket客户端
+            client: 客户端连接
+            node_ids: 要取消订阅的节点ID列表，None或 "*" 表示取消订阅所有节点（只接收设备状态）；
+                订阅所有节点的客户端取消订阅部分节点时，之后新增的节点仍然会收到
+                
+        Raises:
+            ValueError: node_ids无效，此时订阅保持不变
         """
-        message = {
-            "type": "status_update",
-            "data": self.device_status
-        }
+        node_ids, _ = parse_subscription(node_ids)
+        if node_ids is None or node_ids == "*":
+            self._set_node_ids(client, set())
+        elif client.node_ids is None:
+            self._set_node_ids(client, None, client.excluded_node_ids | node_ids)
+        else:
+            self._set_node_ids(client, client.node_ids - node_ids)
+    
+    def _set_node_ids(self, client, node_ids, excluded=frozenset()):
+        """更新客户端订阅的节点并维护主题索引和排除索引
         
-        try:
-            await client.send(json.dumps(message))
-        except Exception as e:
-            logger.error(f"向WebSocket客户端发送状态失败: {str(e)}")
+        Args:
+            client: 客户端连接
+            node_ids: 节点ID集合，None表示所有节点
+            excluded: node_ids为None时不订阅的节点ID集合
+        """
+        if client.node_ids is None:
+            self.all_nodes_clients.discard(client)
+            for node_id in client.excluded_node_ids:
+                excluding = self.exclusions.get(node_id)
+                if excluding is not None:
+                    excluding.discard(client)
+                    if not excluding:
+                        del self.exclusions[node_id]
+        else:
+            for node_id in client.node_ids:
+                subscribers = self.topics.get(node_id)
+                if subscribers is not None:
+                    subscribers.discard(client)
+                    if not subscribers:
+                        del self.topics[node_id]
+        
+        client.node_ids = node_ids
+        client.excluded_node_ids = frozenset(excluded) if node_ids is None else frozenset()
+        if node_ids is None:
+            self.all_nodes_clients.add(client)
+            for node_id in client.excluded_node_ids:
+                self.exclusions.setdefault(node_id, set()).add(client)
+        else:
+            for node_id in node_ids:
+                self.topics.setdefault(node_id, set()).add(client)
     
-    async def update_status_periodically(self):
-        """定期更新设备状态（模拟）"""
-        while True:
-            # 模拟状态变化
-            self.device_status["battery_level"] = max(0, min(100, self.device_status["battery_level"] + (-5 + 10 * (asyncio.get_event_loop().time() % 2 > 1))))
+    def subscribers(self, node_id):
+        """获取订阅了指定节点的客户端
+        
+        Args:
+            node_id: 节点ID，None表示设备状态（所有客户端）
+            
+        Returns:
+            客户端连接集合
+        """
+        if node_id is None:
+            return set(self.clients.values())
+        excluding = self.exclusions.get(node_id)
+        clients = self.all_nodes_clients - excluding if excluding else self.all_nodes_clients
+        return clients | self.topics.get(node_id, set())
+    
+    def broadcast(self, message, clients=None, frames=None):
+        """向客户端广播消息
+        
+        每种消息格式只编码一次，同一个帧放入使用该格式的所有客户端的发送队列，不等待发送完成。
+        
+        Args:
+            message: 要广播的消息
+            clients: 接收消息的客户端，默认为所有客户端
+            frames: 已编码的帧，消息格式 -> 帧
+        """
+        clients = self.clients.values() if clients is None else clients
+        
+        # 消息格式 -> 已编码的帧
+        frames = dict(frames or {})
+        for client in clients:
+            frame = frames.get(client.codec)
+            if frame is None:
+                frame = frames[client.codec] = client.codec.encode(message)
+                self.encoded_frames += 1
+            client.enqueue(frame)
+    
+    def _select_subprotocol(self, websocket, subprotocols):
+        """按服务器的优先顺序选择客户端请求的子协议
+        
+        Args:
+            websocket: WebSocket连接
+            subprotocols: 客户端请求的子协议列表
             
-            # 广播状态更新
-            await self.broadcast_status(self.device_status)
+        Returns:
+            str: 选中的子协议，客户端未请求或都不支持时返回None（使用JSON）
+        """
+        for codec in self.codecs:
+            if codec.subprotocol in subprotocols:
+                return codec.subprotocol
+        return None
+    
+    def get_metrics(self):
+        """获取各客户端的发送统计
+        
+        Returns:
+            dict: 慢客户端处理策略和每个客户端的队列深度、延迟、丢弃数量
+        """
+        return {
+            "policy": WS_SLOW_CLIENT_POLICY,
+            "queue_size": WS_CLIENT_QUEUE_SIZE,
+            "codecs": [codec.name for codec in self.codecs],
+            "encoded_frames": self.encoded_frames,
+            "coalesce_window": WS_COALESCE_WINDOW,
+            "coalesced_updates": self.coalesced_updates,
+            "flushes": self.flushes,
+            "pending_topics": len(self.pending),
+            "epoch": self.epoch,
+            "replay": {
+                "buffered": len(self.replay),
+                "bytes": self.replay.bytes,
+                "oldest_seq": self.replay.oldest_seq,
+                "resumes": self.resumes,
+                "fallbacks": self.resume_fallbacks,
+            },
+            "topics": {node_id: len(clients) for node_id, clients in self.topics.items()},
+            "clients": [client.stats() for client in self.clients.values()]
+        }
+    
+    def snapshot_message(self, client=None):
+        """生成快照消息
+        
+        Args:
+            client: 客户端连接，指定时只包含该客户端订阅的节点和集群
             
-            # 等待一段时间
-            await asyncio.sleep(10)
+        Returns:
+            dict: 快照消息
+        """
+        nodes = self.node_status
+        node_seqs = self.node_seqs
+        if client is not None:
+            nodes = {node_id: filter_fields(status, client.clusters)
+                     for node_id, status in nodes.items() if client.wants(node_id)}
+            node_seqs = {node_id: seq for node_id, seq in node_seqs.items() if client.wants(node_id)}
+        return {
+            "type": "snapshot",
+            "seq": self.seq,
+            "epoch": self.epoch,
+            "data": {
+                "device_status": self.device_status,
+                "nodes": nodes
+            },
+            "device_seq": self.device_seq,
+            "node_seqs": node_seqs
+        }
+    
+    def send_status_to_client(self, client):
+        """向单个客户端发送当前状态快照
+        
+        快照在轮到发送时才生成，保证与队列中已有的补丁顺序一致，并且只包含客户端订阅的内容。
+        
+        Args:
+            client: 客户端连接（ClientConnection）
+        """
+        client.enqueue(SNAPSHOT)
+    
+    def attach_matter_client(self, matter_client):
+        """订阅Matter客户端的状态和节点变化，并同步当前状态
+        
+        Args:
+            matter_client: MatterClient或MatterClientPool
+        """
+        if self.matter_client is not None:
+            self.detach_matter_client()
+        self.matter_client = matter_client
+        matter_client.register_status_callback(self.on_device_status)
+        matter_client.register_node_callback(self.on_node_change)
+        
+        # 同步已有的设备状态和节点
+        self.update_device_status(matter_client.get_device_status())
+        self.resync_nodes()
+        logger.info(f"已订阅Matter客户端的状态推送，当前节点数: {len(self.node_status)}")
+    
+    def detach_matter_client(self):
+        """取消订阅Matter客户端"""
+        if self.matter_client is None:
+            return
+        self.matter_client.unregister_status_callback(self.on_device_status)
+        self.matter_client.unregister_node_callback(self.on_node_change)
+        self.matter_client = None
+    
+    async def on_device_status(self, status):
+        """Matter客户端的设备状态回调
+        
+        Args:
+            status: 设备状态
+        """
+        self.update_device_status(status)
     
-    async def start(self, host='0.0.0.0', port=None):
+    async def on_node_change(self, change):
+        """Matter客户端的节点变化回调
+        
+        Args:
+            change: 节点变化，见MatterClient.register_node_callback
+        """
+        if change["event"] == "node_removed":
+            self.remove_node(change["node_id"])
+            return
+        if change["event"] == "resync":
+            logger.warning("节点回调队列溢出，从Matter客户端重新同步所有节点")
+            self.resync_nodes()
+            return
+        changes, removed = normalize_change(change)
+        self.update_node_status(change["node_id"], changes, removed)
+    
+    async def start(self, host='0.0.0.0', port=None, reuse_port=False):
         """启动WebSocket服务器
         
         Args:
             host: 主机地址，默认为0.0.0.0
             port: 端口号，默认从环境变量获取或使用5005
+            reuse_port: 是否设置SO_REUSEPORT，多个工作进程监听同一端口时使用
         """
         # 获取端口
         if port is None:
             port = int(os.environ.get('WS_PORT', 5005))
         
         # 启动WebSocket服务器
-        self.server = await websockets.serve(self.handle_client, host, port)
+        # permessage-deflate由websockets按连接压缩，消息格式的编码在broadcast中只进行一次
+        extensions = [ServerPerMessageDeflateFactory(**WS_DEFLATE_OPTIONS)] if WS_DEFLATE_OPTIONS else None
+        self.server = await websockets.serve(
+            self.handle_client, host, port,
+            subprotocols=[codec.subprotocol for codec in self.codecs],
+            select_subprotocol=self._select_subprotocol,
+            extensions=extensions,
+            compression=None,
+            reuse_port=reuse_port or None
+        )
         
         logger.info(f"WebSocket服务器已启动，监听 {host}:{port}")
-        
-        # 启动定期更新任务
-        self.update_task = asyncio.create_task(self.update_status_periodically())
     
     async def stop(self):
         """停止WebSocket服务器"""
+        if self.flush_handle:
+            self.flush_handle.cancel()
+            self.flush_handle = None
+        
         if self.server:
             self.server.close()
             await self.server.wait_closed()
             logger.info("WebSocket服务器已关闭")
         
-        # 取消定期更新任务
-        if self.update_task:
-            self.update_task.cancel()
-            try:
-                await self.update_task
-            except asyncio.CancelledError:
-                pass
+        self.detach_matter_client()
     
     def update_device_status(self, status):
-        """更新设备状态
+        """更新设备状态，只广播发生变化的字段
+        
+        状态立即更新，补丁在合并窗口结束后发送。
         
         Args:
-            status: 新的设备状态
+            status: 新的设备状态（可以只包含部分字段）
         """
-        self.device_status.update(status)
+        changes = _diff_fields(self.device_status, status)
+        if not changes:
+            return
+        self.device_status.update(changes)
+        self._schedule(None, changes)
+    
+    def update_node_status(self, node_id, status, removed=None):
+        """更新节点状态，只广播发生变化的字段
+        
+        状态立即更新，补丁在合并窗口结束后发送。
+        
+        Args:
+            node_id: 节点ID
+            status: 新的节点状态（可以只包含部分字段）
+            removed: 被删除的字段列表
+        """
+        node_id = str(node_id)
+        is_new = node_id not in self.node_status
+        current = self.node_status.setdefault(node_id, {})
+        changes = _diff_fields(current, status)
+        removed = [field for field in removed or [] if field in current and field not in changes]
+        if not changes and not removed and not is_new:
+            return
+        current.update(changes)
+        for field in removed:
+            del current[field]
+        self._schedule(node_id, changes, removed)
+    
+    def resync_nodes(self):
+        """从Matter客户端读取所有节点并重建节点状态，只广播发生变化的字段，已不存在的节点被移除"""
+        nodes = self.matter_client.get_all_nodes()
+        for node_id, node in nodes.items():
+            status = build_node_status(node)
+            current = self.node_status.get(str(node_id), {})
+            self.update_node_status(node_id, status, [field for field in current if field not in status])
+        for node_id in set(self.node_status) - {str(node_id) for node_id in nodes}:
+            self.remove_node(node_id)
+    
+    def remove_node(self, node_id):
+        """移除节点状态
+        
+        Args:
+            node_id: 节点ID
+        """
+        node_id = str(node_id)
+        status = self.node_status.pop(node_id, None)
+        if status is None:
+            return
+        self._schedule(node_id, {}, removed=status, deleted=True)
+    
+    def _schedule(self, node_id, changes, removed=(), deleted=False):
+        """将更新合并到待发送的补丁中，并安排发送
+        
+        同一设备/节点在窗口内的多次更新只保留每个字段的最新值（后到者覆盖）。
+        
+        Args:
+            node_id: 节点ID，None表示设备状态
+            changes: 发生变化的字段
+            removed: 被删除的字段
+            deleted: 节点是否已被移除
+        """
+        if not WS_COALESCE_WINDOW:
+            self._publish(node_id, changes, list(removed), deleted)
+            return
+        
+        entry = self.pending.get(node_id)
+        if entry is None:
+            entry = self.pending[node_id] = {"changes": {}, "removed": set(), "deleted": False}
+        else:
+            self.coalesced_updates += 1
+        if deleted:
+            entry["changes"] = {}
+            entry["removed"].update(removed)
+            entry["deleted"] = True
+        else:
+            entry["changes"].update(changes)
+            entry["removed"].difference_update(changes)
+            for field in removed:
+                entry["changes"].pop(field, None)
+            entry["removed"].update(removed)
+            # 节点在窗口内被移除后又重新出现，作为普通补丁发送
+            entry["deleted"] = False
+        
+        if self.flush_handle is None:
+            loop = asyncio.get_running_loop()
+            delay = WS_COALESCE_WINDOW
+            if WS_MAX_FLUSH_RATE:
+                delay = max(delay, self.last_flush + 1 / WS_MAX_FLUSH_RATE - loop.time())
+            self.flush_handle = loop.call_later(delay, self._flush)
+    
+    def _flush(self):
+        """按首次变化的顺序发送合并窗口内的所有补丁"""
+        self.flush_handle = None
+        self.last_flush = asyncio.get_running_loop().time()
+        self.flushes += 1
+        pending, self.pending = self.pending, OrderedDict()
+        for node_id, entry in pending.items():
+            self._publish(node_id, entry["changes"], sorted(entry["removed"]), entry["deleted"])
+    
+    def _publish(self, node_id, changes, removed=None, deleted=False):
+        """生成带序列号的补丁并发送给订阅了该节点的客户端
+        
+        按集群过滤的客户端按过滤条件分组，每组只编码一次。
+        
+        Args:
+            node_id: 节点ID，None表示设备状态
+            changes: 发生变化的字段
+            removed: 被删除的字段列表
+            deleted: 节点是否已被移除
+        """
+        self.seq += 1
+        if node_id is None:
+            prev, self.device_seq = self.device_seq, self.seq
+        else:
+            prev = self.node_seqs.get(node_id, 0)
+            self.node_seqs[node_id] = self.seq
+        
+        patch = {
+            "type": "patch",
+            "seq": self.seq,
+            "prev": prev,
+            "node_id": node_id,
+            "changes": changes,
+            "removed": removed or []
+        }
+        if deleted:
+            patch["deleted"] = True
+        
+        # JSON帧同时用于重放缓冲区计算大小、转发给工作进程和发送给JSON客户端
+        frame = DEFAULT_CODEC.encode(patch)
+        self.encoded_frames += 1
+        if self.bus is not None:
+            self.bus.publish(frame)
+        self._distribute(patch, frame)
+    
+    def state_message(self):
+        """生成包含完整状态和序列号的状态消息，用于同步工作进程
+        
+        Returns:
+            dict: 状态消息
+        """
+        return {
+            "type": "state",
+            "epoch": self.epoch,
+            "seq": self.seq,
+            "device_status": self.device_status,
+            "node_status": self.node_status,
+            "device_seq": self.device_seq,
+            "node_seqs": self.node_seqs
+        }
+    
+    def load_state(self, state):
+        """用发布者的状态替换本地状态，并向所有客户端重新发送快照
+        
+        Args:
+            state: state_message()生成的状态消息
+        """
+        self.epoch = state["epoch"]
+        self.seq = state["seq"]
+        self.device_status = state["device_status"]
+        self.node_status = state["node_status"]
+        self.device_seq = state["device_seq"]
+        self.node_seqs = state["node_seqs"]
+        # 与发布者断开期间的补丁无法重放
+        self.replay = ReplayBuffer()
+        for client in self.clients.values():
+            self.send_status_to_client(client)
+    
+    def apply_patch(self, patch, frame=None):
+        """应用发布者生成的补丁并发送给客户端
+        
+        Args:
+            patch: 补丁消息
+            frame: 补丁的JSON帧，可以直接发送给JSON客户端
+        """
+        node_id = patch["node_id"]
+        self.seq = patch["seq"]
+        if node_id is None:
+            self.device_seq = patch["seq"]
+            self.device_status.update(patch["changes"])
+        else:
+            self.node_seqs[node_id] = patch["seq"]
+            if patch.get("deleted"):
+                self.node_status.pop(node_id, None)
+            else:
+                status = self.node_status.setdefault(node_id, {})
+                status.update(patch["changes"])
+                for field in patch["removed"]:
+                    status.pop(field, None)
+        if frame is None:
+            frame = DEFAULT_CODEC.encode(patch)
+            self.encoded_frames += 1
+        self._distribute(patch, frame)
+    
+    def _distribute(self, patch, frame):
+        """将补丁存入重放缓冲区并发送给订阅的客户端
+        
+        Args:
+            patch: 补丁消息
+            frame: 补丁的JSON帧
+        """
+        node_id = patch["node_id"]
+        self.replay.append(patch, len(frame))
+        frames = {DEFAULT_CODEC: frame}
+        
+        # 设备状态补丁发送给所有客户端
+        if node_id is None:
+            self.broadcast(patch, frames=frames)
+            return
+        
+        # 节点补丁只发送给订阅了该节点的客户端，按集群过滤条件分组
+        groups = {}
+        for client in self.subscribers(node_id):
+            groups.setdefault(client.clusters, []).append(client)
+        for clusters, clients in groups.items():
+            if clusters is None:
+                self.broadcast(patch, clients, frames)
+            else:
+                self.broadcast(filter_patch(patch, clusters), clients)
+
+def _diff_fields(current, status):
+    """计算字段级差异
+    
+    Args:
+        current: 当前状态
+        status: 新状态
         
-        # 创建异步任务广播状态
-        asyncio.create_task(self.broadcast_status(self.device_status))
+    Returns:
+        dict: 新增或值发生变化的字段
+    """
+    return {
+        key: value for key, value in status.items()
+        if key not in current or current[key] != value
+    }
 
 # 创建全局WebSocket服务实例
 ws_service = WebSocketService() 
\ No newline at end of file
@@ -0,0 +1,66 @@
+"""
+WebSocket工作进程
+从本地总线接收状态和补丁，向前端连接推送；多个工作进程通过SO_REUSEPORT共享同一端口
+"""
+
+import signal
+import asyncio
+import logging
+import argparse
+import ws_service as ws_service_module
+from ws_service import ws_service
+from ws_bus import BusSubscriber
+
+# 配置日志
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(process)d - %(name)s - %(levelname)s - %(message)s'
+)
+
+logger = logging.getLogger(__name__)
+
+
+async def run_worker(host, port, path):
+    """运行工作进程直到收到SIGINT或SIGTERM
+
+    Args:
+        host: 监听地址
+        port: 监听端口
+        path: 总线的Unix socket路径
+    """
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+
+    subscriber = BusSubscriber(ws_service, path)
+    subscriber.start()
+    # 同步到状态后再接受前端连接，避免发出空快照
+    await subscriber.synced.wait()
+    await ws_service.start(host, port, reuse_port=True)
+
+    await stop.wait()
+    await ws_service.stop()
+    await subscriber.stop()
+    logger.info("WebSocket工作进程已退出")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='WebSocket工作进程')
+    parser.add_argument('--host', default='0.0.0.0', help='监听地址')
+    parser.add_argument('--port', type=int, default=None, help='监听端口，默认从环境变量WS_PORT获取或使用5005')
+    parser.add_argument('--bus', default=None, help='总线的Unix socket路径')
+    parser.add_argument('--client-queue-size', type=int, default=None,
+                        help='每个客户端的发送队列长度，默认使用配置中的WS_CLIENT_QUEUE_SIZE')
+    parser.add_argument('--slow-client-policy', choices=('drop_oldest', 'coalesce', 'disconnect'), default=None,
+                        help='发送队列已满时的处理策略，默认使用配置中的WS_SLOW_CLIENT_POLICY')
+    args = parser.parse_args()
+    if args.client_queue_size is not None:
+        ws_service_module.WS_CLIENT_QUEUE_SIZE = args.client_queue_size
+    if args.slow_client_policy is not None:
+        ws_service_module.WS_SLOW_CLIENT_POLICY = args.slow_client_policy
+    asyncio.run(run_worker(args.host, args.port, args.bus))
+
+
+if __name__ == '__main__':
+    main()
@@ -52,6 +52,11 @@ export default {
     return api.get(`/node/${nodeId}`);
   },
   
+  // 批量获取节点的设备状态，params支持available、operational_state、fields、limit、cursor
+  getNodesStatus(params = {}) {
+    return api.get('/nodes/status', { params });
+  },
+  
   // 控制设备
   controlDevice(action, params = {}) {
     return api.post('/control', {
@@ -1,6 +1,11 @@
 /**
  * WebSocket服务
  * 用于接收设备状态更新
+ *
+ * 连接后先收到完整快照，之后只收到带序列号的字段级补丁。
+ * 补丁的prev与本地记录的序列号不一致时说明丢失了补丁，会请求服务器重新发送快照。
+ * 默认接收所有节点的状态，调用subscribe()后只接收订阅的节点（和集群），重连后自动恢复订阅。
+ * 重连时在URL中带上收到的最大seq，服务器只补发断开期间错过的补丁，无法续传时才发送快照。
  */
 
 class WebSocketService {
@@ -11,6 +16,21 @@ class WebSocketService {
     this.maxReconnectAttempts = 5;
     this.reconnectInterval = 3000; // 3秒
     this.statusListeners = [];
+    this.nodeListeners = [];
+    
+    // 本地状态副本，由快照和补丁维护
+    this.deviceStatus = {};
+    this.nodeStatus = {};
+    this.deviceSeq = 0;
+    this.nodeSeqs = {};
+    this.resyncPending = false;
+    // 收到的最大seq和服务实例标识，用于重连续传
+    this.lastSeq = 0;
+    this.epoch = null;
+    
+    // 当前订阅，null表示所有节点/集群
+    this.subscribedNodeIds = null;
+    this.subscribedClusters = null;
     
     // 优先使用环境变量中的WebSocket URL，如果没有则使用基于当前主机的URL
     this.wsUrl = process.env.VUE_APP_WS_URL || this.getDefaultWsUrl();
@@ -36,8 +56,8 @@ class WebSocketService {
       return;
     }
     
-    // 使用完整的WebSocket URL
-    const fullUrl = this.wsUrl;
+    // 使用完整的WebSocket URL，带上续传和订阅参数
+    const fullUrl = this.buildUrl();
     
     console.log(`正在连接WebSocket: ${fullUrl}`);
     
@@ -48,6 +68,7 @@ class WebSocketService {
         console.log('WebSocket连接成功');
         this.isConnected = true;
         this.reconnectAttempts = 0;
+        this.resyncPending = false;
       };
 
       this.socket.onmessage = (event) => {
@@ -76,6 +97,29 @@ class WebSocketService {
     }
   }
 
+  /**
+   * 生成连接URL，订阅和续传参数通过查询参数传给服务器
+   * @returns {string} WebSocket URL
+   */
+  buildUrl() {
+    const params = new URLSearchParams();
+    if (this.epoch !== null) {
+      params.set('resume', this.lastSeq);
+      params.set('epoch', this.epoch);
+    }
+    if (this.subscribedNodeIds !== null) {
+      params.set('node_ids', this.subscribedNodeIds.join(','));
+    }
+    if (this.subscribedClusters !== null) {
+      params.set('clusters', this.subscribedClusters.join(','));
+    }
+    const query = params.toString();
+    if (!query) {
+      return this.wsUrl;
+    }
+    return `${this.wsUrl}${this.wsUrl.includes('?') ? '&' : '?'}${query}`;
+  }
+
   /**
    * 断开WebSocket连接
    */
@@ -109,12 +153,148 @@ class WebSocketService {
    * @param {Object} data 消息数据
    */
   handleMessage(data) {
-    if (data.type === 'status_update') {
-      // 通知所有状态监听器
-      this.statusListeners.forEach(listener => {
-        listener(data.data);
-      });
+    if (data.type === 'snapshot') {
+      this.applySnapshot(data);
+    } else if (data.type === 'patch') {
+      this.applyPatch(data);
+    } else if (data.type === 'status_update') {
+      this.deviceStatus = data.data;
+      this.notifyStatus();
+    }
+  }
+
+  /**
+   * 应用完整快照
+   * @param {Object} snapshot 快照消息
+   */
+  applySnapshot(snapshot) {
+    this.deviceStatus = snapshot.data.device_status || {};
+    this.nodeStatus = snapshot.data.nodes || {};
+    this.deviceSeq = snapshot.device_seq || 0;
+    this.nodeSeqs = { ...snapshot.node_seqs };
+    this.lastSeq = snapshot.seq;
+    this.epoch = snapshot.epoch || null;
+    this.resyncPending = false;
+
+    this.notifyStatus();
+    Object.keys(this.nodeStatus).forEach(nodeId => this.notifyNode(nodeId));
+  }
+
+  /**
+   * 应用字段级补丁，发现补丁缺失时请求重新同步
+   * @param {Object} patch 补丁消息
+   */
+  applyPatch(patch) {
+    const isDevice = patch.node_id === null;
+    const lastSeq = isDevice ? this.deviceSeq : (this.nodeSeqs[patch.node_id] || 0);
+
+    // 已包含在快照中的补丁
+    if (patch.seq <= lastSeq) {
+      return;
+    }
+    if (patch.prev !== lastSeq) {
+      console.warn(`检测到补丁缺失 (prev=${patch.prev}, 本地=${lastSeq})，请求重新同步`);
+      this.requestResync();
+      return;
+    }
+    this.lastSeq = Math.max(this.lastSeq, patch.seq);
+
+    if (isDevice) {
+      this.deviceStatus = this.mergePatch(this.deviceStatus, patch);
+      this.deviceSeq = patch.seq;
+      this.notifyStatus();
+    } else {
+      if (patch.deleted) {
+        delete this.nodeStatus[patch.node_id];
+      } else {
+        this.nodeStatus[patch.node_id] = this.mergePatch(this.nodeStatus[patch.node_id] || {}, patch);
+      }
+      this.nodeSeqs[patch.node_id] = patch.seq;
+      this.notifyNode(patch.node_id);
+    }
+  }
+
+  /**
+   * 将补丁合并到状态对象
+   * @param {Object} status 当前状态
+   * @param {Object} patch 补丁消息
+   * @returns {Object} 合并后的新状态
+   */
+  mergePatch(status, patch) {
+    const merged = { ...status, ...patch.changes };
+    (patch.removed || []).forEach(field => {
+      delete merged[field];
+    });
+    return merged;
+  }
+
+  /**
+   * 请求服务器重新发送完整快照
+   */
+  requestResync() {
+    if (this.resyncPending || !this.isConnected) {
+      return;
     }
+    this.resyncPending = true;
+    this.socket.send(JSON.stringify({ type: 'resync' }));
+  }
+
+  /**
+   * 订阅指定节点，之后只接收这些节点的状态
+   * @param {Array<string>} nodeIds 节点ID列表
+   * @param {Array<number>} [clusters] 只接收这些集群的字段，不指定则接收所有字段
+   */
+  subscribe(nodeIds, clusters = null) {
+    this.subscribedNodeIds = [...new Set([...(this.subscribedNodeIds || []), ...nodeIds.map(String)])];
+    if (clusters !== null) {
+      this.subscribedClusters = clusters;
+    }
+    this.sendSubscription();
+  }
+
+  /**
+   * 取消订阅节点
+   * @param {Array<string>} nodeIds 节点ID列表
+   */
+  unsubscribe(nodeIds) {
+    const removed = nodeIds.map(String);
+    this.subscribedNodeIds = (this.subscribedNodeIds || []).filter(nodeId => !removed.includes(nodeId));
+    if (this.isConnected) {
+      this.socket.send(JSON.stringify({ type: 'unsubscribe', node_ids: removed }));
+    }
+  }
+
+  /**
+   * 向服务器发送当前订阅
+   */
+  sendSubscription() {
+    if (!this.isConnected) {
+      return;
+    }
+    this.socket.send(JSON.stringify({
+      type: 'subscribe',
+      node_ids: this.subscribedNodeIds === null ? '*' : this.subscribedNodeIds,
+      clusters: this.subscribedClusters === null ? '*' : this.subscribedClusters
+    }));
+  }
+
+  /**
+   * 通知所有设备状态监听器
+   */
+  notifyStatus() {
+    this.statusListeners.forEach(listener => {
+      listener(this.deviceStatus);
+    });
+  }
+
+  /**
+   * 通知所有节点状态监听器
+   * @param {string} nodeId 节点ID
+   */
+  notifyNode(nodeId) {
+    this.nodeListeners.forEach(listener => {
+      listener(nodeId, this.nodeStatus[nodeId]);
+    });
   }
 
   /**
@@ -138,6 +318,27 @@ class WebSocketService {
     }
   }
 
+  /**
+   * 添加节点状态更新监听器
+   * @param {Function} listener 监听器函数，参数为 (nodeId, status)，节点被移除时status为undefined
+   */
+  addNodeListener(listener) {
+    if (typeof listener === 'function' && !this.nodeListeners.includes(listener)) {
+      this.nodeListeners.push(listener);
+    }
+  }
+
+  /**
+   * 移除节点状态更新监听器
+   * @param {Function} listener 监听器函数
+   */
+  removeNodeListener(listener) {
+    const index = this.nodeListeners.indexOf(listener);
+    if (index !== -1) {
+      this.nodeListeners.splice(index, 1);
+    }
+  }
+
   /**
    * 设置WebSocket URL
    * @param {string} url WebSocket URL
@@ -145,6 +346,8 @@ class WebSocketService {
   setWsUrl(url) {
     if (url && url !== this.wsUrl) {
       this.wsUrl = url;
+      // 不同的服务器无法续传
+      this.epoch = null;
       // 如果已连接，断开当前连接并重新连接
       if (this.isConnected) {
         this.disconnect();
@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+"""
+节点存储属性保留规则基准测试
+用接近真实的完整Matter节点数据填充节点存储，比较保存所有属性与只保存NODE_RETAIN_ATTRIBUTES
+匹配的属性时，每个节点占用的内存（tracemalloc实测和memory_stats估算）以及写入耗时
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend'))
+
+from config import NODE_RETAIN_ATTRIBUTES
+from node_store import NodeStore
+
+
+def make_node(node_id):
+    """生成一个扫地机器人节点的完整属性数据，包含根端点上常见的集群"""
+    attributes = {}
+
+    def add_cluster(endpoint, cluster, values):
+        for attribute, value in values.items():
+            attributes[f"{endpoint}/{cluster}/{attribute}"] = value
+        # 每个集群都带有的全局属性
+        attributes[f"{endpoint}/{cluster}/65528"] = []
+        attributes[f"{endpoint}/{cluster}/65529"] = list(range(0, 8))
+        attributes[f"{endpoint}/{cluster}/65531"] = list(values) + [65528, 65529, 65531, 65532, 65533]
+        attributes[f"{endpoint}/{cluster}/65532"] = 0
+        attributes[f"{endpoint}/{cluster}/65533"] = 1
+
+    # Descriptor
+    add_cluster(0, 29, {0: [{"0": 22, "1": 1}], 1: [29, 31, 40, 42, 48, 49, 51, 60, 62, 63], 2: [41], 3: [1]})
+    # Access Control
+    add_cluster(0, 31, {0: [{"1": 5, "2": 2, "3": [112233], "4": None, "254": 1}], 2: 4, 3: 3, 4: 4})
+    # Basic Information
+    add_cluster(0, 40, {
+        0: 17, 1: "Example Robotics", 2: 65521, 3: "RVC-100", 4: 32769, 5: "", 6: "XX", 7: 0,
+        8: "1.0", 9: 1, 10: "1.2.3", 15: f"SN{node_id:08d}", 18: f"{random.getrandbits(64):016X}",
+        19: {"0": 3, "1": 3}, 21: 17039360, 22: 1,
+    })
+    # General Commissioning / Network Commissioning / General Diagnostics
+    add_cluster(0, 48, {0: 0, 1: {"0": 60, "1": 900}, 2: 0, 3: 0, 4: True})
+    add_cluster(0, 49, {0: 1, 1: [{"0": "d2lmaQ==", "1": True}], 2: 10, 3: 20, 4: True, 5: 0, 6: "d2lmaQ==", 7: None})
+    add_cluster(0, 51, {
+        0: [{"0": "wlan0", "1": True, "2": None, "3": None, "4": "AAAAAAAA", "5": ["wKgBAg=="],
+             "6": [f"/oAAAAAAAAA{i}AAAAAAAAAA==" for i in range(3)], "7": 1}],
+        1: random.randint(1, 100), 2: random.randint(0, 10 ** 6), 3: 0, 8: False,
+    })
+    # Administrator Commissioning / Operational Credentials（证书较大）
+    add_cluster(0, 60, {0: 0, 1: None, 2: None})
+    add_cluster(0, 62, {
+        0: [{"1": "FTABAQEkAgE3AyQTAhgmBIAigScmBYAlTTo3BiQVASQRGiQHASQIATAJQQQ" * 6, "254": 1}],
+        1: [{"1": "BMq3y0tXmYkZ0q3CbJv8oC2X4fHn6wQ8YvX2Xk7n8pQ=", "2": 65521, "3": 1, "4": 112233, "5": "", "254": 1}],
+        2: 5, 3: 1,
+        4: ["FTABAQEkAgE3AyQUARgmBIAigScmBYAlTTo3BiQUARgkBwEkCAEwCUEE" * 6],
+        5: 1,
+    })
+    add_cluster(0, 63, {0: [], 1: [], 2: 3, 3: 3})
+    # RVC Run Mode / RVC Clean Mode / RVC Operational State / Power Source
+    add_cluster(1, 84, {
+        0: [{"0": "Idle", "1": 0, "2": [{"0": 0, "1": 16384}]},
+            {"0": "Cleaning", "1": 1, "2": [{"0": 0, "1": 16385}]}],
+        1: random.randint(0, 1),
+    })
+    add_cluster(1, 85, {
+        0: [{"0": "Quick", "1": 0, "2": [{"0": 0, "1": 16385}]},
+            {"0": "Deep", "1": 1, "2": [{"0": 0, "1": 16386}]}],
+        1: random.randint(0, 1),
+    })
+    add_cluster(1, 97, {
+        0: None, 1: None, 2: None,
+        3: [{"0": state} for state in (0, 1, 2, 3, 64, 65, 66)],
+        4: random.choice([0, 1, 2, 3, 64, 65, 66]),
+        5: {"0": 0, "1": None, "2": None},
+    })
+    add_cluster(1, 47, {0: 1, 1: 0, 2: "Battery", 11: 16800, 12: random.randint(0, 200), 14: 0, 15: True, 25: "Li-ion"})
+
+    return {
+        "node_id": node_id,
+        "available": True,
+        "date_commissioned": "2024-01-01T00:00:00",
+        "last_interview": "2024-01-01T00:00:00",
+        "is_bridge": False,
+        "attributes": attributes,
+    }
+
+
+def measure(nodes_json, retain):
+    """把所有节点写入新的节点存储并测量内存
+
+    节点数据在测量期间才从JSON解析，与从Matter Server接收时一样只被节点存储引用；
+    写入耗时在不启用tracemalloc的另一轮中测量。
+
+    Args:
+        nodes_json: 节点数据的JSON字符串列表
+        retain: 属性保留规则，None表示保存所有属性
+
+    Returns:
+        dict: 测试结果
+    """
+    store = NodeStore(retain=retain)
+    nodes_data = [json.loads(data) for data in nodes_json]
+    start = time.perf_counter()
+    for node in nodes_data:
+        store.put(node)
+    elapsed = time.perf_counter() - start
+    del nodes_data
+
+    store = NodeStore(retain=retain)
+    tracemalloc.start()
+    baseline = tracemalloc.get_traced_memory()[0]
+    for data in nodes_json:
+        node = json.loads(data)
+        store.put(node)
+        del node
+    traced = tracemalloc.get_traced_memory()[0] - baseline
+    tracemalloc.stop()
+    stats = store.memory_stats()
+    return {
+        "traced_per_node": traced // len(nodes_json),
+        "estimated_per_node": stats["bytes_per_node"],
+        "attributes": stats["attributes"] // len(nodes_json),
+        "dropped": stats["dropped_attributes"] // len(nodes_json),
+        "put_ms": elapsed * 1000 / len(nodes_json),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='节点存储属性保留规则基准测试')
+    parser.add_argument('--nodes', type=int, default=500, help='节点数量')
+    args = parser.parse_args()
+
+    random.seed(0)
+    nodes_json = [json.dumps(make_node(node_id)) for node_id in range(1, args.nodes + 1)]
+    print(f"节点数 {args.nodes}，每个节点 {len(json.loads(nodes_json[0])['attributes'])} 个属性，"
+          f"JSON {len(nodes_json[0])} 字节")
+    print(f"{'保留规则':<12}{'属性/节点':>10}{'丢弃/节点':>10}{'实测(B/节点)':>16}{'估算(B/节点)':>16}{'写入(ms/节点)':>16}")
+    for name, retain in (("全部", None), ("NODE_RETAIN", NODE_RETAIN_ATTRIBUTES)):
+        result = measure(nodes_json, retain)
+        print(f"{name:<12}{result['attributes']:>10}{result['dropped']:>10}{result['traced_per_node']:>16}"
+              f"{result['estimated_per_node']:>16}{result['put_ms']:>16.3f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+WebSocket消息格式基准测试
+比较各编解码器在典型节点数据上的编码耗时、解码耗时和消息大小（含deflate压缩后），
+以及逐客户端编码与只编码一次的广播开销
+"""
+
+import os
+import sys
+import time
+import zlib
+import random
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend'))
+
+from ws_codecs import CODECS
+from node_store import NodeStore
+from node_status import STATUS_ATTRIBUTES, build_node_status, normalize_change
+
+
+def make_node_attributes(index):
+    """生成一个扫地机器人节点在Matter Server格式下的典型状态属性"""
+    return {
+        STATUS_ATTRIBUTES["supported_run_modes"]: [
+            {"0": "Idle", "1": 0, "2": [{"0": 0, "1": 16384}]},
+            {"0": "Cleaning", "1": 1, "2": [{"0": 0, "1": 16385}]},
+            {"0": "Mapping", "1": 2, "2": [{"0": 0, "1": 16386}]},
+        ],
+        STATUS_ATTRIBUTES["current_run_mode"]: random.randint(0, 2),
+        STATUS_ATTRIBUTES["supported_cleaning_modes"]: [
+            {"0": "Vacuum", "1": 0, "2": [{"0": 0, "1": 16385}]},
+            {"0": "Mop", "1": 1, "2": [{"0": 0, "1": 16386}]},
+            {"0": "Vacuum and Mop", "1": 2, "2": [{"0": 0, "1": 16385}, {"0": 0, "1": 16386}]},
+        ],
+        STATUS_ATTRIBUTES["current_cleaning_mode"]: random.randint(0, 2),
+        STATUS_ATTRIBUTES["operational_state_list"]: [{"0": state} for state in (0, 1, 2, 3, 64, 65, 66)],
+        STATUS_ATTRIBUTES["operational_state"]: random.choice([0, 1, 2, 3, 64, 65, 66]),
+        STATUS_ATTRIBUTES["battery_level"]: random.randint(0, 200),
+    }
+
+
+def make_messages(node_count):
+    """生成快照和补丁两类典型消息，节点状态由node_status从节点属性生成，与服务器推送的字段一致"""
+    store = NodeStore()
+    for index in range(node_count):
+        store.put({"node_id": index, "available": True, "attributes": make_node_attributes(index)})
+    nodes = {node_id: build_node_status(node) for node_id, node in store.items()}
+    snapshot = {
+        "type": "snapshot",
+        "seq": node_count,
+        "data": {
+            "device_status": {"current_cleaning_mode": "未知", "operational_state": 1, "battery_level": 80},
+            "nodes": nodes,
+        },
+        "device_seq": 0,
+        "node_seqs": {node_id: int(node_id) + 1 for node_id in nodes},
+    }
+    changes, removed = normalize_change({"changes": {
+        STATUS_ATTRIBUTES["operational_state"]: 1,
+        STATUS_ATTRIBUTES["battery_level"]: 150,
+    }})
+    patch = {
+        "type": "patch",
+        "seq": node_count + 1,
+        "prev": 1,
+        "node_id": "0",
+        "changes": changes,
+        "removed": removed,
+    }
+    return {"snapshot": snapshot, "patch": patch}
+
+
+def deflated_size(frame):
+    """按服务器的permessage-deflate设置（窗口12位）压缩后的大小"""
+    if isinstance(frame, str):
+        frame = frame.encode("utf-8")
+    compressor = zlib.compressobj(6, zlib.DEFLATED, -12, 5)
+    return len(compressor.compress(frame) + compressor.flush(zlib.Z_SYNC_FLUSH)) - 4
+
+
+def measure(func, repeat):
+    """返回单次调用的平均耗时（微秒）"""
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - start) / repeat * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description='WebSocket消息格式基准测试')
+    parser.add_argument('--nodes', type=int, default=20, help='快照中的节点数量')
+    parser.add_argument('--clients', type=int, default=50, help='广播的客户端数量')
+    parser.add_argument('--repeat', type=int, default=2000, help='每项测试的重复次数')
+    args = parser.parse_args()
+
+    random.seed(0)
+    messages = make_messages(args.nodes)
+    print(f"可用编解码器: {', '.join(CODECS)}（节点数 {args.nodes}，客户端数 {args.clients}）")
+    print()
+    print(f"{'消息':<10}{'格式':<10}{'编码(us)':>10}{'解码(us)':>10}{'大小(B)':>10}{'压缩后(B)':>12}")
+    for kind, message in messages.items():
+        repeat = max(1, args.repeat // (10 if kind == "snapshot" else 1))
+        for name, codec in CODECS.items():
+            frame = codec.encode(message)
+            size = len(frame.encode("utf-8")) if isinstance(frame, str) else len(frame)
+            encode_us = measure(lambda: codec.encode(message), repeat)
+            decode_us = measure(lambda: codec.decode(frame), repeat)
+            print(f"{kind:<10}{name:<10}{encode_us:>10.1f}{decode_us:>10.1f}{size:>10}{deflated_size(frame):>12}")
+
+    print()
+    print(f"广播一个补丁给 {args.clients} 个客户端的编码开销:")
+    patch = messages["patch"]
+    for name, codec in CODECS.items():
+        per_client = measure(lambda: [codec.encode(patch) for _ in range(args.clients)], args.repeat // 10)
+        once = measure(lambda: [codec.encode(patch)] * args.clients, args.repeat // 10)
+        print(f"  {name:<10}逐客户端编码 {per_client:>9.1f} us    只编码一次 {once:>7.1f} us")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+"""
+WebSocket多进程推送基准测试
+在本进程中运行总线发布者，启动不同数量的WebSocket工作进程，
+由多个客户端进程建立连接并接收补丁，比较推送吞吐量随工作进程数量的变化
+
+默认把工作进程的客户端发送队列设为能容纳所有补丁，不丢弃也不合并，测得的是推送本身的扩展性；
+用 --client-queue-size 指定较小的队列时按WS_SLOW_CLIENT_POLICY处理慢客户端，
+结果中分别统计收到的补丁、快照和缺失的补丁，只有缺失为0的轮次之间吞吐量才可以直接比较
+"""
+
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import tempfile
+import multiprocessing
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend'))
+
+import websockets
+import ws_service
+from ws_service import WebSocketService
+from ws_bus import BusPublisher, start_workers, stop_workers
+
+
+def run_clients(port, connections, final_seq, ready, results, idle_timeout=2):
+    """客户端进程：建立连接，接收消息直到收到最后一个补丁
+
+    最后一个补丁被工作进程合并为快照时不会再到达，此时收到不早于它的快照后，
+    空闲idle_timeout秒没有新消息即结束。
+
+    Args:
+        port: WebSocket端口
+        connections: 本进程的连接数
+        final_seq: 最后一个补丁的seq
+        ready: 所有连接建立后设置的事件
+        results: 结果队列，放入 (收到的补丁数, 快照数, 缺失的补丁数, 首条补丁时间, 最后一条消息时间)
+        idle_timeout: 最后一个补丁缺失时等待的时间（秒）
+    """
+    async def receive(websocket, stats):
+        patches = 0
+        covered = False
+        while True:
+            try:
+                data = await asyncio.wait_for(websocket.recv(), idle_timeout if covered else None)
+            except asyncio.TimeoutError:
+                break
+            message = json.loads(data)
+            stats["last"] = max(stats["last"] or 0, time.time())
+            if message["type"] == "snapshot":
+                stats["snapshots"] += 1
+                covered = message["seq"] >= final_seq
+                continue
+            patches += 1
+            if stats["first"] is None:
+                stats["first"] = time.time()
+            if message["seq"] == final_seq:
+                break
+        stats["patches"] += patches
+        stats["missing"] += final_seq - patches
+
+    async def main():
+        stats = {"patches": 0, "snapshots": 0, "missing": 0, "first": None, "last": None}
+        sockets = []
+        for _ in range(connections):
+            websocket = await websockets.connect(f"ws://127.0.0.1:{port}", max_queue=None)
+            # 丢弃初始快照
+            await websocket.recv()
+            sockets.append(websocket)
+        ready.set()
+        await asyncio.gather(*(receive(websocket, stats) for websocket in sockets))
+        for websocket in sockets:
+            await websocket.close()
+        results.put((stats["patches"], stats["snapshots"], stats["missing"], stats["first"], stats["last"]))
+
+    asyncio.run(main())
+
+
+async def wait_for_port(port, timeout=10):
+    """等待工作进程开始监听"""
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            websocket = await websockets.connect(f"ws://127.0.0.1:{port}")
+            await websocket.close()
+            return
+        except OSError:
+            await asyncio.sleep(0.1)
+    raise RuntimeError("WebSocket工作进程未能启动")
+
+
+async def run_round(workers, args):
+    """运行一轮测试
+
+    Args:
+        workers: 工作进程数量
+        args: 命令行参数
+
+    Returns:
+        dict: 测试结果
+    """
+    path = os.path.join(tempfile.mkdtemp(), "bus.sock")
+    service = WebSocketService()
+    bus = BusPublisher(service, path)
+    await bus.start()
+    processes = await start_workers(workers, "127.0.0.1", args.port, path,
+                                    ["--client-queue-size", str(args.client_queue_size)])
+    try:
+        await wait_for_port(args.port)
+        # 等待所有工作进程都连接到总线
+        while len(bus.subscribers) < workers:
+            await asyncio.sleep(0.05)
+
+        final_seq = args.messages
+        ctx = multiprocessing.get_context("spawn")
+        results = ctx.Queue()
+        per_process = args.connections // args.client_processes
+        clients = []
+        for _ in range(args.client_processes):
+            ready = ctx.Event()
+            process = ctx.Process(target=run_clients, args=(args.port, per_process, final_seq, ready, results))
+            process.start()
+            clients.append((process, ready))
+        for _, ready in clients:
+            while not ready.is_set():
+                await asyncio.sleep(0.05)
+
+        # 通过节点状态更新接口以最快速度发布，每次更新都改变电量，生成一个补丁；
+        # 每批之后让出事件循环以便写入总线
+        payload = {"operational_state": 1, "battery_level": 80, "current_run_mode": 1}
+        for seq in range(1, final_seq + 1):
+            service.update_node_status(str(seq % 20), dict(payload, battery_level=seq % 100))
+            if seq % 50 == 0:
+                await asyncio.sleep(0)
+        assert service.seq == final_seq, f"发布了 {service.seq} 个补丁，预期 {final_seq} 个"
+
+        outcomes = []
+        for _ in clients:
+            outcomes.append(await asyncio.get_running_loop().run_in_executor(None, results.get))
+        for process, _ in clients:
+            process.join()
+    finally:
+        await stop_workers(processes)
+        await bus.stop()
+
+    patches = sum(outcome[0] for outcome in outcomes)
+    snapshots = sum(outcome[1] for outcome in outcomes)
+    missing = sum(outcome[2] for outcome in outcomes)
+    starts = [outcome[3] for outcome in outcomes if outcome[3]]
+    elapsed = max(outcome[4] for outcome in outcomes) - min(starts)
+    return {
+        "workers": workers,
+        "patches": patches,
+        "snapshots": snapshots,
+        "missing": missing,
+        "elapsed": elapsed,
+        "throughput": patches / elapsed if elapsed > 0 else 0,
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser(description='WebSocket多进程推送基准测试')
+    parser.add_argument('--workers', default='1,2,4', help='要测试的工作进程数量，逗号分隔')
+    parser.add_argument('--connections', type=int, default=400, help='客户端连接总数')
+    parser.add_argument('--client-processes', type=int, default=4, help='客户端进程数量')
+    parser.add_argument('--messages', type=int, default=2000, help='发布的补丁数量')
+    parser.add_argument('--port', type=int, default=5105, help='WebSocket端口')
+    parser.add_argument('--client-queue-size', type=int, default=None,
+                        help='工作进程中每个客户端的发送队列长度，默认能容纳所有补丁和初始快照')
+    args = parser.parse_args()
+    if args.client_queue_size is None:
+        args.client_queue_size = args.messages + 1
+
+    # 关闭合并窗口，每次节点状态更新立即生成一个补丁，补丁数量与发布次数相同
+    ws_service.WS_COALESCE_WINDOW = 0
+
+    print(f"连接数 {args.connections}，补丁数 {args.messages}，CPU核数 {os.cpu_count()}，"
+          f"慢客户端策略 {ws_service.WS_SLOW_CLIENT_POLICY}（队列长度 {args.client_queue_size}）")
+    print(f"{'工作进程':<10}{'收到补丁':>12}{'缺失补丁':>10}{'快照':>8}{'耗时(s)':>10}{'吞吐量(补丁/s)':>16}")
+    for workers in (int(count) for count in args.workers.split(',')):
+        result = await run_round(workers, args)
+        print(f"{result['workers']:<10}{result['patches']:>12}{result['missing']:>10}{result['snapshots']:>8}"
+              f"{result['elapsed']:>10.2f}{result['throughput']:>16.0f}")
+        if result['missing']:
+            print(f"  有 {result['missing']} 个补丁被丢弃或合并为快照，吞吐量不能与无缺失的轮次直接比较")
+
+
+if __name__ == '__main__':
+    asyncio.run(main())